@@ -0,0 +1,175 @@
+"""
+    Helpers shared by the benchmark scripts and the tests: synthetic weather.gov
+    payloads and a local stub HTTP server that serves them.
+"""
+import json
+import random
+import threading
+
+from collections import deque
+from time import time, sleep
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# weather.gov property name -> typical value range of a metric
+OBSERVATION_PROPERTIES = {
+    "temperature": (-30.0, 45.0),
+    "dewpoint": (-35.0, 30.0),
+    "windDirection": (0.0, 360.0),
+    "windSpeed": (0.0, 80.0),
+    "windGust": (0.0, 120.0),
+    "barometricPressure": (95000.0, 104000.0),
+    "seaLevelPressure": (95000.0, 104000.0),
+    "visibility": (0.0, 16090.0),
+    "precipitationLast3Hours": (0.0, 30.0),
+    "relativeHumidity": (0.0, 100.0),
+    "windChill": (-40.0, 10.0),
+    "heatIndex": (25.0, 50.0),
+}
+
+
+def make_observations_payload(station_id: str,
+                              n_features: int = 168,
+                              ts_to: float = None,
+                              step_seconds: int = 3600,
+                              missing_ratio: float = 0.2,
+                              seed: int = None) -> dict:
+    """
+        Build a response of /stations/{station_id}/observations endpoint with
+        `n_features` observations, newest first, the same way weather.gov returns them.
+    """
+    rng = random.Random(seed if seed is not None else station_id)
+
+    if ts_to is None:
+        ts_to = time()
+    ts_to = int(ts_to) - int(ts_to) % step_seconds
+
+    features = []
+    for i in range(n_features):
+        ts = datetime.fromtimestamp(ts_to - i * step_seconds, tz=timezone.utc)
+        properties = {
+            "@id": f"https://api.weather.gov/stations/{station_id}/observations/{ts.isoformat()}",
+            "station": f"https://api.weather.gov/stations/{station_id}",
+            "timestamp": ts.isoformat(),
+        }
+
+        for name, (v_min, v_max) in OBSERVATION_PROPERTIES.items():
+            value = None if rng.random() < missing_ratio else round(rng.uniform(v_min, v_max), 2)
+            properties[name] = {"unitCode": "wmoUnit:degC", "value": value, "qualityControl": "V"}
+
+        features.append({
+            "id": properties["@id"],
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [-87.05, 44.055]},
+            "properties": properties
+        })
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+class StubWeatherGovServer:
+    """
+        A local HTTP server that answers /stations/{id}/observations requests with
+        synthetic payloads. Payloads are rendered once per station and cached, so
+        the server itself is not the bottleneck of a benchmark. Use `latency` to
+        simulate a network round trip to api.weather.gov.
+
+        The tests use it too:
+        - `payload` is served for every station instead of the synthetic one
+        - if `etag` is set, responses carry it, and a request with a matching
+          If-None-Match header gets 304
+        - status codes (with optional headers) put into `errors` are answered first,
+          one per request, to exercise the retries of the client
+        - every request is recorded in `requests` as (path with query, headers)
+    """
+
+    def __init__(self, n_features: int = 168, latency: float = 0.0, payload: dict = None, etag: str = None):
+        self.n_features = n_features
+        self.latency = latency
+        self.payload = payload
+        self.etag = etag
+        self.errors = deque()
+        self.requests = []
+        self._payloads = dict()
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def send_empty_response(self, status_code: int, headers: dict = None):
+                self.send_response(status_code)
+                for name, value in (headers or dict()).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests.append((self.path, dict(self.headers)))
+                    error = stub.errors.popleft() if stub.errors else None
+
+                parts = self.path.split("?")[0].strip("/").split("/")
+
+                if len(parts) < 3 or parts[0] != "stations":
+                    self.send_empty_response(404)
+                    return
+
+                if stub.latency > 0:
+                    sleep(stub.latency)
+
+                if error is not None:
+                    status_code, headers = error
+                    self.send_empty_response(status_code, headers)
+                    return
+
+                if stub.etag is not None and self.headers.get("If-None-Match") == stub.etag:
+                    self.send_empty_response(304)
+                    return
+
+                body = stub.get_payload(parts[1])
+                self.send_response(200)
+                self.send_header("Content-Type", "application/geo+json")
+                self.send_header("Content-Length", str(len(body)))
+                if stub.etag is not None:
+                    self.send_header("ETag", stub.etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def fail_next(self, status_code: int, n: int = 1, headers: dict = None):
+        """
+            Answer the next `n` requests with `status_code` and an empty body
+        """
+        with self._lock:
+            self.errors.extend([(status_code, headers)] * n)
+
+    def get_payload(self, station_id: str) -> bytes:
+        with self._lock:
+            if station_id not in self._payloads:
+                payload = self.payload
+                if payload is None:
+                    payload = make_observations_payload(station_id, n_features=self.n_features)
+                self._payloads[station_id] = json.dumps(payload).encode()
+            return self._payloads[station_id]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,62 @@
+"""
+    Measure stations/second of the historical loader fetch engine against a local
+    stub of api.weather.gov. Compares the old one-by-one loop with the concurrent
+    fetcher at several concurrency limits.
+
+    python scripts/python/benchmarks/bench_async_fetcher.py --stations 200 --latency 0.1
+"""
+import os
+import asyncio
+import argparse
+
+from time import perf_counter
+
+from _fixtures import StubWeatherGovServer
+from weathergov.utils.stations_utils import get_station_data, fetch_station_data_concurrently
+
+
+def run_sequential(station_ids: list) -> float:
+    t_ = perf_counter()
+    for station_id in station_ids:
+        get_station_data(station_id=station_id)
+    return perf_counter() - t_
+
+
+async def _run_concurrent(station_ids: list, concurrency: int) -> int:
+    n = 0
+    async for _station_id, _data in fetch_station_data_concurrently(station_ids, concurrency=concurrency):
+        n += 1
+    return n
+
+
+def run_concurrent(station_ids: list, concurrency: int) -> float:
+    t_ = perf_counter()
+    n = asyncio.run(_run_concurrent(station_ids, concurrency))
+    assert n == len(station_ids), f"Got {n} results for {len(station_ids)} stations"
+    return perf_counter() - t_
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", default=200, type=int)
+    parser.add_argument("--features", default=168, type=int)
+    parser.add_argument("--latency", default=0.1, type=float,
+                        help="Simulated server response time in seconds")
+    parser.add_argument("--concurrency", default=[4, 8, 16, 32], type=int, nargs="+")
+    args = parser.parse_args()
+
+    station_ids = [f"ST{i:05d}" for i in range(args.stations)]
+
+    with StubWeatherGovServer(n_features=args.features, latency=args.latency) as server:
+        os.environ["WEATHER_GOV_API_URL"] = server.url
+
+        # Render all the payloads before measuring
+        for station_id in station_ids:
+            server.get_payload(station_id)
+
+        dt = run_sequential(station_ids)
+        print(f"sequential       : {len(station_ids) / dt:8.1f} stations/s ({dt:.2f} s)")
+
+        for concurrency in args.concurrency:
+            dt = run_concurrent(station_ids, concurrency)
+            print(f"concurrency={concurrency:<4d} : {len(station_ids) / dt:8.1f} stations/s ({dt:.2f} s)")
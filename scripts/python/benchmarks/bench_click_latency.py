@@ -0,0 +1,70 @@
+"""
+    Latency of reading the data of a clicked station (five metrics, one week) from
+    Redis: one TS.RANGE per metric, like the click callback used to do, against the
+    pipelined get_timeseries_data_multi(). One of the metrics does not exist, as it
+    happens for many stations. Needs a running Redis Stack, connection settings are
+    taken from REDIS_HOST, REDIS_PORT and REDIS_PASS.
+
+    python scripts/python/benchmarks/bench_click_latency.py --clicks 500
+"""
+import argparse
+import numpy as np
+
+from time import perf_counter
+from dotenv import load_dotenv
+
+from _fixtures import make_observations_payload
+from weathergov.constants import Metrics
+from weathergov.utils.redis_utils import RedisClient, RedisKeys
+from weathergov.utils.stations_utils import parse_observations
+
+
+STATION_ID = "BENCHCLICK"
+DATA_KEYWORDS = ["temperature", "barometric_pressure", "wind_speed", "wind_direction", "relative_humidity"]
+
+
+def sequential(rc: RedisClient, ts_from: int, ts_to: int) -> dict:
+    return {data_keyword: rc.get_timeseries_data(STATION_ID, data_keyword, ts_from, ts_to)
+            for data_keyword in DATA_KEYWORDS}
+
+
+def pipelined(rc: RedisClient, ts_from: int, ts_to: int) -> dict:
+    return rc.get_timeseries_data_multi(STATION_ID, DATA_KEYWORDS, ts_from, ts_to)
+
+
+def measure(fn, rc: RedisClient, ts_from: int, ts_to: int, n: int) -> np.ndarray:
+    latencies = np.empty(n)
+    for i in range(n):
+        t_ = perf_counter()
+        fn(rc, ts_from, ts_to)
+        latencies[i] = perf_counter() - t_
+    return latencies * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clicks", default=500, type=int)
+    args = parser.parse_args()
+
+    load_dotenv()
+    rc = RedisClient()
+
+    batch = parse_observations(make_observations_payload(STATION_ID, n_features=24 * 7 * 4))
+    # Leave one of the metrics without data
+    batch.values[Metrics.RelativeHumidity][:] = np.nan
+    keys = [RedisKeys.get_rt_data_key(STATION_ID, metric) for metric in Metrics]
+
+    try:
+        rc.rc.delete(*keys)
+        rc.add_timeseries_data_bulk({STATION_ID: batch})
+        rc.rc.delete(RedisKeys.get_rt_data_key(STATION_ID, Metrics.RelativeHumidity))
+
+        ts_to = int(batch.timestamps[-1])
+        ts_from = ts_to - 7 * 24 * 3600 * 1000
+
+        for name, fn in [("one TS.RANGE per metric", sequential), ("pipelined", pipelined)]:
+            latencies = measure(fn, rc, ts_from, ts_to, args.clicks)
+            print(f"{name:<24s}: p50={np.percentile(latencies, 50):.2f} ms "
+                  f"p95={np.percentile(latencies, 95):.2f} ms")
+    finally:
+        rc.rc.delete(RedisKeys.get_station_info_hash_key(STATION_ID), *keys)
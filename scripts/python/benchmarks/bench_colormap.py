@@ -0,0 +1,67 @@
+"""
+    Coloring of the stations map: the old temperature-only coloring (normalization
+    with DataFrame.apply and sample_colorscale for every station) against the
+    lookup table coloring of get_colorscale(), on synthetic stations.
+
+    python scripts/python/benchmarks/bench_colormap.py --stations 46000
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+from time import perf_counter
+from plotly.express.colors import sample_colorscale
+
+from weathergov.constants import Metrics
+from weathergov.app.viz import get_colorscale
+
+
+def legacy_colorscale(df, colorscale, column):
+    ind_nan = df[column].isna()
+    df.loc[ind_nan, column] = df[column].mean()
+
+    colorbar_tick_step = 5
+    x_min = (int(df[column].min()) // colorbar_tick_step) * colorbar_tick_step
+    x_max = (1 + int(df[column].max()) // colorbar_tick_step) * colorbar_tick_step
+
+    values = df[column].apply(lambda x: (x - x_min) / (x_max - x_min))
+    colors = np.asarray(sample_colorscale(colorscale, values))
+    colors[ind_nan] = 'rgb(100, 100, 100)'
+    return colors
+
+
+def make_stations(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({
+        f"{Metrics.Temperature}_val": rng.normal(15, 10, n),
+        f"{Metrics.BarometricPressure}_val": rng.normal(101325, 1000, n),
+        f"{Metrics.WindSpeed}_val": rng.gamma(2, 6, n),
+        f"{Metrics.RelativeHumidity}_val": rng.uniform(0, 100, n),
+    })
+    # About 10% of the stations have no recent observations
+    df[rng.random(n) < 0.1] = np.nan
+    return df
+
+
+def measure(fn, repeat: int) -> float:
+    t_ = perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (perf_counter() - t_) / repeat * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", default=46000, type=int)
+    parser.add_argument("--repeat", default=5, type=int)
+    args = parser.parse_args()
+
+    df = make_stations(args.stations)
+    column = f"{Metrics.Temperature}_val"
+
+    dt = measure(lambda: legacy_colorscale(df.copy(), "jet", column), args.repeat)
+    print(f"{'legacy (temperature)':<28s}: {dt:8.1f} ms")
+
+    for metric in [Metrics.Temperature, Metrics.BarometricPressure, Metrics.WindSpeed, Metrics.RelativeHumidity]:
+        dt = measure(lambda: get_colorscale(df, "jet", metric), args.repeat)
+        print(f"{'lookup table (' + metric + ')':<28s}: {dt:8.1f} ms")
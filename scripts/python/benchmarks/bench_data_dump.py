@@ -0,0 +1,94 @@
+"""
+    Monthly data dump of one metric: reading every station key with its own TS.RANGE
+    and saving the checkpoint with its own HSET, like the dumper used to do, against
+    TS.MRANGE over label-filtered slices of stations and one HSET for all the
+    checkpoints. Both write the samples to a Parquet dataset partition. Fills a running
+    Redis Stack with synthetic hourly samples, connection settings are taken from
+    REDIS_HOST, REDIS_PORT and REDIS_PASS.
+
+    python scripts/python/benchmarks/bench_data_dump.py --stations 2000 --days 31
+"""
+import argparse
+import tempfile
+import numpy as np
+
+from time import perf_counter
+from dotenv import load_dotenv
+
+from weathergov.constants import Metrics
+from weathergov.utils.redis_utils import RedisClient, RedisKeys
+from weathergov.utils.parquet_utils import DatasetPartitionWriter, get_partition_dir
+
+
+STATION_PREFIX = "BENCHDUMP"
+# Hash with "{station_id}:{metric}" -> timestamp of the last dump, like the dumper used to keep
+CHECKPOINTS_KEY = "benchmark:data_dump:checkpoints"
+METRIC = Metrics.Temperature
+TS_FROM = 1719792000000  # 2024-07-01
+HOUR_MS = 3600 * 1000
+
+
+def fill(rc: RedisClient, station_ids: list, n_samples: int):
+    timestamps = TS_FROM + np.arange(n_samples, dtype=np.int64) * HOUR_MS
+
+    pipe = rc.rc.pipeline(transaction=False)
+    for station_id in station_ids:
+        key = RedisKeys.get_rt_data_key(station_id, METRIC)
+        pipe.execute_command(*rc._get_timeseries_create_command(key, rc._get_timeseries_labels(station_id, METRIC)))
+
+        values = np.round(np.random.uniform(-30, 45, n_samples), 1)
+        command = ["TS.MADD"]
+        for ts, value in zip(timestamps.tolist(), values.tolist()):
+            command.extend([key, ts, value])
+        pipe.execute_command(*command)
+
+        if len(pipe) >= 200:
+            pipe.execute()
+    pipe.execute()
+
+
+def per_key(rc: RedisClient, station_ids: list, ts_to: int, dump_dir: str):
+    with DatasetPartitionWriter(get_partition_dir(dump_dir, METRIC, "per-key")) as writer:
+        for station_id in station_ids:
+            x, y = rc.get_timeseries_data(station_id, METRIC, TS_FROM, ts_to, resolution="raw")
+            writer.write(station_id, x, y)
+            rc.rc.hset(CHECKPOINTS_KEY, f"{station_id}:{METRIC}", str(ts_to))
+
+
+def bulk(rc: RedisClient, station_ids: list, ts_to: int, dump_dir: str):
+    with DatasetPartitionWriter(get_partition_dir(dump_dir, METRIC, "bulk")) as writer:
+        for station_id, x, y in rc.get_timeseries_data_bulk(METRIC, station_ids, TS_FROM, ts_to):
+            writer.write(station_id, x, y)
+    rc.rc.hset(CHECKPOINTS_KEY, mapping={f"{station_id}:{METRIC}": str(ts_to) for station_id in station_ids})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", default=2000, type=int)
+    parser.add_argument("--days", default=31, type=int)
+    args = parser.parse_args()
+
+    load_dotenv()
+    rc = RedisClient()
+
+    station_ids = [f"{STATION_PREFIX}{i:05d}" for i in range(args.stations)]
+    keys = [RedisKeys.get_rt_data_key(station_id, METRIC) for station_id in station_ids]
+
+    n_samples = args.days * 24
+    ts_to = TS_FROM + n_samples * HOUR_MS
+
+    try:
+        rc.rc.delete(*keys)
+        fill(rc, station_ids, n_samples)
+        print(f"{args.stations} stations x {n_samples} samples of {METRIC}")
+
+        with tempfile.TemporaryDirectory() as dump_dir:
+            for name, fn in [("TS.RANGE + HSET per key", per_key), ("TS.MRANGE + one HSET", bulk)]:
+                t_ = perf_counter()
+                fn(rc, station_ids, ts_to, dump_dir)
+                duration = perf_counter() - t_
+                print(f"{name:<24s}: {duration:.2f} s, {args.stations / duration:.0f} stations/s, "
+                      f"{args.stations * n_samples / duration / 1e6:.2f} M samples/s")
+    finally:
+        rc.rc.delete(*keys)
+        rc.rc.delete(CHECKPOINTS_KEY)
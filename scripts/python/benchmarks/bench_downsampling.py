@@ -0,0 +1,52 @@
+"""
+    Payload of a station chart and the server time to build it, with all the samples
+    against min-max and LTTB downsampling, for a synthetic temperature line with a
+    sample every 5 minutes. Also checks that the highest and the lowest values of
+    the line are still on the chart.
+
+    python scripts/python/benchmarks/bench_downsampling.py --days 90
+"""
+import argparse
+import numpy as np
+
+from time import perf_counter
+from plotly.io.json import to_json_plotly
+
+from weathergov.app import viz
+from weathergov.app.viz import get_ts_figure, downsample
+
+
+def make_line(days: int) -> (np.ndarray, np.ndarray):
+    rng = np.random.default_rng(11)
+    x = 1720000000000 + np.arange(days * 24 * 12, dtype=np.int64) * 5 * 60 * 1000
+    hours = (x - x[0]) / 3600 / 1000
+
+    # Daily cycle, weather changes and a few sensor spikes
+    y = 20 + 8 * np.sin(2 * np.pi * hours / 24) + np.cumsum(rng.normal(0, 0.05, len(x)))
+    y[rng.integers(0, len(x), 5)] += rng.normal(0, 15, 5)
+    return x, y
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", default=90, type=int)
+    args = parser.parse_args()
+
+    x, y = make_line(args.days)
+    print(f"{len(x)} samples")
+
+    for method in [None, "minmax", "lttb"]:
+        if method is None:
+            # Keep all the points
+            viz.downsample = lambda x_, y_: (x_, y_)
+        else:
+            viz.downsample = lambda x_, y_, m=method: downsample(x_, y_, method=m)
+
+        t_ = perf_counter()
+        fig = get_ts_figure(x, y)
+        payload = to_json_plotly(fig.to_dict())
+        dt = perf_counter() - t_
+
+        y_out = np.asarray(fig.data[0].y)
+        print(f"{method or 'all samples':<12s}: {len(y_out):6d} points, {len(payload) / 1e6:6.3f} MB, "
+              f"{dt * 1000:6.1f} ms, max kept: {y_out.max() == y.max()}, min kept: {y_out.min() == y.min()}")
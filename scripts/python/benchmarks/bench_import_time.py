@@ -0,0 +1,50 @@
+"""
+    Import time of the web app module, as reported by "python -X importtime", with the
+    packages that take the most of it. The web app must be importable without Redis.
+
+    python scripts/python/benchmarks/bench_import_time.py --module weathergov.app.webapp --top 15
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+
+def get_import_times(module: str) -> list:
+    """
+    :return: (module, self time in us, cumulative time in us) of every imported module
+    """
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, env=os.environ, check=True)
+
+    times = []
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="weathergov.app.webapp")
+    parser.add_argument("--top", default=15, type=int)
+    args = parser.parse_args()
+
+    times = get_import_times(args.module)
+
+    total = next(cumulative for name, _, cumulative in times if name.strip() == args.module)
+    print(f"{args.module}: {total / 1000:.0f} ms")
+
+    # Cumulative time of the top package of every third-party dependency. They
+    # overlap, as packages import each other, and only the first import is counted.
+    packages = dict()
+    for name, _, cumulative in times:
+        package = name.strip().split(".")[0]
+        if package != args.module.split(".")[0]:
+            packages[package] = max(packages.get(package, 0), cumulative)
+
+    for package, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"    {package:<24s}: {cumulative / 1000:7.1f} ms")
@@ -0,0 +1,45 @@
+"""
+    Time of loading the map state: reading every station info hash (the old way)
+    against reading the published stations snapshot. Runs against the stations that
+    are already in Redis and publishes the snapshot if there is none. Connection
+    settings are taken from REDIS_HOST, REDIS_PORT and REDIS_PASS.
+
+    python scripts/python/benchmarks/bench_map_load.py --repeat 10
+"""
+import argparse
+import numpy as np
+
+from time import perf_counter
+from dotenv import load_dotenv
+
+from weathergov.utils.redis_utils import RedisClient
+
+
+def measure(fn, n: int) -> np.ndarray:
+    durations = np.empty(n)
+    for i in range(n):
+        t_ = perf_counter()
+        fn()
+        durations[i] = perf_counter() - t_
+    return durations * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", default=10, type=int)
+    args = parser.parse_args()
+
+    load_dotenv()
+    rc = RedisClient()
+
+    version, df = rc.get_stations_snapshot()
+    if df is None:
+        version = rc.publish_stations_snapshot(full=True)
+
+    print(f"{len(rc.get_all_station_ids())} stations, snapshot version {version}")
+
+    for name, fn in [("station hashes", rc._scan_observation_stations_info),
+                     ("snapshot", rc.get_observation_stations_info)]:
+        durations = measure(fn, args.repeat)
+        print(f"{name:<16s}: p50={np.percentile(durations, 50):.1f} ms "
+              f"p95={np.percentile(durations, 95):.1f} ms")
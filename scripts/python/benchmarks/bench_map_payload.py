@@ -0,0 +1,66 @@
+"""
+    Size and serialization time of the map callback response when the coloring
+    metric is switched: the whole figure against a Patch with the marker colors,
+    colorbar and hover text only, on synthetic stations. Also the size of the
+    initial map with stations clustered at the default zoom, and of a zoomed in
+    view. The time the browser takes to render either one has to be checked in
+    the browser dev tools.
+
+    python scripts/python/benchmarks/bench_map_payload.py --stations 46000
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+from time import perf_counter
+from plotly.io.json import to_json_plotly
+
+from weathergov.constants import Metrics
+from weathergov.app.constants import DEFAULT_MAP_VIEWPORT, MAP_CLUSTER_MAX_ZOOM
+from weathergov.app.viz import get_map_figure, get_map_patch, get_map_view
+
+
+def make_stations(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    station_ids = [f"ST{i:05d}" for i in range(n)]
+    return pd.DataFrame({
+        "station_id": station_ids,
+        "station_name": [f"STATION {i}, XX" for i in range(n)],
+        "elevation": rng.uniform(0, 3000, n).round(1).astype(str),
+        "station_timezone": "America/Chicago",
+        "url": [f"https://api.weather.gov/stations/{station_id}" for station_id in station_ids],
+        "elevation_units": "wmoUnit:m",
+        "latitude": rng.uniform(25, 49, n),
+        "longitude": rng.uniform(-125, -67, n),
+        f"{Metrics.Temperature}_val": rng.normal(15, 10, n),
+        f"{Metrics.BarometricPressure}_val": rng.normal(101325, 1000, n),
+    })
+
+
+def measure(fn) -> (int, float):
+    t_ = perf_counter()
+    payload = to_json_plotly(fn())
+    return len(payload.encode()), (perf_counter() - t_) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", default=46000, type=int)
+    args = parser.parse_args()
+
+    df = make_stations(args.stations)
+    metric = Metrics.BarometricPressure
+
+    # Every station, as the map was drawn before clustering
+    all_stations = get_map_view(df, {**DEFAULT_MAP_VIEWPORT, "zoom": MAP_CLUSTER_MAX_ZOOM})
+    zoomed_in = {"west": -90, "east": -85, "south": 40, "north": 43, "zoom": MAP_CLUSTER_MAX_ZOOM + 1}
+
+    for name, fn in [
+        ("whole figure", lambda: get_map_figure(all_stations, coloring_parameter=metric).to_dict()),
+        ("patch", lambda: get_map_patch(all_stations, coloring_parameter=metric).to_plotly_json()),
+        ("initial map", lambda: get_map_figure(get_map_view(df), coloring_parameter=metric).to_dict()),
+        ("zoomed in", lambda: get_map_patch(get_map_view(df, zoomed_in), coloring_parameter=metric,
+                                            markers_only=False).to_plotly_json()),
+    ]:
+        size, dt = measure(fn)
+        print(f"{name:<14s}: {size / 1e6:6.2f} MB, built and serialized in {dt:6.1f} ms")
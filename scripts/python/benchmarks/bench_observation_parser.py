@@ -0,0 +1,112 @@
+"""
+    Compare the old dict of lists parsing of observations (including the per metric
+    walk over the lists that add_timeseries_data used to do) with the columnar
+    parse_observations().
+
+    Fixtures are responses of /stations/{id}/observations saved as JSON files, e.g.
+        curl -H "User-Agent: ..." https://api.weather.gov/stations/KORD/observations > KORD.json
+    If --fixtures-dir is not given, synthetic responses of the same shape are used.
+
+    python scripts/python/benchmarks/bench_observation_parser.py --fixtures-dir ./fixtures
+"""
+import os
+import json
+import glob
+import argparse
+
+from time import perf_counter
+from datetime import datetime
+
+from _fixtures import make_observations_payload
+from weathergov.constants import MISSING_VALUE
+from weathergov.utils.stations_utils import parse_observations
+
+
+LEGACY_KEYS = [("temperature", "temperature"),
+               ("dew_point", "dewpoint"),
+               ("wind_direction", "windDirection"),
+               ("wind_speed", "windSpeed"),
+               ("wind_gust", "windGust"),
+               ("barometric_pressure", "barometricPressure"),
+               ("sea_level_pressure", "seaLevelPressure"),
+               ("visibility", "visibility"),
+               ("precipitation_last_3h", "precipitationLast3Hours"),
+               ("relative_humidity", "relativeHumidity"),
+               ("wind_chill", "windChill"),
+               ("heat_index", "heatIndex")]
+
+
+def legacy_parse(rj: dict) -> dict:
+    data = {"timestamp": []}
+    data.update({my_key: [] for my_key, _ in LEGACY_KEYS})
+
+    for feature in rj['features']:
+        properties = feature['properties']
+        data["timestamp"].append(properties["timestamp"])
+
+        for my_key, their_key in LEGACY_KEYS:
+            try:
+                value = properties[their_key]['value']
+            except KeyError:
+                value = MISSING_VALUE
+            if value is None:
+                value = MISSING_VALUE
+            data[my_key].append(value)
+    return data
+
+
+def legacy_prepare(data: dict) -> int:
+    # What add_timeseries_data did before sending samples to Redis
+    n = 0
+    for my_key, _ in LEGACY_KEYS:
+        for tsi, value in zip(data['timestamp'], data[my_key]):
+            _ = int(datetime.strptime(tsi, "%Y-%m-%dT%H:%M:%S%z").timestamp() * 1000), value
+            n += 1
+    return n
+
+
+def columnar_prepare(rj: dict) -> int:
+    batch = parse_observations(rj)
+    _ = batch.timestamps.tolist()
+    return sum(len(values.tolist()) for values in batch.values.values())
+
+
+def load_fixtures(fixtures_dir: str, n: int, n_features: int) -> list:
+    if fixtures_dir is None:
+        return [make_observations_payload(f"ST{i:05d}", n_features=n_features) for i in range(n)]
+
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "*.json"))):
+        with open(path) as f:
+            fixtures.append(json.load(f))
+    return fixtures
+
+
+def measure(fn, fixtures: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t_ = perf_counter()
+        for rj in fixtures:
+            fn(rj)
+        best = min(best, perf_counter() - t_)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures-dir", default=None)
+    parser.add_argument("--stations", default=100, type=int, help="Number of synthetic fixtures")
+    parser.add_argument("--features", default=168, type=int, help="Observations per synthetic fixture")
+    parser.add_argument("--repeat", default=5, type=int)
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures_dir, args.stations, args.features)
+    n_obs = sum(len(rj['features']) for rj in fixtures)
+    print(f"{len(fixtures)} fixtures, {n_obs} observations")
+
+    dt_legacy = measure(lambda rj: legacy_prepare(legacy_parse(rj)), fixtures, args.repeat)
+    dt_columnar = measure(columnar_prepare, fixtures, args.repeat)
+
+    print(f"dict of lists : {dt_legacy * 1000:8.1f} ms ({dt_legacy / len(fixtures) * 1e6:.0f} us/station)")
+    print(f"columnar      : {dt_columnar * 1000:8.1f} ms ({dt_columnar / len(fixtures) * 1e6:.0f} us/station)")
+    print(f"speedup       : {dt_legacy / dt_columnar:8.1f}x")
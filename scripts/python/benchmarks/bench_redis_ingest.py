@@ -0,0 +1,85 @@
+"""
+    Compare the old ingest path (one TS.ADD per sample, pipeline executed for every
+    metric) with the bulk TS.MADD path on synthetic stations. Needs a running Redis
+    Stack, connection settings are taken from REDIS_HOST, REDIS_PORT and REDIS_PASS.
+
+    python scripts/python/benchmarks/bench_redis_ingest.py --stations 200
+"""
+import argparse
+import numpy as np
+
+from time import perf_counter
+from dotenv import load_dotenv
+
+from _fixtures import make_observations_payload
+from weathergov.constants import Metrics, MISSING_VALUE
+from weathergov.utils.redis_utils import RedisClient, RedisKeys, get_resp_size
+from weathergov.utils.stations_utils import parse_observations
+
+
+def legacy_ingest(rc: RedisClient, batches: dict) -> dict:
+    stats = {"commands": 0, "bytes_sent": 0, "round_trips": 0}
+
+    for station_id, batch in batches.items():
+        pipe = rc.rc.pipeline()
+        ts = batch.timestamps.tolist()
+
+        for metric in Metrics:
+            values = np.where(np.isnan(batch.values[metric]), MISSING_VALUE, batch.values[metric]).tolist()
+            key = RedisKeys.get_rt_data_key(station_id, metric)
+
+            for tsi, value in zip(ts, values):
+                pipe.ts().add(key, tsi, value, duplicate_policy="FIRST")
+
+            pipe.hset(RedisKeys.get_station_info_hash_key(station_id=station_id), f"{metric}_ts", str(ts[-1]))
+            pipe.hset(RedisKeys.get_station_info_hash_key(station_id=station_id), f"{metric}_val", values[-1])
+
+            stats["commands"] += len(pipe.command_stack)
+            stats["bytes_sent"] += sum(get_resp_size(args) for args, _ in pipe.command_stack)
+            stats["round_trips"] += 1
+            pipe.execute()
+
+    return stats
+
+
+def cleanup(rc: RedisClient, station_ids: list):
+    pipe = rc.rc.pipeline(transaction=False)
+    for station_id in station_ids:
+        pipe.delete(RedisKeys.get_station_info_hash_key(station_id),
+                    *[RedisKeys.get_rt_data_key(station_id, metric) for metric in Metrics])
+    pipe.execute()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", default=200, type=int)
+    parser.add_argument("--features", default=168, type=int)
+    parser.add_argument("--batch-size", default=16, type=int, help="Stations per TS.MADD round trip")
+    args = parser.parse_args()
+
+    load_dotenv()
+    rc = RedisClient()
+
+    payloads = [parse_observations(make_observations_payload(f"{i}", n_features=args.features))
+                for i in range(args.stations)]
+    legacy = {f"BENCH-LEGACY-{i:05d}": batch for i, batch in enumerate(payloads)}
+    bulk = {f"BENCH-BULK-{i:05d}": batch for i, batch in enumerate(payloads)}
+
+    try:
+        t_ = perf_counter()
+        stats = legacy_ingest(rc, legacy)
+        dt = perf_counter() - t_
+        print(f"TS.ADD per sample : {dt:7.2f} s, {stats['commands']} commands in {stats['round_trips']} "
+              f"round trips, {stats['bytes_sent'] / 1e6:.1f} MB sent, {stats['commands'] / dt:.0f} commands/s")
+
+        station_ids = list(bulk.keys())
+        t_ = perf_counter()
+        for i in range(0, len(station_ids), args.batch_size):
+            rc.add_timeseries_data_bulk({station_id: bulk[station_id]
+                                         for station_id in station_ids[i:i + args.batch_size]})
+        dt = perf_counter() - t_
+        s = rc.ingest_stats
+        print(f"TS.MADD bulk      : {dt:7.2f} s, {s.commands} commands in {s.batches} round trips, "
+              f"{s.bytes_sent / 1e6:.1f} MB sent, {s.commands / dt:.0f} commands/s")
+    finally:
+        cleanup(rc, list(legacy.keys()) + list(bulk.keys()))
@@ -0,0 +1,95 @@
+"""
+    Compare Redis memory used by the observation timeseries with different chunk
+    size profiles. For every profile, the schema is provisioned for a synthetic set
+    of stations (46k by default, like weather.gov), every series is filled with
+    hourly samples, and the growth of used_memory is reported separately for the raw
+    series and for their compaction series. Needs a running Redis Stack with enough
+    memory, connection settings are taken from REDIS_HOST, REDIS_PORT and REDIS_PASS.
+
+    python scripts/python/benchmarks/bench_timeseries_memory.py --stations 46000 --chunk-sizes 256 1024 4096
+"""
+import argparse
+
+from time import perf_counter
+from dotenv import load_dotenv
+
+from _fixtures import make_observations_payload
+from weathergov.constants import Metrics, TS_COMPACTIONS, TS_COMPACTION_AGGREGATIONS, TS_COMPACTION_CHUNK_SIZE
+from weathergov.utils.redis_utils import RedisClient, RedisKeys
+from weathergov.utils.stations_utils import parse_observations
+
+
+def get_compaction_keys(station_id: str) -> list:
+    return [RedisKeys.get_compaction_key(station_id, metric, aggregation, bucket_ms)
+            for metric in Metrics for bucket_ms in TS_COMPACTIONS for aggregation in TS_COMPACTION_AGGREGATIONS]
+
+
+def cleanup(rc: RedisClient, station_ids: list, compactions_only: bool = False):
+    for i in range(0, len(station_ids), 1000):
+        pipe = rc.rc.pipeline(transaction=False)
+        for station_id in station_ids[i:i + 1000]:
+            keys = get_compaction_keys(station_id)
+            if not compactions_only:
+                keys.append(RedisKeys.get_station_info_hash_key(station_id))
+                keys.extend(RedisKeys.get_rt_data_key(station_id, metric) for metric in Metrics)
+            pipe.delete(*keys)
+        pipe.execute()
+
+
+def run_profile(rc: RedisClient,
+                stations: list,
+                batches: list,
+                chunk_size: int,
+                compaction_chunk_size: int) -> (int, int, float):
+    """
+    :return: Memory growth of the raw series (with the station hashes) and of the
+        compaction series in bytes, and load time in seconds
+    """
+    station_ids = [station["station_id"] for station in stations]
+    cleanup(rc, station_ids)
+    used_memory = rc.get_used_memory()
+
+    t_ = perf_counter()
+    rc.create_timeseries_schema(stations, chunk_size=chunk_size, compaction_chunk_size=compaction_chunk_size)
+
+    # Stations share a small set of payloads, which is enough to fill the chunks
+    for i in range(0, len(station_ids), 100):
+        rc.add_timeseries_data_bulk({station_id: batches[j % len(batches)]
+                                     for j, station_id in enumerate(station_ids[i:i + 100], start=i)})
+    dt = perf_counter() - t_
+
+    total = rc.get_used_memory() - used_memory
+
+    # Compaction series are dropped first to tell their share
+    cleanup(rc, station_ids, compactions_only=True)
+    raw = rc.get_used_memory() - used_memory
+
+    cleanup(rc, station_ids)
+    return raw, total - raw, dt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", default=46000, type=int)
+    parser.add_argument("--features", default=168, type=int, help="Hourly samples per series")
+    parser.add_argument("--chunk-sizes", default=[256, 1024, 4096, 16384], type=int, nargs="+",
+                        help="Chunk sizes of the raw series")
+    parser.add_argument("--compaction-chunk-size", default=TS_COMPACTION_CHUNK_SIZE, type=int)
+    args = parser.parse_args()
+
+    load_dotenv()
+    rc = RedisClient()
+
+    stations = [{"station_id": f"BENCHMEM{i:05d}",
+                 "station_state": "WI",
+                 "station_timezone": "America/Chicago"} for i in range(args.stations)]
+    batches = [parse_observations(make_observations_payload(f"{i}", n_features=args.features)) for i in range(50)]
+
+    n_series = args.stations * len(Metrics)
+    n_compactions = n_series * len(TS_COMPACTIONS) * len(TS_COMPACTION_AGGREGATIONS)
+    for chunk_size in args.chunk_sizes:
+        raw, compactions, dt = run_profile(rc, stations, batches, chunk_size, args.compaction_chunk_size)
+        print(f"CHUNK_SIZE={chunk_size:<6d}: raw {raw / 2 ** 20:9.1f} MiB for {n_series} series "
+              f"({raw / n_series:.0f} bytes/series), compactions {compactions / 2 ** 20:9.1f} MiB "
+              f"for {n_compactions} series ({compactions / n_compactions:.0f} bytes/series, "
+              f"CHUNK_SIZE={args.compaction_chunk_size}), loaded in {dt:.1f} s")
@@ -0,0 +1,54 @@
+"""
+    CPU time spent converting observation timestamps to epoch milliseconds per
+    1000 stations:
+    - per metric: datetime.strptime() for every sample of every metric, like
+      add_timeseries_data used to do
+    - per batch: datetime.strptime() once per sample
+    - vectorized: iso_to_epoch_ms() once per station batch
+
+    python scripts/python/benchmarks/bench_timestamp_parsing.py --stations 1000
+"""
+import argparse
+import numpy as np
+
+from time import process_time
+from datetime import datetime
+
+from _fixtures import make_observations_payload
+from weathergov.constants import Metrics
+from weathergov.utils.time_utils import iso_to_epoch_ms
+
+
+def per_metric(timestamps: list):
+    for _ in Metrics:
+        [int(datetime.strptime(tsi, "%Y-%m-%dT%H:%M:%S%z").timestamp() * 1000) for tsi in timestamps]
+
+
+def per_batch(timestamps: list):
+    np.array([int(datetime.strptime(tsi, "%Y-%m-%dT%H:%M:%S%z").timestamp() * 1000) for tsi in timestamps])
+
+
+def vectorized(timestamps: list):
+    iso_to_epoch_ms(timestamps)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", default=1000, type=int)
+    parser.add_argument("--features", default=168, type=int)
+    args = parser.parse_args()
+
+    # Only the timestamps are needed, and every station has its own column
+    base = [f['properties']['timestamp'] for f in make_observations_payload("ST", n_features=args.features)['features']]
+    columns = [list(base) for _ in range(args.stations)]
+
+    results = dict()
+    for name, fn in [("per metric", per_metric), ("per batch", per_batch), ("vectorized", vectorized)]:
+        t_ = process_time()
+        for column in columns:
+            fn(column)
+        results[name] = (process_time() - t_) * 1000 / args.stations
+
+    for name, dt in results.items():
+        print(f"{name:<11s}: {dt * 1000:9.1f} ms CPU per 1k stations")
+    print(f"saved vs per metric: {(results['per metric'] - results['vectorized']) * 1000:.1f} ms CPU per 1k stations")
@@ -6,6 +6,7 @@ from datetime import datetime
 
 from weathergov.utils.redis_utils import RedisKeys, RedisInfo, RedisClient
 from weathergov.constants import Metrics
+from weathergov.scripts.data_dumper import get_station_bucket, _get_dump_dates
 
 load_dotenv()
 
@@ -26,8 +27,10 @@ print(f"Successfully connected to Redis: {rc.ping()}")
 station_ids = rc.get_all_station_ids()
 print(f"There are {len(station_ids)} station IDs")
 
-station_updates = rc.get_weather_station_last_data_dump_ts_all()
-print(f"Data dumps: {len(station_updates)}")
+_, previous_date = _get_dump_dates()
+month = previous_date.strftime("%Y-%m")
+manifest = rc.get_data_dump_manifest(month)
+print(f"Data dump of {month}: {len(manifest)} shards done")
 
 print(f"Queue length: {rc.rc.llen('weather_station_process_queue')}")
 
@@ -49,12 +52,9 @@ while True:
         d1 = datetime.fromtimestamp(x1)
         d2 = datetime.fromtimestamp(x2)
 
-        ts = rc.get_weather_station_last_data_dump_ts(
-            station_id=station_id,
-            metric=Metrics.Temperature
-        )
+        shard = manifest.get(f"{Metrics.Temperature}:{get_station_bucket(station_id)}", dict())
 
-        print(f"Data available from {d1} to {d2} ; last dump was on {ts}")
+        print(f"Data available from {d1} to {d2} ; last dump was on {shard.get('ts')}")
         sleep(3)
     else:
         continue
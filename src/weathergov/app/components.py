@@ -4,11 +4,18 @@ from enum import Enum, unique
 @unique
 class Components(str, Enum):
     GraphMap = "graph-map"
+    # Coloring metric, stations fingerprint and snapshot version of the map in the browser
+    StoreMapState = "store-map-state"
+    IntervalMapRefresh = "interval-map-refresh"
+    # Width of the station charts in the browser, in pixels
+    StoreChartWidth = "store-chart-width"
+    ChartPane = "chart-pane"
 
     WeatherStationInfoPanelName = "ws-info-panel-name"
     WeatherStationInfoPanelStationID = "ws-info-panel-station-id"
     WeatherStationInfoPanelElevationAboveGround = "ws-info-panel-elevation-above-round"
     WeatherStationInfoPanelStationURL = "ws-info-panel-station-url"
+    RadioChartRange = "radio-chart-range"
 
     DDMenuColorSchemeSelection = "dd-menu"
     DDMenuItemTemperature = "dd-button-1"
@@ -1,3 +1,68 @@
+import typing
+
+from weathergov.constants import Metrics
+
+
 class DataLabels:
     FigureCustomData = ['station_name', 'station_id', 'elevation',
-                        'station_timezone', 'url', 'elevation_units', 'ts', 'temperature']
+                        'station_timezone', 'url', 'elevation_units']
+
+
+class MetricColoring(typing.NamedTuple):
+    # Units of the colorbar tick labels
+    units: str
+    # Distance between colorbar ticks, in the colorbar units
+    tick_step: float
+    # Observations are multiplied by it to get the colorbar units, like Pa -> hPa
+    scale: float = 1.0
+    # Fixed range of the colorbar. By default, it is taken from the data
+    value_range: typing.Optional[typing.Tuple[float, float]] = None
+    # Overrides the colorscale chosen in the app, for metrics like wind direction
+    colorscale: typing.Optional[str] = None
+
+
+# How the map is colored by each metric. Units of the weather.gov observations
+# are degC, degree (angle), km/h, Pa, m, mm and percent.
+METRIC_COLORING = {
+    Metrics.Temperature: MetricColoring(units="°C", tick_step=5),
+    Metrics.DewPoint: MetricColoring(units="°C", tick_step=5),
+    Metrics.WindDirection: MetricColoring(units="°", tick_step=45, value_range=(0, 360), colorscale="twilight"),
+    Metrics.WindSpeed: MetricColoring(units="km/h", tick_step=10),
+    Metrics.WindGust: MetricColoring(units="km/h", tick_step=10),
+    Metrics.BarometricPressure: MetricColoring(units="hPa", tick_step=10, scale=0.01),
+    Metrics.SeaLevelPressure: MetricColoring(units="hPa", tick_step=10, scale=0.01),
+    Metrics.Visibility: MetricColoring(units="km", tick_step=4, scale=0.001, value_range=(0, 16)),
+    Metrics.Precipitation3h: MetricColoring(units="mm", tick_step=5),
+    Metrics.RelativeHumidity: MetricColoring(units="%", tick_step=10, value_range=(0, 100)),
+    Metrics.WindChill: MetricColoring(units="°C", tick_step=5),
+    Metrics.HeatIndex: MetricColoring(units="°C", tick_step=5),
+}
+
+# How often the map checks for a new stations snapshot
+MAP_REFRESH_INTERVAL_SECONDS = 5 * 60
+
+# Map bounds and zoom level before the user moves the map
+DEFAULT_MAP_VIEWPORT = {"west": -127, "east": -65, "south": 22, "north": 54, "zoom": 3}
+
+# Below this zoom level, stations are shown as clusters on a grid with this many
+# cells per map tile width (a tile is 360 / 2^zoom degrees wide)
+MAP_CLUSTER_MAX_ZOOM = 6
+MAP_CLUSTER_CELLS_PER_TILE = 16
+
+# Width of the station charts in pixels, until the browser reports the actual one.
+# Their lines are downsampled to CHART_POINTS_PER_PIXEL points per pixel, more
+# would not be visible.
+CHART_WIDTH_PX = 600
+CHART_MAX_WIDTH_PX = 4096
+CHART_POINTS_PER_PIXEL = 2
+
+# Time ranges of the station charts in days. Ranges longer than Redis keeps raw
+# samples for are read from compaction series and the Parquet dumps.
+CHART_RANGES_DAYS = {"Week": 7, "Month": 31, "Year": 365}
+DEFAULT_CHART_RANGE = "Week"
+
+# Size of the lookup table of colors sampled from a colorscale
+COLORSCALE_LUT_SIZE = 256
+
+# Color of the stations without the metric value
+NO_DATA_COLOR = "rgb(100, 100, 100)"
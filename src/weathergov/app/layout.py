@@ -1,18 +1,14 @@
-import pandas as pd
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
 
 from dash import html, dcc
 
-from weathergov.app.viz import get_map
+from weathergov.app.viz import get_map_placeholder
 from weathergov.constants import Metrics
+from weathergov.app.constants import MAP_REFRESH_INTERVAL_SECONDS, CHART_RANGES_DAYS, DEFAULT_CHART_RANGE
 from weathergov.app.components import Components
 
 
-pd.set_option('display.max_columns', None)
-pd.set_option('display.max_rows', None)
-
-
 def get_navbar():
 
     logo = "https://images.plot.ly/logo/new-branding/plotly-logomark.png"
@@ -142,6 +138,12 @@ def get_rt_graph_pane():
     return dbc.Container(
         dbc.Stack(
             [
+                dbc.RadioItems(
+                    options=[{"label": label, "value": label} for label in CHART_RANGES_DAYS],
+                    value=DEFAULT_CHART_RANGE,
+                    id=Components.RadioChartRange,
+                    inline=True
+                ),
                 get_collapse(),
                 # dbc.Row(
                 #     dcc.Graph(
@@ -150,7 +152,8 @@ def get_rt_graph_pane():
                 #     )
                 # )
             ]
-        )
+        ),
+        id=Components.ChartPane
     )
 
 
@@ -193,15 +196,23 @@ def get_weather_station_info_panel():
     )
 
 
-def get_layout(app):
+def get_layout():
+    """
+        Layout is built for every page load. It has an empty map, the stations are
+        loaded by a callback, so neither the workers start nor the page load waits
+        for Redis.
+    """
     return dbc.Container(
         [
             get_navbar(),
+            dcc.Store(id=Components.StoreMapState),
+            dcc.Store(id=Components.StoreChartWidth),
+            dcc.Interval(id=Components.IntervalMapRefresh, interval=MAP_REFRESH_INTERVAL_SECONDS * 1000),
             dbc.Row(
                 [
                     dbc.Col(
                         dcc.Graph(
-                            figure=get_map(app),
+                            figure=get_map_placeholder(),
                             style={"height": "100%"},
                             id=Components.GraphMap
                         ),
@@ -1,73 +1,251 @@
-import pytz
+import json
+import zlib
 import numpy as np
+import pandas as pd
 import logging
 import plotly.graph_objects as go
 
-from datetime import datetime, timezone
-from plotly.express.colors import sample_colorscale
+from dash import Patch
+from functools import lru_cache
+from plotly.colors import sample_colorscale
 
 from weathergov.constants import Metrics
-from weathergov.app.constants import DataLabels
+from weathergov.app.constants import (DataLabels,
+                                      METRIC_COLORING,
+                                      COLORSCALE_LUT_SIZE,
+                                      NO_DATA_COLOR,
+                                      DEFAULT_MAP_VIEWPORT,
+                                      MAP_CLUSTER_MAX_ZOOM,
+                                      MAP_CLUSTER_CELLS_PER_TILE,
+                                      CHART_WIDTH_PX,
+                                      CHART_MAX_WIDTH_PX,
+                                      CHART_POINTS_PER_PIXEL)
+from weathergov.utils.downsampling_utils import lttb, minmax_decimate
+from weathergov.utils.spatial_utils import (GridIndex,
+                                            get_stations_grid_index,
+                                            grid_clusters,
+                                            cluster_mean,
+                                            zoom_to_cell_deg)
 
 
 logger = logging.getLogger(__name__)
 
 
-def get_colorscale(df, colorscale, coloring_parameter):
-    if coloring_parameter is Metrics.Temperature:
-        logger.info(f"Coloring map by temperature")
-        return get_colorscale_by_temperature(df, colorscale, coloring_parameter)
-    else:
-        logger.warning(f"Coloring with parameter {coloring_parameter} have not been implemented yet")
-        return "blue", [], []
+@lru_cache(maxsize=None)
+def get_colorscale_lut(colorscale: str) -> np.ndarray:
+    """
+        Colors sampled evenly from the colorscale, from its lowest to its highest value
+    """
+    # Object array, so the colors assigned to it later (like NO_DATA_COLOR) are not truncated
+    return np.asarray(sample_colorscale(colorscale, np.linspace(0, 1, COLORSCALE_LUT_SIZE).tolist()), dtype=object)
+
+
+def get_metric_values(df, coloring_parameter) -> np.ndarray:
+    """
+        The most recent value of the metric of every station in the colorbar units
+    """
+    column = f"{coloring_parameter}_val"
+    if column not in df.columns:
+        return np.full(len(df), np.nan)
+    return df[column].to_numpy(dtype=np.float64) * METRIC_COLORING[Metrics(coloring_parameter)].scale
+
 
+def get_marker_text(df, coloring_parameter) -> np.ndarray:
+    """
+        Hover text with the most recent value of the metric, like "Temperature: 21.3 °C"
+    """
+    values = get_metric_values(df, coloring_parameter)
+    label = str(coloring_parameter).replace("_", " ").capitalize()
 
-def get_colorscale_by_temperature(df, colorscale, coloring_parameter):
-    df.loc[df[coloring_parameter] < -99911990, coloring_parameter] = np.nan
-    ind_nan = df[coloring_parameter].isna()
-    print(df.head())
+    units = METRIC_COLORING[Metrics(coloring_parameter)].units.replace("%", "%%")
 
-    # Fill nan values with mean value, this is temporary step only to create an array of colors
-    # using sample_colorscale() function. Later, all the nans will be replaced with the default
-    # color
-    temperature_mean = df[coloring_parameter].mean()
-    df.loc[ind_nan, coloring_parameter] = temperature_mean
+    text = np.char.mod(f"{label}: %.1f {units}", values).astype(object)
+    text[np.isnan(values)] = f"{label}: no data"
+    return text
 
-    colorbar_tick_step = 5
-    x_min = (int(df[coloring_parameter].min()) // colorbar_tick_step) * colorbar_tick_step
-    x_max = (1 + int(df[coloring_parameter].max()) // colorbar_tick_step) * colorbar_tick_step
-    n_ticks = 1 + int(x_max - x_min) // colorbar_tick_step
 
-    colorscale_tick_values = np.linspace(0, 1, n_ticks)
-    colorscale_tick_labels = [f"{v:.2f}°" for v in (colorscale_tick_values * (x_max - x_min) + x_min).tolist()]
+def get_stations_fingerprint(df) -> int:
+    """
+        Checksum of the stations (and clusters) order on the map. Marker properties of
+        a map can be replaced with the ones built from another view only if they are equal.
 
-    # -8.33 49.93 : that is going to be good
-    values = df[coloring_parameter].apply(lambda x: (x - x_min) / (x_max - x_min))
-    colors = sample_colorscale(colorscale, values)
+        A cluster of the same grid cell groups other stations when the view moves, so
+        the count and the position of every cluster are part of the checksum too.
+    """
+    checksum = zlib.crc32("\n".join(df['key'].tolist()).encode())
 
-    colors = np.asarray(colors)
+    clusters = df[df['station_id'] == ""]
+    checksum = zlib.crc32("\n".join(clusters['station_name'].tolist()).encode(), checksum)
+    return zlib.crc32(clusters[['latitude', 'longitude']].to_numpy(dtype=np.float64).tobytes(), checksum)
 
-    # Replace all the nans with gray color
-    # df.loc[ind_nan, 'color'] = 'rgba(100, 100, 100, 0.5)'
-    colors[ind_nan] = 'rgb(100, 100, 100)'
-    return colors, colorscale_tick_values, colorscale_tick_labels
+
+def get_map_view(df, viewport: dict = None, index: GridIndex = None) -> pd.DataFrame:
+    """
+        Stations inside the visible bounds of the map. Below MAP_CLUSTER_MAX_ZOOM the
+        stations are grouped into clusters by the cells of a grid that gets finer with
+        zoom. A cluster has the mean coordinates and the mean value of every metric of
+        its stations and an empty station ID. Cells with one station keep the station.
+
+    :param df: Stations table as returned by RedisClient.get_observation_stations_info()
+    :param viewport: Bounds and zoom like DEFAULT_MAP_VIEWPORT, which is the default
+    :param index: Spatial index of the df stations, see RedisClient.get_stations_index().
+        It is built if not given
+    :return: Table with the stations table columns that are used by the map, and
+        the "key" column with station ID or cluster ID
+    """
+    viewport = viewport or DEFAULT_MAP_VIEWPORT
+
+    if index is None:
+        index = get_stations_grid_index(df)
+    lat, lon = index.lat, index.lon
+
+    ind = index.query_bbox(viewport["west"], viewport["south"], viewport["east"], viewport["north"])
+
+    columns = DataLabels.FigureCustomData + [col for col in df.columns if col.endswith("_val")]
+    stations = df.iloc[ind][columns].assign(latitude=lat[ind], longitude=lon[ind])
+
+    if viewport["zoom"] >= MAP_CLUSTER_MAX_ZOOM:
+        return stations.assign(key=stations['station_id']).reset_index(drop=True)
+
+    cell_deg = zoom_to_cell_deg(viewport["zoom"], MAP_CLUSTER_CELLS_PER_TILE)
+    cells, inverse = grid_clusters(lat[ind], lon[ind], cell_deg)
+
+    counts = np.bincount(inverse, minlength=len(cells))
+    ind_clusters = np.flatnonzero(counts > 1)
+
+    single = stations[counts[inverse] == 1]
+
+    clusters = pd.DataFrame({
+        "station_name": [f"{n} stations" for n in counts[ind_clusters].tolist()],
+        "station_id": "",
+        "elevation": "",
+        "station_timezone": "",
+        "url": "",
+        "elevation_units": "",
+        "latitude": cluster_mean(inverse, lat[ind], len(cells))[ind_clusters],
+        "longitude": cluster_mean(inverse, lon[ind], len(cells))[ind_clusters],
+        "key": [f"cluster:{cell_deg:g}:{cell}" for cell in cells[ind_clusters].tolist()],
+    })
+
+    for col in columns:
+        if col.endswith("_val"):
+            values = stations[col].to_numpy(dtype=np.float64)
+            clusters[col] = cluster_mean(inverse, values, len(cells))[ind_clusters]
+
+    return pd.concat([single.assign(key=single['station_id']), clusters], ignore_index=True)
+
+
+def get_colorbar_range(df, coloring_parameter) -> (float, float):
+    """
+        Colorbar range of the metric: the fixed one of METRIC_COLORING, or the 1st to
+        99th percentile of the values (so a few broken sensors do not squeeze the
+        colorbar) rounded to the tick step
+    """
+    config = METRIC_COLORING[Metrics(coloring_parameter)]
+    step = config.tick_step
+
+    if config.value_range is not None:
+        return config.value_range
+
+    values = get_metric_values(df, coloring_parameter)
+    if np.isnan(values).all():
+        return 0, step
+
+    x_min, x_max = np.nanpercentile(values, [1, 99])
+    x_min = np.floor(x_min / step) * step
+    x_max = max(np.ceil(x_max / step) * step, x_min + step)
+    return float(x_min), float(x_max)
+
+
+def get_colorscale(df, colorscale, coloring_parameter, value_range=None) -> (np.ndarray, dict):
+    """
+        Color every station by the most recent value of the metric. Values are mapped
+        to the colorscale lookup table with the range and ticks of METRIC_COLORING,
+        stations without a value are gray.
+
+    :param value_range: Colorbar range, by default it is taken from the df values
+    :return: Array of colors and the marker colorbar settings (colorscale, cmin, cmax
+        and tick values and labels in the metric units)
+    """
+    config = METRIC_COLORING[Metrics(coloring_parameter)]
+    colorscale = config.colorscale or colorscale
+    logger.info(f"Coloring map by {coloring_parameter}")
+
+    values = get_metric_values(df, coloring_parameter)
+    ind_nan = np.isnan(values)
+    step = config.tick_step
+
+    x_min, x_max = value_range or get_colorbar_range(df, coloring_parameter)
+
+    lut = get_colorscale_lut(colorscale)
+    normalized = np.clip((values - x_min) / (x_max - x_min), 0, 1)
+    ind = np.rint(np.nan_to_num(normalized) * (len(lut) - 1)).astype(np.intp)
+
+    colors = lut[ind]
+    colors[ind_nan] = NO_DATA_COLOR
+
+    tick_values = np.arange(x_min, x_max + step / 2, step)
+    return colors, {
+        "colorscale": colorscale,
+        "cmin": float(x_min),
+        "cmax": float(x_max),
+        "tickvals": tick_values.tolist(),
+        "ticktext": [f"{v:g} {config.units}" for v in tick_values.tolist()],
+    }
 
 
 def get_map(app,
             colorscale='jet',
             coloring_parameter=Metrics.Temperature,
-            show_inactive_stations=True) -> go.Figure:
-    #
-    # coloring_parameter = Metrics.Temperature
+            show_inactive_stations=True) -> dict:
+    """
+        Get the stations map figure of the default viewport. Figures are cached in Redis
+        by the stations snapshot version, so all the web app workers build a figure only
+        once per snapshot.
+    """
+    version = app.rc.get_stations_snapshot_version()
 
-    #
-    # Get the data from Redis
-    # We store a connection object inside the app
-    df = app.rc.get_observation_stations_info()
+    if version > 0:
+        figure_json = app.rc.get_map_figure(coloring_parameter, colorscale, version)
+
+        if figure_json is not None:
+            logger.info(f"Map figure colored by {coloring_parameter} found in cache for snapshot version {version}")
+            return json.loads(figure_json)
+
+    version, df, index = app.rc.get_stations_index()
+    if df is None:
+        df = app.rc.get_observation_stations_info()
+
+    fig = get_map_figure(get_map_view(df, index=index),
+                         colorscale=colorscale,
+                         coloring_parameter=coloring_parameter,
+                         value_range=get_colorbar_range(df, coloring_parameter))
+    fig.layout.meta = {**fig.layout.meta, "version": version}
+
+    # Without a snapshot there is no version to tell when the figure gets outdated
+    if version > 0:
+        app.rc.set_map_figure(coloring_parameter, colorscale, version, fig.to_json())
+
+    stats = app.rc.get_map_figure_cache_stats()
+    logger.info(f"Map figure cache: hits={stats['hits']} misses={stats['misses']}")
+    return fig.to_dict()
+
+
+def get_map_figure(df,
+                   colorscale='jet',
+                   coloring_parameter=Metrics.Temperature,
+                   value_range=None) -> go.Figure:
+    """
+    :param df: Map view as returned by get_map_view()
+    :param colorscale:
+    :param coloring_parameter:
+    :param value_range: Colorbar range, see get_colorscale()
+    """
     logger.info(f"Generating a figure with coloring by {coloring_parameter}")
 
     # Create a colormap
-    colors, colorscale_tick_values, colorscale_tick_labels = get_colorscale(df, colorscale, coloring_parameter)
+    colors, colorbar = get_colorscale(df, colorscale, coloring_parameter, value_range)
+    text = get_marker_text(df, coloring_parameter)
 
     #
     #
@@ -79,8 +257,10 @@ def get_map(app,
             lon=df['longitude'],
             mode='markers',
             customdata=df[DataLabels.FigureCustomData],
+            text=text,
             hovertemplate="<b>Station name:</b> %{customdata[0]}<br>" +
                           "<b>Station ID:</b> %{customdata[1]}<br><br>" +
+                          "%{text}<br>" +
                           "Latitude: %{lat:,.6f}°<br>" +
                           "Longitude: %{lon:.6f}°<br>" +
                           "Elevation: %{customdata[2]:,.1f}<br>" +
@@ -90,31 +270,89 @@ def get_map(app,
             marker={
                 "color": colors,
                 "colorbar": dict(thickness=10,
-                                 tickvals=colorscale_tick_values,
-                                 ticktext=colorscale_tick_labels,
+                                 tickvals=colorbar["tickvals"],
+                                 ticktext=colorbar["ticktext"],
                                  outlinewidth=0,
                                  orientation='h',
                                  y=1,
                                  bgcolor='white'),
-                "cmin": 0,
-                "cmax": 1,
+                "cmin": colorbar["cmin"],
+                "cmax": colorbar["cmax"],
                 "showscale": True,
-                "colorscale": colorscale
+                "colorscale": colorbar["colorscale"]
             },
         )
     )
 
+    update_map_layout(fig, meta={"stations": get_stations_fingerprint(df)})
+
+    return fig
+
+
+def update_map_layout(fig: go.Figure, **kwargs):
     fig.update_layout(
         autosize=True,
         mapbox_style="open-street-map",
         margin={"r": 0, "t": 0, "l": 0, "b": 0},
         mapbox_bounds={"west": -127, "east": -65, "south": 22, "north": 54},
         # clickmode='event+select'
+        # Keep the map view when the figure is replaced
+        uirevision="map",
+        **kwargs
     )
 
+
+def get_map_placeholder() -> go.Figure:
+    """
+        Empty map that is shown until the stations are loaded
+    """
+    fig = go.Figure(go.Scattermapbox(lat=[], lon=[], mode='markers'))
+    update_map_layout(fig)
     return fig
 
 
+def get_map_state(fig: dict, coloring_parameter, viewport: dict = None) -> dict:
+    """
+        What the browser needs to remember about a map figure to get patches later
+    """
+    meta = fig.get("layout", dict()).get("meta") or dict()
+    return {
+        "metric": str(coloring_parameter),
+        "stations": meta.get("stations"),
+        "version": meta.get("version", 0),
+        "viewport": viewport or DEFAULT_MAP_VIEWPORT,
+    }
+
+
+def get_map_patch(df,
+                  colorscale='jet',
+                  coloring_parameter=Metrics.Temperature,
+                  value_range=None,
+                  markers_only=True) -> Patch:
+    """
+        Update of a map figure with another view, see get_map_view(). With `markers_only`
+        it changes only the marker colors, colorbar and hover text, so the stations
+        coordinates and info are not sent to the browser again, and the map must show
+        a view with the same stations fingerprint.
+    """
+    colors, colorbar = get_colorscale(df, colorscale, coloring_parameter, value_range)
+
+    patch = Patch()
+    if not markers_only:
+        patch["data"][0]["lat"] = df['latitude'].to_numpy()
+        patch["data"][0]["lon"] = df['longitude'].to_numpy()
+        patch["data"][0]["customdata"] = df[DataLabels.FigureCustomData].to_numpy()
+
+    patch["data"][0]["text"] = get_marker_text(df, coloring_parameter)
+    patch["data"][0]["marker"]["color"] = colors
+    patch["data"][0]["marker"]["cmin"] = colorbar["cmin"]
+    patch["data"][0]["marker"]["cmax"] = colorbar["cmax"]
+    patch["data"][0]["marker"]["colorscale"] = colorbar["colorscale"]
+    patch["data"][0]["marker"]["colorbar"]["tickvals"] = colorbar["tickvals"]
+    patch["data"][0]["marker"]["colorbar"]["ticktext"] = colorbar["ticktext"]
+    return patch
+
+
 def get_default_figure():
     fig = go.Figure()
 
@@ -127,44 +365,78 @@ def get_default_figure():
     return fig
 
 
-def get_temperature_ts_figure(x: list, y: list, tz=None):
+def get_chart_max_points(width_px: int = None) -> int:
     """
-        Convert temperature
-    :param x:
-    :param y:
-    :param tz:
-    :return:
+        How many points of a line a chart of the width can show
+    :param width_px: Width of the chart in the browser, CHART_WIDTH_PX if unknown
     """
-    if tz is None:
-        ts = [datetime.fromtimestamp(xi / 1000, tz=timezone.utc) for xi in x]
-    else:
-        ts = [datetime.fromtimestamp(xi / 1000, tz=pytz.timezone(tz)) for xi in x]
+    if not width_px or width_px <= 0:
+        width_px = CHART_WIDTH_PX
+    return int(min(width_px, CHART_MAX_WIDTH_PX) * CHART_POINTS_PER_PIXEL)
 
-    fig = go.Figure()
 
-    fig.add_trace(
-        go.Scatter(
-            x=ts,
-            y=y,
-            mode='lines+markers'
-        )
-    )
+def downsample(x, y, max_points: int = CHART_WIDTH_PX * CHART_POINTS_PER_PIXEL, method: str = "minmax"):
+    """
+        Reduce the number of points of a chart line to what the chart can show
 
-    fig.update_layout(
-        autosize=True,
-        height=300,
-        margin={"r": 0, "t": 0, "l": 0, "b": 0},
-    )
+    :param x: Timestamps
+    :param y: Values
+    :param max_points:
+    :param method: "minmax" keeps every peak, "lttb" keeps the shape of the line with fewer points
+    :return: Downsampled x and y
+    """
+    if len(x) <= max_points:
+        return x, y
 
-    return fig
+    if method == "lttb":
+        return lttb(np.asarray(x), np.asarray(y), max_points)
+    return minmax_decimate(np.asarray(x), np.asarray(y), max_points)
+
+
+def to_local_time(x, tz: str = None) -> pd.DatetimeIndex:
+    """
+        Convert unix timestamps in milliseconds to the wall time of the time zone (UTC by
+        default) for the chart axis. All the timestamps are converted at once, and the
+        time zone is dropped afterwards, because the browser would show them in its own.
+    """
+    dt = pd.to_datetime(np.asarray(x, dtype=np.int64), unit="ms", utc=True)
+
+    if tz:
+        try:
+            dt = dt.tz_convert(tz)
+        except KeyError:
+            # Unknown time zone errors of pytz and zoneinfo are KeyErrors
+            logger.warning(f"Unknown time zone {tz}, showing time in UTC")
+    return dt.tz_localize(None)
+
+
+def get_temperature_ts_figure(x: list, y: list, tz=None, width_px: int = None):
+    """
+        Temperature chart
+    :param x: Timestamps in milliseconds
+    :param y:
+    :param tz: Time zone of the station
+    :param width_px: Width of the chart in the browser
+    :return:
+    """
+    return get_ts_figure(x, y, tz=tz, width_px=width_px)
 
 
-def get_ts_figure(x: list, y: list):
+def get_ts_figure(x: list, y: list, tz=None, width_px: int = None):
+    """
+    :param x: Timestamps in milliseconds
+    :param y:
+    :param tz: Time zone of the station
+    :param width_px: Width of the chart in the browser, the line is downsampled to it
+    :return:
+    """
+    x, y = downsample(x, y, get_chart_max_points(width_px))
+
     fig = go.Figure()
 
     fig.add_trace(
         go.Scatter(
-            x=x,
+            x=to_local_time(x, tz),
             y=y,
             mode='lines+markers'
         )
@@ -179,14 +451,22 @@ def get_ts_figure(x: list, y: list):
     return fig
 
 
-def get_ts_figure_polar(r: list, direction: list):
+def get_ts_figure_polar(r: list, direction: list, width_px: int = None):
+    """
+    :param r: Timestamps in milliseconds
+    :param direction: Direction in degrees
+    :param width_px: Width of the chart in the browser, the points are downsampled to it
+    :return:
+    """
+    # Direction wraps around, so its extremes are not worth keeping like minmax does
+    r, direction = downsample(r, direction, get_chart_max_points(width_px), method="lttb")
+
     fig = go.Figure()
 
-    try:
-        r0 = r[0]
-        r = [ri - r0 for ri in r]
-    except IndexError:
-        pass
+    # Time since the first observation
+    r = np.asarray(r)
+    if len(r) > 0:
+        r = r - r[0]
 
     fig.add_trace(
         go.Scatterpolar(
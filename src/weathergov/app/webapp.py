@@ -3,7 +3,7 @@ import logging
 import dash_bootstrap_components as dbc
 
 from time import time
-from dash import Dash, Input, Output, State, callback
+from dash import Dash, Input, Output, State, callback, ctx, no_update
 from dotenv import load_dotenv
 # from dash_bootstrap_components.themes import LUMEN
 
@@ -11,12 +11,20 @@ from weathergov.constants import Metrics
 from weathergov.app.layout import get_layout
 from weathergov.app.components import Components
 from weathergov.utils.redis_utils import RedisClient
+from weathergov.utils.timeseries_utils import TimeseriesStore
+from weathergov.app.constants import CHART_RANGES_DAYS
 from weathergov.app.viz import (get_ts_figure,
                                 get_ts_figure_polar,
                                 get_default_figure,
                                 get_temperature_ts_figure,
-                                get_map)
+                                get_map,
+                                get_map_state,
+                                get_map_view,
+                                get_map_patch,
+                                get_colorbar_range,
+                                get_stations_fingerprint)
 from weathergov.utils.logging_utils import init_logger
+from weathergov.utils.spatial_utils import get_viewport
 
 
 logger = logging.getLogger(__name__)
@@ -32,6 +40,7 @@ app = Dash(
     add_log_handler=logger
 )
 app.rc = None
+app.ts_store = None
 
 
 @callback(
@@ -46,12 +55,16 @@ app.rc = None
     Output(Components.get_collapse_graph_id("wind speed"), "figure"),
     Output(Components.get_collapse_graph_id("wind direction"), "figure"),
     Output(Components.get_collapse_graph_id("Humidity"), "figure"),
-    Input(Components.GraphMap, 'clickData'))
-def display_click_data(click_data):
+    Input(Components.GraphMap, 'clickData'),
+    Input(Components.RadioChartRange, 'value'),
+    Input(Components.StoreChartWidth, 'data'))
+def display_click_data(click_data, chart_range, chart_width):
     """
         When we click the data we 100% sure that the data is present on the map,
         and before adding it to the map, we save it to the app!
     :param click_data:
+    :param chart_range: One of CHART_RANGES_DAYS
+    :param chart_width: Width of the charts in the browser in pixels, if known
     :return:
     """
     if click_data is None:
@@ -62,6 +75,10 @@ def display_click_data(click_data):
 
     point = click_data['points'][0]
 
+    if not point['customdata'][1]:
+        # Clusters of stations have no station ID
+        return no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update
+
     elevation_units = point['customdata'][5]
     elevation_units = elevation_units.split(":")[-1]
 
@@ -92,11 +109,12 @@ def display_click_data(click_data):
     time_zone = point['customdata'][3]
     ts_now = int(time() * 1000)
 
-    # Get 1 week of temperature data for selected station by station iD
-    data = app.rc.get_timeseries_data_multi(
+    # Get the data of the selected time range for selected station by station iD. Data
+    # older than Redis keeps is read from the dumps
+    data = app.ts_store.get_timeseries_data_multi(
         station_id=station_id,
         data_keywords=["temperature", "barometric_pressure", "wind_speed", "wind_direction", "relative_humidity"],
-        ts_from=ts_now - 24 * 3600 * 1000 * 7,
+        ts_from=ts_now - 24 * 3600 * 1000 * CHART_RANGES_DAYS[chart_range],
         ts_to=ts_now
     )
 
@@ -110,14 +128,32 @@ def display_click_data(click_data):
                 active=True
             ),
             f"{point['customdata'][2]} {elevation_units}",
-            get_temperature_ts_figure(x=data['temperature'][0], y=data['temperature'][1], tz=time_zone),
-            get_ts_figure(x=data['barometric_pressure'][0], y=data['barometric_pressure'][1]),
-            get_ts_figure(x=data['wind_speed'][0], y=data['wind_speed'][1]),
-            get_ts_figure_polar(r=data['wind_direction'][0], direction=data['wind_direction'][1]),
-            get_ts_figure(x=data['relative_humidity'][0], y=data['relative_humidity'][1]),
+            get_temperature_ts_figure(x=data['temperature'][0], y=data['temperature'][1], tz=time_zone,
+                                      width_px=chart_width),
+            get_ts_figure(x=data['barometric_pressure'][0], y=data['barometric_pressure'][1], tz=time_zone,
+                          width_px=chart_width),
+            get_ts_figure(x=data['wind_speed'][0], y=data['wind_speed'][1], tz=time_zone, width_px=chart_width),
+            get_ts_figure_polar(r=data['wind_direction'][0], direction=data['wind_direction'][1],
+                                width_px=chart_width),
+            get_ts_figure(x=data['relative_humidity'][0], y=data['relative_humidity'][1], tz=time_zone,
+                          width_px=chart_width),
             )
 
 
+# The charts are downsampled to their width, which is known only in the browser. It is
+# measured on every click, before the charts of the clicked station are requested
+app.clientside_callback(
+    f"""
+    function(clickData) {{
+        const pane = document.getElementById("{Components.ChartPane.value}");
+        return pane ? pane.clientWidth : null;
+    }}
+    """,
+    Output(Components.StoreChartWidth, 'data'),
+    Input(Components.GraphMap, 'clickData'),
+)
+
+
 # Current order: [
 #         "Temperature",
 #         "Pressure",
@@ -180,16 +216,30 @@ def toggle_collapse(n1, n2, n3, n4, n5, is_open_1, is_open_2, is_open_3, is_open
     Output(Components.DDMenuItemBarPressure, "n_clicks"),
     Output(Components.DDMenuItemWindSpeed, "n_clicks"),
     Output(Components.DDMenuItemHumidity, "n_clicks"),
-    Output(Components.GraphMap, "figure"),
+    Output(Components.GraphMap, "figure", allow_duplicate=True),
+    Output(Components.StoreMapState, "data", allow_duplicate=True),
     Input(Components.DDMenuItemTemperature, "n_clicks"),
     Input(Components.DDMenuItemBarPressure, "n_clicks"),
     Input(Components.DDMenuItemWindSpeed, "n_clicks"),
     Input(Components.DDMenuItemHumidity, "n_clicks"),
+    Input(Components.IntervalMapRefresh, "n_intervals"),
+    State(Components.StoreMapState, "data"),
     config_prevent_initial_callbacks=True
 )
-def update_map_color_scheme(n1, n2, n3, n4):
+def update_map_color_scheme(n1, n2, n3, n4, n_intervals, map_state):
+    """
+        Recolor the map when another metric is selected, or when a new stations snapshot
+        is published
+    """
+    map_state = map_state or dict()
+
+    if ctx.triggered_id == Components.IntervalMapRefresh:
+        label = Metrics(map_state.get("metric", Metrics.Temperature))
 
-    if n1 > 0:
+        if app.rc.get_stations_snapshot_version() == map_state.get("version"):
+            # Nothing new since the map was drawn
+            return no_update, no_update, no_update, no_update, no_update, no_update, no_update
+    elif n1 > 0:
         label = Metrics.Temperature
     elif n2 > 0:
         label = Metrics.BarometricPressure
@@ -200,16 +250,79 @@ def update_map_color_scheme(n1, n2, n3, n4):
     else:
         label = Metrics.Temperature
 
-    fig = get_map(app, coloring_parameter=label)
-    logger.info(f"New map have been created with label={label}")
+    fig, map_state = update_map(map_state, label)
+    return label, 0, 0, 0, 0, fig, map_state
+
+
+@callback(
+    Output(Components.GraphMap, "figure"),
+    Output(Components.StoreMapState, "data"),
+    Input(Components.GraphMap, "id"),
+)
+def load_map(_):
+    """
+        Replace the empty map of a new page with the stations map
+    """
+    fig = get_map(app)
+    return fig, get_map_state(fig, Metrics.Temperature)
+
+
+@callback(
+    Output(Components.GraphMap, "figure", allow_duplicate=True),
+    Output(Components.StoreMapState, "data", allow_duplicate=True),
+    Input(Components.GraphMap, "relayoutData"),
+    State(Components.StoreMapState, "data"),
+    prevent_initial_call=True
+)
+def update_map_viewport(relayout_data, map_state):
+    """
+        Show the stations inside the visible part of the map when it is zoomed or moved
+    """
+    viewport = get_viewport(relayout_data)
+
+    if viewport is None:
+        return no_update, no_update
+
+    map_state = map_state or dict()
+    return update_map(map_state, Metrics(map_state.get("metric", Metrics.Temperature)), viewport)
+
+
+def update_map(map_state: dict, label: Metrics, viewport: dict = None) -> (object, dict):
+    """
+        Get an update of the map in the browser for the coloring metric and viewport. If
+        the stations on the map stay the same, only the colors and values are sent to
+        the browser, otherwise the stations as well.
+    """
+    viewport = viewport or map_state.get("viewport")
+
+    version, df, index = app.rc.get_stations_index()
+    if df is None:
+        df = app.rc.get_observation_stations_info()
+
+    view = get_map_view(df, viewport, index)
+    fingerprint = get_stations_fingerprint(view)
+
+    markers_only = map_state.get("stations") == fingerprint
+    fig = get_map_patch(view,
+                        coloring_parameter=label,
+                        value_range=get_colorbar_range(df, label),
+                        markers_only=markers_only)
 
-    return label, 0, 0, 0, 0, fig
+    logger.info(f"Map have been updated with label={label}: {len(view)} points, markers_only={markers_only}")
+    return fig, {
+        **map_state,
+        "metric": str(label),
+        "stations": fingerprint,
+        "version": version,
+        "viewport": viewport,
+    }
 
 
 def main():
     init_logger("weathergov")
     app.rc = RedisClient()
-    app.layout = get_layout(app)
+    app.ts_store = TimeseriesStore(app.rc)
+    app.layout = get_layout
 
 
 if __name__ == "__main__":
@@ -12,9 +12,79 @@ APP_NAME = "Weather:a2e2dfa19d6c45d6a92860933322c847"
 
 MISSING_VALUE = -99911999
 
+# Range of the values that are real observations. Everything below the minimum
+# is a MISSING_VALUE sentinel written by the old versions of the loader.
+MIN_VALID_VALUE = -99911990
+MAX_VALID_VALUE = 10 ** 12
+
 # TS_DATA_UPDATE_PERIOD = 3600 * 24 * 6
 TS_DATA_UPDATE_PERIOD_SECONDS = 3600 * 24 * 4
 
+# How many observation requests the historical loader keeps in flight
+# at the same time. Can be overridden with --concurrency argument.
+# bench_async_fetcher.py: 56 stations/s with 4 requests in flight, 36.8 with 16
+HISTORICAL_LOADER_CONCURRENCY = 4
+
+# How many stations the historical loader collects before writing
+# them to Redis in a single round trip
+INGEST_BATCH_SIZE = 16
+
+# How many stations the historical loader saves between publishing a new
+# stations snapshot for the map. It is published at the end of a run as well.
+SNAPSHOT_PUBLISH_EVERY_STATIONS = 2000
+
+# Settings of the HTTP client used for all weather.gov calls. The connection
+# pool must not be smaller than the number of requests in flight.
+HTTP_POOL_MAXSIZE = 32
+HTTP_MAX_RETRIES = 5
+HTTP_BACKOFF_BASE_SECONDS = 0.5
+HTTP_BACKOFF_MAX_SECONDS = 60
+HTTP_TIMEOUT_SECONDS = 30
+
+
+# Settings of the observation timeseries. Samples older than the retention period
+# are trimmed by Redis itself, so it must be longer than the period between monthly
+# data dumps. Chunk size is in bytes, must be a multiple of 8 in [48 .. 1048576].
+TS_RETENTION_MS = 62 * 24 * 3600 * 1000
+TS_CHUNK_SIZE = 4096
+
+# Compaction series of every metric timeseries: bucket size in milliseconds and
+# how long the compacted samples are kept (0 means forever). They outlive raw samples.
+TS_COMPACTIONS = {
+    3600 * 1000: 400 * 24 * 3600 * 1000,
+    24 * 3600 * 1000: 0,
+}
+TS_COMPACTION_AGGREGATIONS = ("avg", "min", "max")
+# Compaction series get at most one sample an hour, while there are six of them for
+# every raw series, so they use much smaller chunks than the raw ones
+TS_COMPACTION_CHUNK_SIZE = 256
+
+# Time ranges up to this length are read from raw samples. Longer ones are read
+# from the finest compaction that gives at most TS_MAX_POINTS_PER_QUERY points.
+TS_RAW_MAX_SPAN_MS = 8 * 24 * 3600 * 1000
+TS_MAX_POINTS_PER_QUERY = 2500
+
+# How long the web app keeps a map figure in Redis. Figures are cached per stations
+# snapshot version, so the ones of the old versions are not used and just expire.
+MAP_FIGURE_CACHE_TTL_SECONDS = 6 * 3600
+
+# Rows per row group of the dumped observations Parquet files
+DUMP_ROW_GROUP_SIZE = 1_000_000
+
+# Stations per TS.MRANGE query of the data dumper. A month of raw samples of
+# 500 stations is a few hundred thousand samples in a reply.
+DUMP_MRANGE_STATIONS_PER_QUERY = 500
+
+# The monthly dump of every metric is split into shards by a hash of station ID, and
+# shards are dumped by a pool of processes. Changing the number of buckets in the
+# middle of a month makes the dumper start that month over.
+DUMP_STATION_BUCKETS = 8
+DUMP_MAX_WORKERS = 4
+
+# The data cleaner warns when the raw samples of a month that is not dumped completely
+# are going to be trimmed by Redis within this many days
+CLEANER_WARN_DAYS = 7
+
 
 class Environment(Enum):
     LOCAL = "Local"
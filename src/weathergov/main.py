@@ -2,7 +2,7 @@ import argparse
 
 from dotenv import load_dotenv
 
-from weathergov.constants import Environment
+from weathergov.constants import Environment, HISTORICAL_LOADER_CONCURRENCY
 from weathergov.scripts.loaders import (observation_station_loader,
                                         historical_data_loader,
                                         rt_data_loader)
@@ -19,13 +19,13 @@ from weathergov.scripts.data_dumper import start_data_dumper
 """
 
 
-def main(script_name: str, worker_id: int, env: Environment):
+def main(script_name: str, worker_id: int, env: Environment, concurrency: int):
     if script_name == "ObservationStationsLoader":
         logger.info(f"ObservationStationsLoader is running")
         observation_station_loader()
     elif script_name == "HistoricalDataLoader":
         logger.info(f"HistoricalDataLoader is running")
-        historical_data_loader(env=env, worker_id=worker_id)
+        historical_data_loader(env=env, worker_id=worker_id, concurrency=concurrency)
     elif script_name == "RTDataLoader":
         logger.info(f"RTDataLoader is running")
         rt_data_loader()
@@ -53,6 +53,10 @@ if __name__ == "__main__":
     # We plan to run multiple workers to process data in parallel, and therefore
     # need different worker IDs to differentiate the workers.
     parser.add_argument("-w", "--worker-id", default=0, type=int)
+    #
+    # How many requests to weather.gov each historical data loader worker
+    # keeps in flight at the same time.
+    parser.add_argument("-c", "--concurrency", default=HISTORICAL_LOADER_CONCURRENCY, type=int)
 
     args = parser.parse_args()
 
@@ -72,4 +76,5 @@ if __name__ == "__main__":
 
     main(script_name=args.script,
          worker_id=args.worker_id,
-         env=env_)
+         env=env_,
+         concurrency=args.concurrency)
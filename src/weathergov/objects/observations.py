@@ -0,0 +1,59 @@
+import typing
+import numpy as np
+
+from weathergov.constants import Metrics, MISSING_VALUE
+from weathergov.utils.time_utils import iso_to_epoch_ms
+
+
+class ObservationBatch:
+    """
+        Observations of a single station in columnar form:
+        - timestamps: int64 array of unix timestamps in milliseconds, sorted in ascending order
+        - values: float64 array for every member of Metrics, missing values are NaN
+
+        This is what get_station_data() returns and what RedisClient.add_timeseries_data()
+        writes to Redis.
+    """
+
+    def __init__(self, timestamps: np.ndarray, values: typing.Dict[Metrics, np.ndarray]):
+        self.timestamps = timestamps
+        self.values = values
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @staticmethod
+    def empty() -> "ObservationBatch":
+        return ObservationBatch(
+            timestamps=np.empty(0, dtype=np.int64),
+            values={metric: np.empty(0, dtype=np.float64) for metric in Metrics}
+        )
+
+    @staticmethod
+    def from_dict(data: dict) -> "ObservationBatch":
+        """
+            Build a batch from the old dict of lists format, where "timestamp" is a list of
+            ISO-8601 strings and missing values are set to MISSING_VALUE.
+        """
+        timestamps = iso_to_epoch_ms(data['timestamp'])
+
+        values = dict()
+        for metric in Metrics:
+            try:
+                column = np.asarray(data[metric], dtype=np.float64)
+            except KeyError:
+                column = np.full(len(timestamps), np.nan)
+
+            column[column == MISSING_VALUE] = np.nan
+            values[metric] = column
+
+        order = np.argsort(timestamps, kind="stable")
+        return ObservationBatch(timestamps[order], {metric: column[order] for metric, column in values.items()})
+
+    def newer_than(self, ts: int) -> "ObservationBatch":
+        """
+            Keep the observations with timestamp (ms) greater than `ts`
+        """
+        # Timestamps are sorted, therefore all the new observations are in the tail
+        i = np.searchsorted(self.timestamps, ts, side="right")
+        return ObservationBatch(self.timestamps[i:], {metric: column[i:] for metric, column in self.values.items()})
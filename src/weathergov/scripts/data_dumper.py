@@ -1,14 +1,20 @@
 import logging
 import itertools
 import os
-
-import pandas as pd
-
-from time import sleep, time
-from datetime import datetime, timedelta
-
-from weathergov.constants import Metrics
+import zlib
+
+from time import sleep, time, perf_counter
+from datetime import datetime, timedelta, timezone
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from weathergov.constants import (Metrics,
+                                  DUMP_STATION_BUCKETS,
+                                  DUMP_MAX_WORKERS,
+                                  TS_RETENTION_MS,
+                                  CLEANER_WARN_DAYS)
 from weathergov.utils.redis_utils import RedisClient
+from weathergov.utils.parquet_utils import DatasetPartitionWriter, get_partition_dir
 
 
 """
@@ -28,13 +34,13 @@ from weathergov.utils.redis_utils import RedisClient
 logger = logging.getLogger(__name__)
 
 
-def start_data_dumper():
+def start_data_dumper(max_workers: int = DUMP_MAX_WORKERS):
 
     while True:
         # - Create a data dump
-        data_dumper()
+        data_dumper(max_workers=max_workers)
 
-        # Remove data weekly
+        # Redis trims old samples itself, check that they are dumped before
         data_cleaner()
 
         # - Remove the data that can be removed
@@ -43,142 +49,217 @@ def start_data_dumper():
         sleep(3600 * 24)
 
 
-def data_dumper():
-    # First of all check if the dump have been done this month already. For that,
-    # we are going to check specific key in Redis that has the time when each station data was
-    # dumped. To be specific
+def get_station_bucket(station_id: str, n_buckets: int = DUMP_STATION_BUCKETS) -> int:
+    """
+        Bucket of a station in the sharded data dump. Unlike hash(), CRC32 of a
+        string is the same in every process.
+    """
+    return zlib.crc32(station_id.encode()) % n_buckets
 
-    rc = RedisClient()
 
-    station_ids = rc.get_all_station_ids()
-    logger.info(f"Going to dump data for {len(station_ids)} stations")
+def _get_dump_dates() -> (datetime, datetime):
+    """
+    :return: The first day of the current month and a day of the previous month in UTC
+    """
+    current_date = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    previous_date = current_date - timedelta(days=10)
+    return current_date, previous_date
 
-    # A dictionary with all the keys and all the updates
-    station_updates = rc.get_weather_station_last_data_dump_ts_all()
 
-    # Current datetime in UTC
-    current_date = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    current_date_str = current_date.strftime("%Y%m")
+def get_month_time_range(date: datetime) -> (int, int):
+    """
+        Unix timestamps in milliseconds of the start of the UTC month of the date and
+        of the start of the next month. They do not depend on the local time zone.
+    """
+    month_start = datetime(date.year, date.month, 1, tzinfo=timezone.utc)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+    return int(month_start.timestamp() * 1000), int(next_month_start.timestamp() * 1000)
 
-    # Previous month and year
-    previous_date = current_date - timedelta(days=10)
 
-    for station_id, metric in itertools.product(station_ids, Metrics):
-        # Check if we have already updated that station
-        try:
-            last_update = station_updates[f"{station_id}:{metric}"]
-        except KeyError:
-            last_update = 0
-
-        # Convert the last update to datetime in UTC tz
-        last_update_date = datetime.fromtimestamp(last_update)
-
-        # Check if the station was updated in THIS month, if yes, then skip
-        # Notice that we must check only Year and Month, but not day as we don't
-        # relly care what day is today.
-        last_update_date_str = last_update_date.strftime("%Y%m")
-
-        if last_update_date_str == current_date_str:
-            # This means that we have made data dump for the selected station and metric this month
-            logger.info(f"Station {station_id}:{metric} for previous month has been dumped already")
-            continue
-
-        if last_update_date.day == 1:
-            logger.info(f"Station {station_id}:{metric} should not be updated on the first day of a month")
-            continue
-
-        # If we reach this line, this means that we have not made a data dump for this month, therefore,
-        # let's do it! First, we must get the UTC timestamps for previous month
-        dt_from = datetime(previous_date.year, previous_date.month, 1, 0, 0, 0)
-        dt_to = current_date
-
-        ts_from = int(dt_from.timestamp() * 1000)
-        ts_to = int(dt_to.timestamp() * 1000)
-
-        # Get timeseries data for 1 month
-        x, y = rc.get_timeseries_data(
-            station_id=station_id,
-            data_keyword=metric,
-            ts_from=ts_from,
-            ts_to=ts_to
-        )
-
-        # Save data locally, going to save to S3 in the future
-        df = pd.DataFrame({"timestamp": x, "value": y})
-        df.to_parquet(
-            os.path.join(
-                f"{os.environ.get('DUMP_DATA_DIR', '.')}",
-                f"{station_id}-{metric}-{previous_date.strftime('%Y-%m')}.parquet"),
-            index=False
-        )
-        logger.info(f"Successfully dumped {metric} data for station {station_id} to a file "
-                    f"for {previous_date.strftime('%Y-%m')}")
-
-        # Update info in Redis that the data was dumped
-        rc.set_weather_station_last_data_dump_ts(
-            station_id=station_id,
-            metric=metric,
-            ts=int(time() * 1000)
-        )
-        logger.info(f"Last dump ts updated in Redis for station_id={station_id} and metric={metric}")
-
-    # Second, make sure that the data dump is made not earlier than the 2nd day of a month
-    pass
+def get_shard_part_name(bucket: int) -> str:
+    """
+        Name of the file of a shard. A shard dumped again gets the same name, so the
+        file replaces the one written before.
+    """
+    return f"part-{bucket}"
 
 
-def data_cleaner():
+def get_stations_hash(station_ids: list) -> str:
+    """
+        Checksum of a sorted list of station IDs, so the manifest does not keep the
+        lists themselves
+    """
+    checksum = zlib.crc32("\n".join(station_ids).encode())
+    return f"{checksum:08x}"
+
+
+def dump_shard(metric: Metrics,
+               bucket: int,
+               station_ids: list,
+               month: str,
+               ts_from: int,
+               ts_to: int,
+               dump_dir: str,
+               shard: dict = None) -> dict:
     """
-        This one should do the following:
-        - If day of a month is greater than 8, then we remove all
-          the data from Redis up to the last day of a previous month
+        Dump raw samples of a metric of the stations of one bucket to the file of the
+        shard in the month partition, and record the shard in the month manifest. Runs
+        in a worker process, so it makes its own Redis connection.
 
-        - Also, we do it only if the data have been saved this month already
+        The manifest entry has the count and the hash of the bucket stations the shard
+        was dumped for, and of the stations that had samples in the month. If stations
+        are added to the bucket, the whole shard is dumped again and its file replaced.
+
+    :param station_ids: Sorted IDs of the stations of the bucket
+    :param shard: Manifest entry of the shard, if it has been dumped before
+    :return: Shard info saved in the manifest
+    """
+    rc = RedisClient()
+    t_ = perf_counter()
+
+    dumped = []
+    partition_dir = get_partition_dir(dump_dir, metric, month)
+    with DatasetPartitionWriter(partition_dir, name=get_shard_part_name(bucket)) as writer:
+        # Raw samples of many stations are read with a single TS.MRANGE, not one key at a time
+        for station_id, x, y in rc.get_timeseries_data_bulk(metric=metric,
+                                                            station_ids=station_ids,
+                                                            ts_from=ts_from,
+                                                            ts_to=ts_to):
+            # Save data locally, going to save to S3 in the future
+            writer.write(station_id, x, y)
+            dumped.append(station_id)
+
+    # Files of the shard written before that the new one has not replaced, like the
+    # file of a shard that has no samples now
+    paths = [writer.path] if writer.n_rows > 0 else []
+    for path in set((shard or dict()).get("paths", []) + [writer.path]).difference(paths):
+        if os.path.exists(path):
+            os.remove(path)
+
+    # The shard is recorded as done only when the file with its data is saved. Only the
+    # stations that had samples are counted as dumped.
+    dumped = sorted(set(dumped))
+    info = {
+        "n_bucket_stations": len(station_ids),
+        "bucket_hash": get_stations_hash(station_ids),
+        "n_stations": len(dumped),
+        "stations_hash": get_stations_hash(dumped),
+        "n_samples": writer.n_rows,
+        "paths": paths,
+        "ts": int(time() * 1000),
+        "duration": round(perf_counter() - t_, 3),
+    }
+    rc.set_data_dump_manifest_shard(month=month, metric=metric, bucket=bucket, info=info)
+    return info
+
+
+def data_dumper(max_workers: int = DUMP_MAX_WORKERS):
     """
+        Save raw samples of the previous month to a Parquet dataset. The work is split
+        into shards, one per metric and bucket of stations, that are dumped in a pool of
+        processes. Every shard that is done is recorded in the manifest of the month with
+        the hash of the stations of its bucket, so an interrupted dump continues with the
+        shards that are left, and the shards of the buckets that got new stations since
+        are dumped again by the next run.
+    """
+    # The last observations of a month may still be coming on its next day
+    if datetime.now(timezone.utc).day == 1:
+        logger.info(f"Data should not be dumped on the first day of a month")
+        return
+
     rc = RedisClient()
 
+    current_date, previous_date = _get_dump_dates()
+    month = previous_date.strftime('%Y-%m')
+
+    manifest = rc.get_data_dump_manifest(month)
     station_ids = rc.get_all_station_ids()
-    logger.info(f"Going to dump data for {len(station_ids)} stations")
 
-    # A dictionary with all the keys and all the updates
-    station_updates = rc.get_weather_station_last_data_dump_ts_all()
+    buckets = defaultdict(list)
+    # Stations are sorted, so the station_id statistics of the row groups of the dumped
+    # files let readers skip the row groups without the station they are looking for
+    for station_id in sorted(station_ids):
+        buckets[get_station_bucket(station_id)].append(station_id)
+
+    # Shards that have not been dumped, or have been dumped for other stations. Empty
+    # buckets are dumped too, so every shard of a finished dump is in the manifest.
+    bucket_hashes = {bucket: get_stations_hash(buckets[bucket]) for bucket in range(DUMP_STATION_BUCKETS)}
+    shards = [(metric, bucket)
+              for metric, bucket in itertools.product(Metrics, range(DUMP_STATION_BUCKETS))
+              if manifest.get(f"{metric}:{bucket}", dict()).get("bucket_hash") != bucket_hashes[bucket]]
+
+    if len(shards) == 0:
+        logger.info(f"Data for {month} has been dumped already")
+        return
+
+    logger.info(f"Going to dump data for {len(station_ids)} stations for {month}, "
+                f"{len(shards)} shards are left")
 
-    # Current datetime in UTC
-    current_date = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    current_date_str = current_date.strftime("%Y%m")
+    ts_from, ts_to = get_month_time_range(previous_date)
 
-    # Previous month and year
-    # previous_date = current_date - timedelta(days=10)
+    dump_dir = os.environ.get('DUMP_DATA_DIR', '.')
 
-    for station_id, metric in itertools.product(station_ids, Metrics):
-        # Check if we have already updated that station
-        try:
-            last_update = station_updates[f"{station_id}:{metric}"]
-        except KeyError:
-            logger.info(f"Data for station={station_id} and metric={metric} have never been saved before")
-            continue
+    t_ = perf_counter()
+    n_samples = 0
 
-        # Convert the last update to datetime in UTC tz
-        last_update_date = datetime.fromtimestamp(last_update)
+    # Data of every shard goes to its own file of a dataset partitioned like
+    # "metric=temperature/month=2024-07"
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(dump_shard, metric, bucket, buckets[bucket], month, ts_from, ts_to, dump_dir,
+                            manifest.get(f"{metric}:{bucket}")): (metric, bucket)
+            for metric, bucket in shards
+        }
 
-        # Check if the station was updated in THIS month, if yes, then skip
-        # Notice that we must check only Year and Month, but not day as we don't
-        # relly care what day is today.
-        last_update_date_str = last_update_date.strftime("%Y%m")
+        for future in as_completed(futures):
+            metric, bucket = futures[future]
+
+            try:
+                info = future.result()
+            except Exception as e:
+                # The shard is not in the manifest, so the next run tries it again
+                logger.error(f"Failed to dump {metric} data of bucket {bucket} for {month}: {e}")
+                continue
+
+            n_samples += info["n_samples"]
+            logger.info(f"Successfully dumped {metric} data of {info['n_stations']} of {info['n_bucket_stations']} "
+                        f"stations of bucket {bucket} for {month} in {info['duration']:.1f} seconds")
+
+    duration = perf_counter() - t_
+    logger.info(f"Dumped {n_samples} samples for {month} in {duration:.1f} seconds "
+                f"({n_samples / max(duration, 1e-9):.0f} samples/s)")
+
+
+def data_cleaner():
+    """
+        Samples are not removed from Redis one range at a time: TS.DEL would delete them
+        from the compaction series as well, which keep much longer history than the raw
+        ones. Every raw series has TS_RETENTION_MS retention instead, set when it is
+        created and whenever the stations are updated (see create_timeseries_schema()),
+        and Redis trims older samples itself as new ones are added.
+
+        The retention is longer than a month, so samples of the previous month are kept
+        until its dump is done. This checks how much of the dump is done, and warns if
+        the samples of the shards that are left are going to be trimmed soon.
+    """
+    rc = RedisClient()
 
-        if last_update_date_str != current_date_str:
-            # This means that we have made data dump for the selected station and metric this month
-            # This means that the data for the previous month can be removed
-            logger.info(f"Station {station_id}:{metric} for previous month has been dumped already")
-            continue
+    _, previous_date = _get_dump_dates()
+    month = previous_date.strftime('%Y-%m')
 
-        if datetime.utcnow().day < 8:
-            logger.info(f"Station {station_id}:{metric} data should not be removed in the first week of a month")
-            continue
+    manifest = rc.get_data_dump_manifest(month)
+    n_shards = len(Metrics) * DUMP_STATION_BUCKETS
+    n_samples = sum(shard.get("n_samples", 0) for shard in manifest.values())
 
-        logger.info(f"We can remove data for the previous month up to {current_date - timedelta(days=1)}")
+    # Samples of the first day of the month are trimmed first
+    ts_from, _ = get_month_time_range(previous_date)
+    trim_date = datetime.fromtimestamp((ts_from + TS_RETENTION_MS) / 1000, tz=timezone.utc)
+    days_left = (trim_date - datetime.now(timezone.utc)).total_seconds() / (24 * 3600)
 
-        # Convert the data_to to unix timestamp in milliseconds
-        ts_to = int(current_date.timestamp() * 1000)
+    logger.info(f"{len(manifest)} of {n_shards} shards of {month} are dumped with {n_samples} samples. Redis "
+                f"trims the samples of {month} from {trim_date:%Y-%m-%d}, it uses "
+                f"{rc.get_used_memory() / 2 ** 20:.1f} MB of memory")
 
-        # Let's truncate the timeseries
-        rc.remove_timeseries_data(station_id=station_id, metric=metric, ts_from="-", ts_to=ts_to)
+    if len(manifest) < n_shards and days_left < CLEANER_WARN_DAYS:
+        logger.warning(f"{n_shards - len(manifest)} shards of {month} are not dumped, and Redis trims their "
+                       f"samples in {max(days_left, 0):.1f} days")
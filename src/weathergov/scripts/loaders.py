@@ -1,14 +1,22 @@
 import json
 import pytz
 import random
+import asyncio
 import logging
 
 from time import time, sleep
 from datetime import datetime
 
-from weathergov.constants import Environment, TS_DATA_UPDATE_PERIOD_SECONDS
+from weathergov.constants import (Environment,
+                                  TS_DATA_UPDATE_PERIOD_SECONDS,
+                                  HISTORICAL_LOADER_CONCURRENCY,
+                                  INGEST_BATCH_SIZE,
+                                  SNAPSHOT_PUBLISH_EVERY_STATIONS)
+from weathergov.utils.http_utils import get_client, get_request_url, ResponseValidatorCache
 from weathergov.utils.redis_utils import RedisClient
-from weathergov.utils.stations_utils import get_all_stations, get_station_data
+from weathergov.utils.stations_utils import (get_all_stations,
+                                             get_station_data_request,
+                                             fetch_station_data_concurrently)
 
 
 logger = logging.getLogger(__name__)
@@ -35,9 +43,10 @@ def observation_station_loader():
 
     # TODO Update the timestamp when the station info was updated
     logger.info(f"Stations were updated within {(time() - t_) / 60:.1f} minutes")
+    get_client().stats.log_summary()
 
 
-def historical_data_loader(env: Environment, worker_id: int):
+def historical_data_loader(env: Environment, worker_id: int, concurrency: int = HISTORICAL_LOADER_CONCURRENCY):
     """
         The goal of this loader is to load historical data. If we try to get
         observations from a station we will get only 1 week of data. But there is
@@ -63,6 +72,8 @@ def historical_data_loader(env: Environment, worker_id: int):
             4. Note that if we run this in AWS we are going to run this job weekly, and therefore must exit
                when finished. While if we run it locally in my PC this must live in docker env and run forever.
                The difference is going to be determined by env parameter
+
+        Each worker keeps `concurrency` requests to weather.gov in flight at once.
     :return:
     """
 
@@ -72,19 +83,19 @@ def historical_data_loader(env: Environment, worker_id: int):
         #   I don't want to run the code in AWS until I get something feasible.
         while True:
             # Run the consumption in infinite loop
-            consume_historical_data(env=env, worker_id=worker_id)
+            consume_historical_data(env=env, worker_id=worker_id, concurrency=concurrency)
 
             # Sleep for 3 hours
             sleep(3600 * 3)
     elif env is Environment.AWS:
         # In AWS environment we are going to exit automatically if we use
         # scheduled job. Therefore, no need to do any additional steps.
-        consume_historical_data(env=env, worker_id=worker_id)
+        consume_historical_data(env=env, worker_id=worker_id, concurrency=concurrency)
     else:
         logger.warning(f"Unknown environment: {env}")
 
 
-def consume_historical_data(env: Environment, worker_id: int):
+def consume_historical_data(env: Environment, worker_id: int, concurrency: int = HISTORICAL_LOADER_CONCURRENCY):
     t_ = time()
 
     rc = RedisClient()
@@ -117,13 +128,41 @@ def consume_historical_data(env: Environment, worker_id: int):
 
     # Start consuming from weather stations queue and process each station individually.
     # This must be performed on every worker! If queue ie empty, then there is nothing to
-    # do and can exit.
+    # do and can exit. Requests to weather.gov run concurrently, while the results are
+    # saved to Redis one by one as soon as they arrive.
+    validator_cache = ResponseValidatorCache(store=rc)
+    n_stations = asyncio.run(_consume_station_queue(rc=rc,
+                                                    concurrency=concurrency,
+                                                    validator_cache=validator_cache))
+
+    # Let the map see the last stations processed by this worker
+    rc.publish_stations_snapshot()
+
+    # Update the time when calculations have finished
+    if worker_id == 0:
+        # Technically, this is redundant check because we can update from
+        # all the workers without any issues. However, lets update only once.
+        rc.set_station_data_populated_last_time_ts(int(time()))
+
+    dt = time() - t_
+    logger.info(f"Data population took {dt / 3600:.1f} hours: {n_stations} stations processed "
+                f"at {n_stations / max(dt, 1e-9):.2f} stations/second")
+    get_client().stats.log_summary()
+    validator_cache.log_summary()
+    rc.ingest_stats.log_summary()
+
+
+def _iter_queued_station_ids(rc: RedisClient, watermarks: dict):
+    """
+        Pop station IDs from the weather stations queue until it gets empty.
+        The newest timestamp stored for each station is saved to `watermarks`.
+    """
     while True:
         payload_str = rc.get_station_id_from_queue()
 
         if payload_str is None:
             # Reached the end of a queue
-            break
+            return
 
         # If payload is not None, then try to unpack it
         payload = json.loads(payload_str)
@@ -131,20 +170,74 @@ def consume_historical_data(env: Environment, worker_id: int):
         # We may use different processing functions based on
         # the source, but right now we have only one source: weather.gov
         station_id = payload['station_id']
+        watermarks[station_id] = rc.get_station_watermark(station_id=station_id)
 
-        # Get the data from
-        data = get_station_data(station_id=station_id)
+        yield station_id
 
-        # Save data to Redis timeseries
-        rc.add_timeseries_data(station_id=station_id, data=data)
 
-    # Update the time when calculations have finished
-    if worker_id == 0:
-        # Technically, this is redundant check because we can update from
-        # all the workers without any issues. However, lets update only once.
-        rc.set_station_data_populated_last_time_ts(int(time()))
+async def _consume_station_queue(rc: RedisClient,
+                                 concurrency: int,
+                                 validator_cache: ResponseValidatorCache = None) -> int:
+    n_stations = 0
+
+    # Station ID -> the newest timestamp we have for the station. Only newer
+    # observations are requested from the API and saved to Redis.
+    watermarks = dict()
+
+    # Station ID -> observations waiting to be saved to Redis
+    batches = dict()
+
+    async for station_id, data in fetch_station_data_concurrently(_iter_queued_station_ids(rc, watermarks),
+                                                                  concurrency=concurrency,
+                                                                  watermarks=watermarks,
+                                                                  validator_cache=validator_cache):
+        n_stations += 1
+
+        if data is None:
+            # Nothing has changed since the previous request
+            watermarks.pop(station_id, None)
+            continue
+
+        batches[station_id] = data
+
+        if len(batches) >= INGEST_BATCH_SIZE:
+            _save_batches(rc, batches, watermarks, validator_cache)
+
+        if n_stations % SNAPSHOT_PUBLISH_EVERY_STATIONS == 0:
+            rc.publish_stations_snapshot()
+
+    # Save whatever is left
+    _save_batches(rc, batches, watermarks, validator_cache)
+
+    return n_stations
+
+
+def _save_batches(rc: RedisClient,
+                  batches: dict,
+                  watermarks: dict,
+                  validator_cache: ResponseValidatorCache = None):
+    """
+        Save the collected observations to Redis timeseries in one round trip
+        and forget about these stations. Validators of the responses are saved
+        only for the stations whose data is all stored, so the data of a failed
+        write is downloaded again.
+    """
+    if len(batches) == 0:
+        return
+
+    watermarks = {station_id: watermarks.pop(station_id, 0) for station_id in batches}
+    complete = rc.add_timeseries_data_bulk(batches=batches, watermarks=watermarks)
+
+    if validator_cache is not None:
+        for station_id in batches:
+            url = get_request_url(*get_station_data_request(station_id, watermarks[station_id]))
+
+            if station_id in complete:
+                validator_cache.commit(url)
+            else:
+                validator_cache.discard(url)
 
-    logger.info(f"Data population took {(time() - t_) / 3600:.1f} hours")
+    batches.clear()
 
 
 def rt_data_loader():
@@ -0,0 +1,82 @@
+import numpy as np
+
+
+def _get_bucket_starts(n: int, n_buckets: int, offset: int = 0) -> np.ndarray:
+    """
+        Start index of every one of `n_buckets` buckets of about the same size
+        that split `n` points following `offset` points
+    """
+    return offset + np.floor(np.arange(n_buckets) * (n / n_buckets)).astype(np.int64)
+
+
+def _argmax_per_bucket(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+        Index of the largest value of every bucket, the first one if there are several
+    """
+    bucket = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(values))))
+    order = np.lexsort((-values, bucket))
+    return order[starts]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> (np.ndarray, np.ndarray):
+    """
+        Downsample a line to `n_out` points with Largest-Triangle-Three-Buckets. The first
+        and the last points are kept, the rest are split into buckets, and from every
+        bucket the point that makes the largest triangle with its neighbours is kept.
+
+        Original LTTB takes the point selected in the previous bucket as the left vertex,
+        which makes it sequential. Here the mean of the previous bucket is used, the same
+        way as the mean of the next one, so all the buckets are done at once with NumPy.
+
+    :param x: Sorted x values, like timestamps
+    :param y:
+    :param n_out: Number of points to keep
+    :return: Downsampled x and y
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    xf, yf = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+
+    n_buckets = n_out - 2
+    starts = _get_bucket_starts(n - 2, n_buckets, offset=1)
+    counts = np.diff(np.append(starts, n - 1))
+
+    x_mean = np.add.reduceat(xf[1:n - 1], starts - 1) / counts
+    y_mean = np.add.reduceat(yf[1:n - 1], starts - 1) / counts
+
+    # Left and right vertices of the triangles of every bucket
+    x_left, y_left = np.concatenate([xf[:1], x_mean[:-1]]), np.concatenate([yf[:1], y_mean[:-1]])
+    x_right, y_right = np.concatenate([x_mean[1:], xf[-1:]]), np.concatenate([y_mean[1:], yf[-1:]])
+
+    x_left, y_left = np.repeat(x_left, counts), np.repeat(y_left, counts)
+    x_right, y_right = np.repeat(x_right, counts), np.repeat(y_right, counts)
+
+    # Doubled triangle area
+    area = np.abs((x_left - x_right) * (yf[1:n - 1] - y_left) - (x_left - xf[1:n - 1]) * (y_right - y_left))
+
+    ind = np.concatenate([[0], 1 + _argmax_per_bucket(area, starts - 1), [n - 1]])
+    return x[ind], y[ind]
+
+
+def minmax_decimate(x: np.ndarray, y: np.ndarray, n_out: int) -> (np.ndarray, np.ndarray):
+    """
+        Downsample a line to at most `n_out` (plus the first and the last) points keeping
+        the smallest and the largest value of every one of `n_out / 2` buckets, so no
+        peak is lost. With two points per pixel the chart looks the same as with all
+        the points.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 2:
+        return x, y
+
+    yf = np.asarray(y, dtype=np.float64)
+    starts = _get_bucket_starts(n, n_out // 2)
+
+    # The first and the last points keep the time range of the line
+    ind = np.concatenate([[0, n - 1], _argmax_per_bucket(yf, starts), _argmax_per_bucket(-yf, starts)])
+
+    # Buckets with a single value or a flat line have the same point twice
+    ind = np.unique(ind)
+    return x[ind], y[ind]
@@ -0,0 +1,322 @@
+import random
+import logging
+import requests
+import threading
+
+from time import sleep, perf_counter
+from collections import Counter, deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+
+from weathergov.constants import (APP_NAME,
+                                  HTTP_POOL_MAXSIZE,
+                                  HTTP_MAX_RETRIES,
+                                  HTTP_BACKOFF_BASE_SECONDS,
+                                  HTTP_BACKOFF_MAX_SECONDS,
+                                  HTTP_TIMEOUT_SECONDS)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Responses with these status codes are worth retrying: weather.gov returns
+# 429 when we are rate limited and 5xx when its backend is having a bad time.
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+
+class RequestStats:
+    """
+        Thread safe counters of the requests sent by WeatherGovClient. The latency is
+        measured for every single attempt, including the retried ones.
+    """
+
+    def __init__(self, window: int = 10000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.status_codes = Counter()
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency: float, status_code: int = None):
+        with self._lock:
+            self.requests += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self._latencies.append(latency)
+
+            if status_code is None:
+                self.errors += 1
+            else:
+                self.status_codes[status_code] += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            n = len(latencies)
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "errors": self.errors,
+                "status_codes": dict(self.status_codes),
+                "latency_mean": self.total_latency / self.requests if self.requests else 0.0,
+                "latency_p50": latencies[n // 2] if n else 0.0,
+                "latency_p95": latencies[min(n - 1, int(n * 0.95))] if n else 0.0,
+                "latency_max": self.max_latency,
+            }
+
+    def log_summary(self):
+        s = self.summary()
+        logger.info(f"HTTP requests={s['requests']} retries={s['retries']} errors={s['errors']} "
+                    f"status_codes={s['status_codes']} latency: mean={s['latency_mean'] * 1000:.0f}ms "
+                    f"p50={s['latency_p50'] * 1000:.0f}ms p95={s['latency_p95'] * 1000:.0f}ms "
+                    f"max={s['latency_max'] * 1000:.0f}ms")
+
+
+def get_request_url(url: str, params: dict = None) -> str:
+    """
+        Full URL of a GET request, with the query string built from `params`
+    """
+    return requests.Request("GET", url, params=params).prepare().url
+
+
+class ResponseValidatorCache:
+    """
+        Remembers ETag and Last-Modified validators of the responses, so the next
+        request for the same URL is sent as a conditional one. If the resource has
+        not changed, weather.gov answers with an empty 304 response, and we can skip
+        parsing and saving the data altogether.
+
+        Validators belong to the full request URL including the query string, as
+        different parameters give different representations of a resource. Only the
+        validators of the latest request for a resource are kept, saved under the URL
+        without the query string, so the store does not grow with every new query.
+
+        Validators of a new response are held in memory until the caller has saved its
+        data and calls commit(url). If saving fails or the process dies before that, the
+        next request is not conditional and the data is downloaded again.
+
+        Validators are persisted by `store`, which is any object that implements
+        get_response_validators(url) -> dict and set_response_validators(url, dict),
+        such as RedisClient, so they survive restarts and are shared between workers.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+
+        # Request URL -> validators of the response whose data has not been saved yet
+        self._pending = dict()
+
+        # 304 responses, i.e. polls that did not have to download anything
+        self.hits = 0
+        # Conditional requests that got a new body
+        self.misses = 0
+        # Requests sent without validators: the URL have not been seen before
+        self.unconditional = 0
+
+    @staticmethod
+    def _get_store_key(url: str) -> str:
+        return url.split("?", 1)[0]
+
+    def get_request_headers(self, url: str) -> dict:
+        validators = self.store.get_response_validators(self._get_store_key(url))
+        headers = dict()
+
+        if validators.get("url") != url:
+            # Validators of another representation of the resource
+            return headers
+
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def update(self, url: str, response: requests.Response, conditional: bool):
+        if response.status_code == 304:
+            with self._lock:
+                self.hits += 1
+            return
+
+        with self._lock:
+            if conditional:
+                self.misses += 1
+            else:
+                self.unconditional += 1
+
+        if response.status_code != 200:
+            return
+
+        validators = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")
+        }
+        if validators["etag"] or validators["last_modified"]:
+            with self._lock:
+                self._pending[url] = validators
+
+    def commit(self, url: str):
+        """
+            Persist the validators of the response to the request, once its data is saved
+        """
+        with self._lock:
+            validators = self._pending.pop(url, None)
+
+        if validators is not None:
+            self.store.set_response_validators(self._get_store_key(url), validators)
+
+    def discard(self, url: str):
+        """
+            Forget the validators of the response to the request, its data was not saved
+        """
+        with self._lock:
+            self._pending.pop(url, None)
+
+    @property
+    def hit_rate(self) -> float:
+        n = self.hits + self.misses + self.unconditional
+        return self.hits / n if n else 0.0
+
+    def log_summary(self):
+        logger.info(f"Conditional requests: hits(304)={self.hits} misses={self.misses} "
+                    f"unconditional={self.unconditional} hit_rate={self.hit_rate * 100:.1f}%")
+
+
+class WeatherGovClient:
+    """
+        HTTP client for all weather.gov calls. It keeps a pool of keep-alive
+        connections per host, so we pay for TCP and TLS handshakes once instead of
+        on every request, asks for gzip encoded responses, and retries rate limited
+        (429) and failed (5xx) requests with jittered exponential backoff. If the
+        server sends Retry-After header, we wait at least as long as it asks.
+
+        The client is safe to share between the threads of the concurrent fetcher,
+        as long as pool_maxsize is not smaller than the number of threads.
+    """
+
+    def __init__(self,
+                 pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                 max_retries: int = HTTP_MAX_RETRIES,
+                 backoff_base: float = HTTP_BACKOFF_BASE_SECONDS,
+                 backoff_max: float = HTTP_BACKOFF_MAX_SECONDS,
+                 timeout: float = HTTP_TIMEOUT_SECONDS):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.stats = RequestStats()
+
+        # Retries are handled by the client itself, therefore disable them in the adapter
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "User-Agent": APP_NAME,
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+
+    def get(self,
+            url: str,
+            params: dict = None,
+            headers: dict = None,
+            validator_cache: ResponseValidatorCache = None) -> requests.Response:
+        """
+            Send GET request and retry it if needed. The response of the last attempt is
+            returned, so the caller still has to check the status code.
+            Connection errors are raised once all the retries are used.
+
+            If `validator_cache` is set, the request is conditional, keyed by the full
+            request URL (see get_request_url()), and the caller must be ready to get 304
+            response. The caller commits the validators of a new response to the cache
+            once its data is saved.
+        """
+        attempt = 0
+
+        conditional = False
+        if validator_cache is not None:
+            request_url = get_request_url(url, params)
+            conditional_headers = validator_cache.get_request_headers(request_url)
+            conditional = len(conditional_headers) > 0
+            headers = {**(headers or dict()), **conditional_headers}
+
+        while True:
+            t_ = perf_counter()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.stats.record(perf_counter() - t_)
+
+                if attempt >= self.max_retries:
+                    raise
+
+                delay = self._get_backoff_delay(attempt)
+                logger.warning(f"Request to {url} failed: {e}. Retrying in {delay:.1f} seconds")
+            else:
+                self.stats.record(perf_counter() - t_, response.status_code)
+
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if validator_cache is not None:
+                        validator_cache.update(request_url, response, conditional)
+                    return response
+
+                delay = max(self._get_backoff_delay(attempt), self._get_retry_after(response))
+                logger.warning(f"Got status code {response.status_code} for {url}. "
+                               f"Retrying in {delay:.1f} seconds")
+
+            self.stats.record_retry()
+            attempt += 1
+            sleep(delay)
+
+    def _get_backoff_delay(self, attempt: int) -> float:
+        # Full jitter: random delay between zero and the exponential cap, so workers that
+        # were throttled at the same time do not come back at the same time
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _get_retry_after(self, response: requests.Response) -> float:
+        """
+            Retry-After can be either a number of seconds or an HTTP date
+        """
+        value = response.headers.get("Retry-After")
+
+        if value is None:
+            return 0.0
+
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = (parsedate_to_datetime(value) - datetime.now(tz=timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                logger.warning(f"Failed to parse Retry-After header '{value}'")
+                return 0.0
+
+        return min(max(delay, 0.0), self.backoff_max)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> WeatherGovClient:
+    """
+        Return the client shared by all the weather.gov calls of this process
+    """
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = WeatherGovClient()
+    return _client
@@ -0,0 +1,209 @@
+import os
+import uuid
+import logging
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
+
+from datetime import datetime, timezone
+from pyarrow.fs import LocalFileSystem
+
+from weathergov.constants import DUMP_ROW_GROUP_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+
+# Columns of the dumped observations. Station IDs repeat for every sample,
+# so they are dictionary encoded.
+DUMP_SCHEMA = pa.schema([
+    ("station_id", pa.dictionary(pa.int32(), pa.string())),
+    ("timestamp", pa.timestamp("ms", tz="UTC")),
+    ("value", pa.float64()),
+])
+
+
+def get_partition_dir(base_dir: str, metric, month: str) -> str:
+    """
+        Directory of the dumped observations of a metric for a month in Hive partitioning
+        layout, like "{base_dir}/metric=temperature/month=2024-07"
+    """
+    return os.path.join(base_dir, f"metric={metric}", f"month={month}")
+
+
+class DatasetPartitionWriter:
+    """
+        Writes observations of many stations to one Parquet file of a dataset partition.
+        Samples are buffered and written in large row groups, and the file gets its final
+        name only when it is closed, so readers never see a partially written file.
+
+        Every writer creates a new file with a unique name in the partition, unless the
+        `name` (like "part-3", without extension) is given. A file written again with
+        the same name replaces the one written before.
+    """
+
+    def __init__(self, partition_dir: str, row_group_size: int = DUMP_ROW_GROUP_SIZE, name: str = None):
+        self.partition_dir = partition_dir
+        self.row_group_size = row_group_size
+
+        os.makedirs(partition_dir, exist_ok=True)
+        name = f"{name or f'part-{uuid.uuid4().hex}'}.parquet"
+        self.path = os.path.join(partition_dir, name)
+
+        # Dataset readers skip hidden files
+        self._tmp_path = os.path.join(partition_dir, f".{name}.tmp")
+
+        self._writer = None
+        self._buffer = []
+        self._buffered_rows = 0
+
+        self.n_rows = 0
+        self.n_stations = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, station_id: str, timestamps: np.ndarray, values: np.ndarray):
+        """
+            Add samples of a station. Timestamps are unix time in milliseconds.
+        """
+        if len(timestamps) == 0:
+            return
+
+        self._buffer.append((station_id, timestamps, values))
+        self._buffered_rows += len(timestamps)
+        self.n_stations += 1
+
+        if self._buffered_rows >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self._buffered_rows == 0:
+            return
+
+        station_ids = [station_id for station_id, _, _ in self._buffer]
+        counts = [len(timestamps) for _, timestamps, _ in self._buffer]
+
+        table = pa.Table.from_arrays([
+            pa.DictionaryArray.from_arrays(
+                pa.array(np.repeat(np.arange(len(station_ids), dtype=np.int32), counts)),
+                pa.array(station_ids, type=pa.string())
+            ),
+            pa.array(np.concatenate([timestamps for _, timestamps, _ in self._buffer]).astype("datetime64[ms]"),
+                     type=DUMP_SCHEMA.field("timestamp").type),
+            pa.array(np.concatenate([values for _, _, values in self._buffer]), type=pa.float64()),
+        ], schema=DUMP_SCHEMA)
+
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._tmp_path, DUMP_SCHEMA, compression="zstd")
+
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.n_rows += table.num_rows
+
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def close(self) -> bool:
+        """
+            Write what is left and give the file its final name
+        :return: True if the file was written, False if there was no data
+        """
+        self._flush()
+
+        if self._writer is None:
+            return False
+
+        self._writer.close()
+        self._writer = None
+        os.replace(self._tmp_path, self.path)
+
+        logger.info(f"Saved {self.n_rows} samples of {self.n_stations} stations to {self.path}")
+        return True
+
+    def abort(self):
+        """
+            Drop the file without saving it
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.remove(self._tmp_path)
+
+        self._buffer = []
+        self._buffered_rows = 0
+
+
+def get_months(ts_from: int, ts_to: int) -> list:
+    """
+        Months like "2024-07" that the time range in milliseconds overlaps
+    """
+    dt_from = datetime.fromtimestamp(ts_from / 1000, tz=timezone.utc)
+    dt_to = datetime.fromtimestamp(ts_to / 1000, tz=timezone.utc)
+
+    months = []
+    year, month = dt_from.year, dt_from.month
+    while (year, month) <= (dt_to.year, dt_to.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+class DumpDatasetReader:
+    """
+        Reads observations of a station from the dumped Parquet dataset. Only the files
+        of the metric and month partitions the time range overlaps are opened, and in
+        them only the row groups whose statistics may have the station and the time
+        range are read. Files are memory mapped.
+    """
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self.filesystem = LocalFileSystem(use_mmap=True)
+
+    def _get_files(self, metric, months: list) -> list:
+        files = []
+        for month in months:
+            partition_dir = get_partition_dir(self.base_dir, metric, month)
+            if not os.path.isdir(partition_dir):
+                continue
+
+            # Hidden files are the ones being written
+            files.extend(os.path.join(partition_dir, name)
+                         for name in sorted(os.listdir(partition_dir))
+                         if name.endswith(".parquet") and not name.startswith("."))
+        return files
+
+    def read(self, station_id: str, metric, ts_from: int, ts_to: int) -> (np.ndarray, np.ndarray):
+        """
+            Samples of a station metric with ts_from <= timestamp < ts_to
+
+        :return: Timestamps in milliseconds (int64) and values (float64) as NumPy arrays,
+            sorted by timestamp
+        """
+        files = self._get_files(metric, get_months(ts_from, ts_to - 1))
+        if len(files) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        timestamp_type = DUMP_SCHEMA.field("timestamp").type
+        dataset = ds.dataset(files, schema=DUMP_SCHEMA, format="parquet", filesystem=self.filesystem)
+
+        table = dataset.to_table(
+            columns=["timestamp", "value"],
+            filter=((ds.field("station_id") == station_id) &
+                    (ds.field("timestamp") >= pa.scalar(ts_from, type=timestamp_type)) &
+                    (ds.field("timestamp") < pa.scalar(ts_to, type=timestamp_type)))
+        )
+
+        timestamps = table.column("timestamp").cast(pa.int64()).to_numpy()
+        values = table.column("value").to_numpy()
+
+        # Files of the dumps written before the parts got fixed names may repeat samples
+        timestamps, ind = np.unique(timestamps, return_index=True)
+        return timestamps, values[ind]
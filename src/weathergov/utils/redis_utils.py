@@ -1,16 +1,33 @@
 import os
 import json
+import uuid
 
 import numpy as np
 import redis
 import pandas as pd
 import typing
 import logging
-
-from time import time
-from datetime import datetime
-
-from weathergov.constants import Metrics
+import itertools
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from time import time, perf_counter
+from collections import defaultdict
+
+from weathergov.constants import (Metrics,
+                                  MIN_VALID_VALUE,
+                                  MAX_VALID_VALUE,
+                                  TS_RETENTION_MS,
+                                  TS_CHUNK_SIZE,
+                                  TS_COMPACTIONS,
+                                  TS_COMPACTION_AGGREGATIONS,
+                                  TS_COMPACTION_CHUNK_SIZE,
+                                  TS_RAW_MAX_SPAN_MS,
+                                  TS_MAX_POINTS_PER_QUERY,
+                                  MAP_FIGURE_CACHE_TTL_SECONDS,
+                                  DUMP_MRANGE_STATIONS_PER_QUERY)
+from weathergov.objects.observations import ObservationBatch
+from weathergov.utils.spatial_utils import GridIndex, get_stations_grid_index
 
 
 logger = logging.getLogger(__name__)
@@ -81,37 +98,144 @@ class RedisKeys:
     # Set of all weather station IDs
     WEATHER_STATIONS_IDS = "weather_station:weather.gov:station_ids"
 
-    # Hash with timestamps when each station data was dumped in the following format:
-    #   name = "weather_station:weather.gov:last_data_dump"
-    #   key = "{station_id}:{metric}" like "AP196:temperature"
-    #   value = unix timestamp in milliseconds when data was dumped last time
-    WEATHER_STATIONS_DATA_DUMP_TS = "weather_station:weather.gov:last_data_dump"
+    # Geo set with the location of every weather station
+    WEATHER_STATIONS_LOCATIONS = "weather_station:weather.gov:station_locations"
+
+    # Hash with the shards of a monthly data dump that are done:
+    #   name = "weather_station:weather.gov:data_dump_manifest:2024-07"
+    #   key = "{metric}:{bucket}" like "temperature:3"
+    #   value = JSON like {"n_bucket_stations": 6800, "bucket_hash": "1c291ca3", "n_stations": 6500,
+    #                      "stations_hash": "9e83486d", "n_samples": 4700000, "paths": ["..."],
+    #                      "ts": 1722556800000}
+    DATA_DUMP_MANIFEST_PREFIX = "weather_station:weather.gov:data_dump_manifest"
+
+    # Field of the station info hash with unix timestamp in milliseconds of the
+    # newest observation stored for the station (of any metric)
+    STATION_WATERMARK_FIELD = "observations_ts"
+
+    # Hash with ETag and Last-Modified validators of the latest weather.gov response
+    # for every resource:
+    #   key = station URL like "https://api.weather.gov/stations/AP196/observations"
+    #   value = JSON like {"url": "<request URL with query string>", "etag": "...", "last_modified": "..."}
+    HTTP_RESPONSE_VALIDATORS = "weather_station:weather.gov:http_response_validators"
+
+    # Snapshot of all the stations info with the most recent value of every metric, the
+    # same table get_observation_stations_info() returns, saved as Arrow (feather) blob.
+    # Its version is incremented every time a new snapshot is published, and the set
+    # has IDs of the stations that have changed since the snapshot was published.
+    STATIONS_SNAPSHOT = "weather_station:weather.gov:stations_snapshot"
+    STATIONS_SNAPSHOT_VERSION = "weather_station:weather.gov:stations_snapshot:version"
+    STATIONS_SNAPSHOT_DIRTY = "weather_station:weather.gov:stations_snapshot:dirty"
+    STATIONS_SNAPSHOT_LOCK = "weather_station:weather.gov:stations_snapshot:lock"
+
+    # Hash with the number of map figure cache hits and misses of all the web app workers
+    MAP_FIGURE_CACHE_STATS = "weather_app:map_figure:cache_stats"
 
     @staticmethod
     def get_rt_data_key(station_id, data_keyword):
         return f"weather_station:weather.gov:{station_id}:data:{data_keyword}"
 
+    @staticmethod
+    def get_compaction_key(station_id, data_keyword, aggregation: str, bucket_ms: int):
+        """
+            Key of a compaction series of a metric timeseries, like
+            "weather_station:weather.gov:AP196:data:temperature:avg:3600000"
+        """
+        return f"{RedisKeys.get_rt_data_key(station_id, data_keyword)}:{aggregation}:{bucket_ms}"
+
+    @staticmethod
+    def parse_rt_data_key(key: str) -> (str, str, str):
+        """
+            Split timeseries key into data source, station ID and metric
+        """
+        _, data_source, station_id, _, data_keyword = key.split(":")
+        return data_source, station_id, data_keyword
+
+    @staticmethod
+    def get_data_dump_manifest_key(month: str):
+        """
+            Key of the manifest of the data dump of a month like "2024-07"
+        """
+        return f"{RedisKeys.DATA_DUMP_MANIFEST_PREFIX}:{month}"
+
     @staticmethod
     def get_station_info_hash_key(station_id):
         return f"weather_station:weather.gov:{station_id}"
 
+    @staticmethod
+    def get_map_figure_key(coloring_parameter, colorscale: str, snapshot_version: int):
+        """
+            Key of a map figure JSON, like "weather_app:map_figure:temperature:jet:42"
+        """
+        return f"weather_app:map_figure:{coloring_parameter}:{colorscale}:{snapshot_version}"
+
+
+def get_resp_size(args) -> int:
+    """
+        Number of bytes a command takes on the wire in RESP protocol
+    """
+    n = len(f"*{len(args)}\r\n")
+    for arg in args:
+        if not isinstance(arg, (bytes, str)):
+            arg = repr(arg) if isinstance(arg, float) else str(arg)
+        length = len(arg.encode()) if isinstance(arg, str) else len(arg)
+        n += len(f"${length}\r\n") + length + 2
+    return n
+
+
+class IngestStats:
+    """
+        Counters of the commands sent to Redis by the timeseries ingest path
+    """
+
+    def __init__(self):
+        self.commands = 0
+        self.bytes_sent = 0
+        self.samples = 0
+        self.batches = 0
+        self.duration = 0.0
+
+    def record_commands(self, command_stack: list):
+        # Pipeline command stack consists of (args, options) tuples
+        self.commands += len(command_stack)
+        self.bytes_sent += sum(get_resp_size(args) for args, _ in command_stack)
+
+    def record_batch(self, n_samples: int, duration: float):
+        self.samples += n_samples
+        self.batches += 1
+        self.duration += duration
+
+    def log_summary(self):
+        duration = max(self.duration, 1e-9)
+        logger.info(f"Redis ingest: batches={self.batches} samples={self.samples} commands={self.commands} "
+                    f"bytes_sent={self.bytes_sent} ({self.commands / duration:.1f} commands/s, "
+                    f"{self.samples / duration:.0f} samples/s, {self.bytes_sent / duration / 1e6:.2f} MB/s)")
+
 
 class RedisClient:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        self.ingest_stats = IngestStats()
 
         redis_info = RedisInfo.load()
-
-        self.rc = redis.Redis(
+        connection_kwargs = dict(
             host=redis_info.host,
             port=redis_info.port,
             password=redis_info.password,
             db=0,
-            decode_responses=True,
             socket_keepalive=True,
             socket_timeout=60
         )
 
+        self.rc = redis.Redis(decode_responses=True, **connection_kwargs)
+
+        # Binary values, like the stations snapshot, must not be decoded
+        self.rc_bin = redis.Redis(decode_responses=False, **connection_kwargs)
+
+        # Version of the stations snapshot, the snapshot and its spatial index,
+        # see get_stations_index()
+        self._stations_index = (0, None, None)
+
         self.script1 = self.rc.register_script(f"""
         -- Get the station ID with the latest update time
         local res = redis.call("ZPOPMIN", "{RedisKeys.STATION_RT_TABLE}")
@@ -124,6 +248,15 @@ class RedisClient:
         return res
         """)
 
+        # Delete lock KEYS[1] only if it still holds token ARGV[1], so a lock that has
+        # expired and been taken by another process is not released
+        self.release_lock_script = self.rc.register_script("""
+        if redis.call("GET", KEYS[1]) == ARGV[1] then
+            return redis.call("DEL", KEYS[1])
+        end
+        return 0
+        """)
+
     def create_weather_stations_queue(self):
         # Get all station IDs. There should be about 46000 of them
         station_ids = list(self.rc.smembers("weather_station:weather.gov:station_ids"))
@@ -165,94 +298,254 @@ class RedisClient:
     def set_station_data_populated_last_time_ts(self, ts: int):
         self.rc.set("weather_station:weather.gov:last_data_update_ts", str(ts))
 
-    def add_timeseries_data(self, station_id: str, data: dict):
-        if 'timestamp' not in data.keys():
-            self.logger.warning(f"Keyword 'timestamp' not found in the data")
-            return
-        ts = data['timestamp']
-
-        # Get the timeseries connector
-        # rc_ts = self.rc.ts()
-        # rc_ts_pipe = rc_ts.pipeline()
-        pipe = self.rc.pipeline()
-
-        # TODO Create a timeseries for each parameter to avoid
-        #   TSDB: the key does not exist error
-
-        #
-        # At this point we should have timestamp, let's go over all the possible
-        # data metrics and add all of them as timeseries data to Redis
-        for keyword in [Metrics.Temperature,
-                        Metrics.DewPoint,
-                        Metrics.WindDirection,
-                        Metrics.WindSpeed,
-                        Metrics.WindGust,
-                        Metrics.WindChill,
-                        Metrics.BarometricPressure,
-                        Metrics.SeaLevelPressure,
-                        Metrics.Visibility,
-                        Metrics.Precipitation3h,
-                        Metrics.RelativeHumidity,
-                        Metrics.HeatIndex]:
+    def get_station_watermark(self, station_id: str) -> int:
+        """
+            Get the newest observation timestamp (unix time in milliseconds) stored for
+            the station, or 0 if there is no data for it yet.
+
+            Stations loaded before the watermark was introduced have only the per metric
+            "{metric}_ts" fields, so fall back to the newest of them.
+        """
+        values = self.rc.hmget(RedisKeys.get_station_info_hash_key(station_id=station_id),
+                               [RedisKeys.STATION_WATERMARK_FIELD] + [f"{metric}_ts" for metric in Metrics])
+
+        if values[0] is not None:
+            # The watermark may be older than some "{metric}_ts" when samples were rejected
+            values = values[:1]
+
+        watermark = 0
+        for value in values:
             try:
-                kw_data = data[keyword]
-            except KeyError:
-                logger.warning(f"Failed to find keyword '{keyword}' in data for station {station_id}")
+                watermark = max(watermark, int(float(value)))
+            except (TypeError, ValueError):
                 continue
+        return watermark
 
-            # Check if they have the same size
-            if len(ts) != len(kw_data):
-                logger.warning(f"Data length do not match for keyword {keyword}: "
-                               f"len(kw_data)={len(kw_data)} != {len(ts)} = len(ts)")
+    def add_timeseries_data(self,
+                            station_id: str,
+                            data: typing.Union[ObservationBatch, dict],
+                            watermark: int = 0):
+        """
+            Add station observations to timeseries. Observations that are not newer
+            than `watermark` (unix time in milliseconds) have been stored already and
+            are skipped before anything is sent to Redis.
+
+        :param station_id:
+        :param data: Observations batch. The old dict of lists format is still accepted
+        :param watermark:
+        """
+        if isinstance(data, dict):
+            if 'timestamp' not in data.keys():
+                self.logger.warning(f"Keyword 'timestamp' not found in the data")
+                return
+            data = ObservationBatch.from_dict(data)
+
+        self.add_timeseries_data_bulk(batches={station_id: data}, watermarks={station_id: watermark})
+
+    def add_timeseries_data_bulk(self,
+                                 batches: typing.Dict[str, ObservationBatch],
+                                 watermarks: typing.Dict[str, int] = None) -> typing.Set[str]:
+        """
+            Add observations of many stations to timeseries in a single round trip:
+            all the samples of all the metrics go to one TS.MADD. Missing (NaN) samples
+            are not stored.
+
+            TS.MADD does not create series. Series of the stations without a watermark
+            (never ingested before) are created in the same pipeline, and if some other
+            series do not exist, they are created and the rejected samples are sent again.
+            Samples rejected for any other reason are logged.
+
+            The latest values of each station go to one HSET once the TS.MADD replies are
+            checked, and only stored samples count. If some samples of a station were
+            rejected, its watermark is the newest stored sample older than all of them
+            (or stays where it was), so the rejected ones are requested from the API again.
+
+        :param batches: Station ID -> observations
+        :param watermarks: Station ID -> newest timestamp (ms) we already have for the station
+        :return: IDs of the stations whose new samples were all stored
+        """
+        watermarks = watermarks or dict()
+
+        # (key, timestamp, value) of every sample
+        samples = []
+        # (station ID, metric, first sample, last sample + 1) of every slice of the samples
+        segments = []
+        new_batches = dict()
+        pipe = self.rc.pipeline(transaction=False)
+
+        for station_id, batch in batches.items():
+            watermark = watermarks.get(station_id, 0)
+            batch = batch.newer_than(watermark)
+
+            if len(batch) == 0:
+                self.logger.info(f"No new data for station {station_id}")
                 continue
 
-            # These are the most recent value and corresponding timestamp in milliseconds
-            val_max_ts, max_ts = 0, 0
+            new_batches[station_id] = batch
 
-            # Here we have the same length of ts and data and can insert it to Redis
-            # First we need to convert the timestamp to unix time
-            for tsi, value in zip(ts, kw_data):
-                # Convert time to unix epoch timestamp in milliseconds
-                tsi_unix = int(datetime.strptime(tsi, "%Y-%m-%dT%H:%M:%S%z").timestamp() * 1000)
+            if watermark == 0:
+                # "Key already exists" errors are expected and ignored
+                self._queue_timeseries_creation(pipe, [(station_id, metric) for metric in Metrics])
 
-                key = RedisKeys.get_rt_data_key(station_id, keyword)
+            for metric in Metrics:
+                try:
+                    values = batch.values[metric]
+                except KeyError:
+                    logger.warning(f"Failed to find keyword '{metric}' in data for station {station_id}")
+                    continue
 
-                if tsi_unix > max_ts:
-                    max_ts = tsi_unix
-                    val_max_ts = value
+                ind = np.flatnonzero(~np.isnan(values))
+                if len(ind) == 0:
+                    continue
 
-                # Add to timeseries
-                # rc_ts_pipe.add(f"weather_station:weather.gov:{station_id}:data:{keyword}",
-                #                tsi_unix, value,
-                #                duplicate_policy="FIRST")
-                pipe.ts().add(key,
-                              tsi_unix,
-                              value,
-                              duplicate_policy="FIRST")
+                key = RedisKeys.get_rt_data_key(station_id, metric)
+                segments.append((station_id, metric, len(samples), len(samples) + len(ind)))
+                samples.extend(zip(itertools.repeat(key), batch.timestamps[ind].tolist(), values[ind].tolist()))
 
-            # Add the most recent value to station hash
-            pipe.hset(RedisKeys.get_station_info_hash_key(station_id=station_id), f"{keyword}_ts", str(max_ts))
-            pipe.hset(RedisKeys.get_station_info_hash_key(station_id=station_id), f"{keyword}_val", val_max_ts)
+        if len(new_batches) == 0:
+            return set(batches.keys())
 
-            # Execute transaction
-            pipe.execute()
-            logger.info(f"{len(ts)} new data points added to {keyword} data for station {station_id}")
+        t_ = perf_counter()
+        stored = np.zeros(len(samples), dtype=bool)
 
-        self.logger.info(f"Data for station {station_id} have been added to Redis")
+        n_create = len(pipe)
+        if len(samples) > 0:
+            pipe.ts().madd(samples)
+        self.ingest_stats.record_commands(pipe.command_stack)
+        res = pipe.execute(raise_on_error=False)
 
-    def remove_timeseries_data(self, station_id: str, metric: Metrics, ts_from, ts_to):
-        try:
-            self.rc.ts().delete(
-                RedisKeys.get_rt_data_key(station_id, metric),
-                ts_from,
-                ts_to
-            )
-        except redis.exceptions.ResponseError:
-            self.logger.error(f"Failed to remove data from timeseries for station={station_id} "
-                              f"and metric={metric} for time_from='{ts_from}' and time_to={ts_to}")
-            return
-        self.logger.info(f"Successfully removed data from timeseries for station={station_id} "
-                         f"and metric={metric} for time_from='{ts_from}' and time_to={ts_to}")
+        self._check_create_replies(res[:n_create])
+
+        missing = []
+        if len(samples) > 0:
+            missing = self._check_madd_reply(samples, list(range(len(samples))), res[-1], stored, retry_missing=True)
+
+        if len(missing) > 0:
+            pipe = self.rc.pipeline(transaction=False)
+
+            keys = {samples[i][0] for i in missing}
+            self._queue_timeseries_creation(pipe, [RedisKeys.parse_rt_data_key(key)[1:] for key in keys])
+
+            n_create = len(pipe)
+            pipe.ts().madd([samples[i] for i in missing])
+
+            self.ingest_stats.record_commands(pipe.command_stack)
+            res = pipe.execute(raise_on_error=False)
+
+            self._check_create_replies(res[:n_create])
+            self._check_madd_reply(samples, missing, res[-1], stored)
+
+        # Station info reflects only the samples that were stored
+        complete = set(batches.keys()) - set(new_batches.keys())
+        timestamps = np.array([ts for _, ts, _ in samples], dtype=np.int64)
+
+        latest = {station_id: dict() for station_id in new_batches}
+        # Station ID -> timestamps of its stored and rejected samples
+        stored_ts, rejected_ts = defaultdict(list), defaultdict(list)
+
+        for station_id, metric, i_from, i_to in segments:
+            ts, ok = timestamps[i_from:i_to], stored[i_from:i_to]
+            stored_ts[station_id].append(ts[ok])
+            rejected_ts[station_id].append(ts[~ok])
+
+            if ok.any():
+                # Timestamps are sorted, so the last one is the most recent
+                i = i_from + np.flatnonzero(ok)[-1]
+                latest[station_id][f"{metric}_ts"] = str(int(timestamps[i]))
+                latest[station_id][f"{metric}_val"] = float(samples[i][2])
+
+        pipe = self.rc.pipeline(transaction=False)
+
+        for station_id, batch in new_batches.items():
+            rejected = np.concatenate(rejected_ts[station_id] or [np.empty(0, dtype=np.int64)])
+
+            if len(rejected) == 0:
+                # All the observations are stored, including the ones without any values
+                latest[station_id][RedisKeys.STATION_WATERMARK_FIELD] = str(int(batch.timestamps[-1]))
+                complete.add(station_id)
+            else:
+                ts = np.concatenate(stored_ts[station_id])
+                ts = ts[ts < rejected.min()]
+                watermark = int(ts.max()) if len(ts) > 0 else watermarks.get(station_id, 0)
+                latest[station_id][RedisKeys.STATION_WATERMARK_FIELD] = str(watermark)
+
+            pipe.hset(RedisKeys.get_station_info_hash_key(station_id=station_id), mapping=latest[station_id])
+            pipe.sadd(RedisKeys.STATIONS_SNAPSHOT_DIRTY, station_id)
+
+        self.ingest_stats.record_commands(pipe.command_stack)
+        pipe.execute()
+
+        self.ingest_stats.record_batch(n_samples=int(stored.sum()), duration=perf_counter() - t_)
+        self.logger.info(f"{int(stored.sum())} of {len(samples)} new data points added for {len(new_batches)} "
+                         f"stations ({len(missing)} of them to new timeseries)")
+        return complete
+
+    def _queue_timeseries_creation(self, pipe, series: typing.List[typing.Tuple[str, Metrics]]):
+        """
+            Queue creation of the (station_id, metric) timeseries with their compaction
+            series and rules, the same ones create_timeseries_schema() makes. State and
+            timezone labels are "unknown" until create_timeseries_schema() runs again.
+        """
+        rules = []
+        for station_id, metric in series:
+            metric_series, metric_rules = self._get_metric_schema(station_id, metric)
+            rules.extend(metric_rules)
+
+            for key, labels, retention, chunk_size in metric_series:
+                pipe.execute_command(*self._get_timeseries_create_command(key, labels, retention, chunk_size))
+
+        for key, dest_key, aggregation, bucket_ms in rules:
+            pipe.execute_command("TS.CREATERULE", key, dest_key, "AGGREGATION", aggregation, bucket_ms)
+
+    def _check_create_replies(self, replies: list):
+        for reply in replies:
+            # Series and rules that exist already are expected
+            if isinstance(reply, redis.ResponseError) and "already" not in str(reply):
+                self.logger.warning(f"Failed to create timeseries or compaction rule: {reply}")
+
+    def _check_madd_reply(self,
+                          samples: list,
+                          indices: list,
+                          reply,
+                          stored: np.ndarray,
+                          retry_missing: bool = False) -> list:
+        """
+            Mark the samples TS.MADD has stored and log the rejected ones
+
+        :param samples: (key, timestamp, value) of every sample
+        :param indices: Indices of the samples sent in the TS.MADD
+        :param reply: TS.MADD reply, a timestamp or an error for every sample
+        :param stored: Flag of every sample, set for the stored ones
+        :param retry_missing: If set, samples of series that do not exist are not logged
+        :return: Indices of the samples of series that do not exist, if `retry_missing` is set
+        """
+        if isinstance(reply, Exception):
+            self.logger.error(f"Failed to add {len(indices)} samples: {reply}")
+            return []
+
+        missing = []
+        # (key, error) -> number of rejected samples and the oldest of them
+        errors = dict()
+
+        for i, sample_reply in zip(indices, reply):
+            if not isinstance(sample_reply, redis.ResponseError):
+                stored[i] = True
+            elif retry_missing and "does not exist" in str(sample_reply):
+                missing.append(i)
+            else:
+                key, ts, _ = samples[i]
+                n, ts_min = errors.get((key, str(sample_reply)), (0, ts))
+                errors[(key, str(sample_reply))] = (n + 1, min(ts, ts_min))
+
+        for (key, error), (n, ts_min) in errors.items():
+            self.logger.warning(f"{n} samples of {key} were rejected, the oldest at {ts_min}: {error}")
+        return missing
+
+    def get_used_memory(self) -> int:
+        """
+            Memory used by Redis in bytes
+        """
+        return int(self.rc.info("memory")["used_memory"])
 
     def get_rt_update_station(self):
         """
@@ -274,6 +567,165 @@ class RedisClient:
         last_update_ts = int(float(last_update_ts))
         return station_id, last_update_ts
 
+    @staticmethod
+    def _get_timeseries_labels(station_id: str,
+                               metric: Metrics,
+                               station: dict = None,
+                               aggregation: str = None,
+                               bucket_ms: int = None) -> dict:
+        station = station or dict()
+        labels = {
+            "station_id": station_id,
+            "metric": str(metric),
+            # Label values cannot be empty
+            "state": station.get("station_state") or "unknown",
+            "timezone": station.get("station_timezone") or "unknown",
+            # Raw samples or the bucket size of a compaction series in milliseconds
+            "resolution": "raw" if bucket_ms is None else str(bucket_ms),
+        }
+
+        if aggregation is not None:
+            labels["aggregation"] = aggregation
+        return labels
+
+    @staticmethod
+    def _get_timeseries_create_command(key: str,
+                                       labels: dict,
+                                       retention_ms: int = TS_RETENTION_MS,
+                                       chunk_size: int = TS_CHUNK_SIZE,
+                                       alter: bool = False) -> list:
+        """
+            Build TS.CREATE command of a timeseries, or TS.ALTER one that brings an
+            existing series to the same settings. Encoding cannot be altered.
+        """
+        command = ["TS.ALTER" if alter else "TS.CREATE", key, "RETENTION", retention_ms]
+
+        if not alter:
+            command.extend(["ENCODING", "COMPRESSED"])
+
+        command.extend(["CHUNK_SIZE", chunk_size, "DUPLICATE_POLICY", "FIRST", "LABELS"])
+
+        for label, value in labels.items():
+            command.extend([label, value])
+        return command
+
+    @staticmethod
+    def _get_metric_schema(station_id: str,
+                           metric: Metrics,
+                           station: dict = None,
+                           retention_ms: int = TS_RETENTION_MS,
+                           chunk_size: int = TS_CHUNK_SIZE,
+                           compaction_chunk_size: int = TS_COMPACTION_CHUNK_SIZE) -> (list, list):
+        """
+            :return: (key, labels, retention, chunk size) of the metric timeseries of the station
+                and of its compaction series, and (source key, destination key, aggregation, bucket)
+                of every compaction rule
+        """
+        key = RedisKeys.get_rt_data_key(station_id, metric)
+        series = [(key, RedisClient._get_timeseries_labels(station_id, metric, station), retention_ms, chunk_size)]
+        rules = []
+
+        for bucket_ms, compaction_retention_ms in TS_COMPACTIONS.items():
+            for aggregation in TS_COMPACTION_AGGREGATIONS:
+                dest_key = RedisKeys.get_compaction_key(station_id, metric, aggregation, bucket_ms)
+                labels = RedisClient._get_timeseries_labels(station_id, metric, station, aggregation, bucket_ms)
+
+                series.append((dest_key, labels, compaction_retention_ms, compaction_chunk_size))
+                rules.append((key, dest_key, aggregation, bucket_ms))
+        return series, rules
+
+    @staticmethod
+    def _get_station_schema(station: dict,
+                            retention_ms: int,
+                            chunk_size: int,
+                            compaction_chunk_size: int) -> (list, list):
+        """
+            See _get_metric_schema(), for every metric of the station
+        """
+        series, rules = [], []
+
+        for metric in Metrics:
+            metric_series, metric_rules = RedisClient._get_metric_schema(station["station_id"], metric, station,
+                                                                         retention_ms, chunk_size,
+                                                                         compaction_chunk_size)
+            series.extend(metric_series)
+            rules.extend(metric_rules)
+        return series, rules
+
+    def create_timeseries_schema(self,
+                                 stations: list,
+                                 retention_ms: int = TS_RETENTION_MS,
+                                 chunk_size: int = TS_CHUNK_SIZE,
+                                 compaction_chunk_size: int = TS_COMPACTION_CHUNK_SIZE,
+                                 batch_size: int = 200) -> (int, int):
+        """
+            Create a timeseries for every station and metric with labels (station_id, metric,
+            state, timezone, resolution), retention, compressed encoding and the given chunk size.
+
+            Every metric timeseries also gets compaction series with hourly and daily
+            avg/min/max of its samples (see TS_COMPACTIONS), kept much longer than the raw
+            samples, so long time ranges can be read without pulling every raw point.
+
+            It is safe to run it again: series that exist already are altered to have the
+            same labels, retention and chunk size, and existing rules are kept.
+
+        :param stations: Station dictionaries as returned by get_all_stations()
+        :param retention_ms: Retention of the raw samples
+        :param chunk_size: Chunk size of the raw samples series
+        :param compaction_chunk_size: Chunk size of the compaction series
+        :param batch_size: Number of stations per pipeline
+        :return: Number of created and updated timeseries
+        """
+        n_created, n_updated, n_rules = 0, 0, 0
+
+        for i in range(0, len(stations), batch_size):
+            series, rules = [], []
+            for station in stations[i:i + batch_size]:
+                station_series, station_rules = self._get_station_schema(station, retention_ms, chunk_size,
+                                                                         compaction_chunk_size)
+                series.extend(station_series)
+                rules.extend(station_rules)
+
+            pipe = self.rc.pipeline(transaction=False)
+            for key, labels, retention, series_chunk_size in series:
+                pipe.execute_command(*self._get_timeseries_create_command(key, labels, retention, series_chunk_size))
+            res = pipe.execute(raise_on_error=False)
+
+            pipe = self.rc.pipeline(transaction=False)
+            n_alter = 0
+            for (key, labels, retention, series_chunk_size), reply in zip(series, res):
+                if not isinstance(reply, redis.ResponseError):
+                    n_created += 1
+                elif "already exists" in str(reply):
+                    pipe.execute_command(*self._get_timeseries_create_command(key, labels, retention,
+                                                                              series_chunk_size, alter=True))
+                    n_alter += 1
+                else:
+                    self.logger.warning(f"Failed to create timeseries {key}: {reply}")
+
+            # Rules go after the updates, when all the destination series exist
+            for key, dest_key, aggregation, bucket_ms in rules:
+                pipe.execute_command("TS.CREATERULE", key, dest_key, "AGGREGATION", aggregation, bucket_ms)
+
+            res = pipe.execute(raise_on_error=False)
+
+            for reply in res[:n_alter]:
+                if isinstance(reply, redis.ResponseError):
+                    self.logger.warning(f"Failed to update timeseries: {reply}")
+                else:
+                    n_updated += 1
+
+            for reply in res[n_alter:]:
+                if not isinstance(reply, redis.ResponseError):
+                    n_rules += 1
+                elif "already" not in str(reply):
+                    # The only expected error is that the rule exists already
+                    self.logger.warning(f"Failed to create compaction rule: {reply}")
+
+        self.logger.info(f"Timeseries schema is up to date: {n_created} created, {n_updated} updated, "
+                         f"{n_rules} compaction rules created")
+        return n_created, n_updated
+
     def update_observation_stations(self, stations: list):
         """
             Save observation stations to Redis HASH
@@ -306,6 +758,11 @@ class RedisClient:
             # timestamp when the RT data was loaded
             pipeline.zadd(RedisKeys.STATION_RT_TABLE, {station_id: -1})
 
+        # Locations of all the stations in a single GEOADD
+        locations = self._get_station_locations(stations)
+        if len(locations) > 0:
+            pipeline.geoadd(RedisKeys.WEATHER_STATIONS_LOCATIONS, locations)
+
         pipeline.execute()
         logger.info(f"Stations info was updated in Redis")
 
@@ -314,6 +771,96 @@ class RedisClient:
         rc_ts = self.rc.ts()
         rc_ts.add(RedisKeys.TOTAL_STATIONS_NUM, int(time()), len(stations), duplicate_policy="FIRST")
 
+        # Make sure that every station has all the metric timeseries with up-to-date labels
+        self.create_timeseries_schema(stations)
+
+        # Stations might have been added or removed, so rebuild the snapshot from scratch
+        self.publish_stations_snapshot(full=True)
+
+    @staticmethod
+    def _get_station_locations(stations: list) -> list:
+        """
+            :return: Flat list of longitude, latitude and station ID of every station with
+                coordinates, as GEOADD takes them
+        """
+        locations = []
+
+        for station in stations:
+            try:
+                lon, lat = float(station["longitude"]), float(station["latitude"])
+            except (KeyError, TypeError, ValueError):
+                continue
+
+            # Redis cannot index the areas around the poles
+            if -180 <= lon <= 180 and -85.05112878 <= lat <= 85.05112878:
+                locations.extend([lon, lat, station["station_id"]])
+        return locations
+
+    def get_nearest_stations(self,
+                             lon: float,
+                             lat: float,
+                             n: int = 10,
+                             radius_km: float = 500) -> typing.List[typing.Tuple[str, float]]:
+        """
+            Find up to `n` stations nearest to the point within the radius.
+
+        :return: (station ID, distance in km) sorted by distance
+        """
+        res = self.rc.geosearch(RedisKeys.WEATHER_STATIONS_LOCATIONS,
+                                longitude=lon, latitude=lat,
+                                radius=radius_km, unit="km",
+                                sort="ASC", count=n, withdist=True)
+        return [(station_id, float(dist)) for station_id, dist in res]
+
+    def get_stations_in_bbox(self, west: float, south: float, east: float, north: float) -> typing.List[str]:
+        """
+            Find the stations inside the latitude/longitude bounding box
+        """
+        # GEOSEARCH box is a rectangle in km around its center, so search a box that
+        # covers the bounds at the widest latitude and keep the stations inside them
+        widest_lat = 0 if south <= 0 <= north else min(abs(south), abs(north))
+        width_km = (east - west) * 111.32 * float(np.cos(np.radians(widest_lat)))
+        height_km = (north - south) * 110.57
+
+        res = self.rc.geosearch(RedisKeys.WEATHER_STATIONS_LOCATIONS,
+                                longitude=(west + east) / 2, latitude=(south + north) / 2,
+                                width=width_km * 1.01, height=height_km * 1.01, unit="km",
+                                withcoord=True)
+
+        return [station_id for station_id, (lon, lat) in res
+                if west <= lon <= east and south <= lat <= north]
+
+    def get_nearest_stations_from_snapshot(self,
+                                           lon: float,
+                                           lat: float,
+                                           n: int = 10,
+                                           radius_km: float = 500) -> typing.List[typing.Tuple[str, float]]:
+        """
+            Same as get_nearest_stations(), but the stations are searched in process with
+            the spatial index of the stations snapshot, see get_stations_index()
+        """
+        _, df, index = self.get_stations_index()
+        if df is None:
+            return []
+
+        ind, distances = index.nearest(lat, lon, n)
+        inside = distances <= radius_km
+        return list(zip(df['station_id'].to_numpy()[ind[inside]].tolist(), distances[inside].tolist()))
+
+    def get_stations_in_bbox_from_snapshot(self,
+                                           west: float,
+                                           south: float,
+                                           east: float,
+                                           north: float) -> typing.List[str]:
+        """
+            Same as get_stations_in_bbox(), but the stations are searched in process with
+            the spatial index of the stations snapshot, see get_stations_index()
+        """
+        _, df, index = self.get_stations_index()
+        if df is None:
+            return []
+        return df['station_id'].to_numpy()[index.query_bbox(west, south, east, north)].tolist()
+
     def is_station_in_blacklist(self, station_id: str) -> (bool, float):
         score = self.rc.zscore(RedisKeys.WEATHER_STATIONS_NO_DATA_BLACKLIST, station_id)
 
@@ -321,138 +868,371 @@ class RedisClient:
             return False, score
         return True, score
 
-    def get_observation_stations_info(self):
-        station_ids = list(self.rc.smembers("weather_station:weather.gov:station_ids"))
+    def get_observation_stations_info(self) -> pd.DataFrame:
+        """
+            Get info of all the stations with the most recent value of every metric.
+            It is read from the stations snapshot in one round trip. If there is no
+            snapshot yet, then it is collected from every station hash.
+        """
+        _, df = self.get_stations_snapshot()
 
-        pipeline = self.rc.pipeline()
+        if df is None:
+            self.logger.warning(f"Stations snapshot not found, reading every station info")
+            df = self._scan_observation_stations_info()
+        return df
 
-        for station_id in station_ids:
-            pipeline.hgetall(f"weather_station:weather.gov:{station_id}")
-        data = pipeline.execute()
+    def get_stations_snapshot(self) -> (int, typing.Optional[pd.DataFrame]):
+        """
+        :return: Version of the stations snapshot and the snapshot itself, or
+            (0, None) if it has never been published
+        """
+        blob, version = self.rc_bin.mget(RedisKeys.STATIONS_SNAPSHOT, RedisKeys.STATIONS_SNAPSHOT_VERSION)
+
+        if blob is None:
+            return 0, None
+        return int(version or 0), self._read_snapshot(blob)
+
+    def get_stations_index(self) -> (int, typing.Optional[pd.DataFrame], typing.Optional[GridIndex]):
+        """
+            Stations snapshot with the spatial index of its stations. Both are kept in
+            process and only the version is read from Redis, until a new snapshot is
+            published. The snapshot is shared, so it must not be modified.
+
+        :return: Version of the stations snapshot, the snapshot and its index, or
+            (0, None, None) if it has never been published
+        """
+        version = self.get_stations_snapshot_version()
+        cached_version, df, index = self._stations_index
+
+        if version == 0 or version != cached_version:
+            version, df = self.get_stations_snapshot()
+            index = None if df is None else get_stations_grid_index(df)
+            self._stations_index = (version, df, index)
+        return version, df, index
+
+    def get_stations_snapshot_version(self) -> int:
+        return int(self.rc.get(RedisKeys.STATIONS_SNAPSHOT_VERSION) or 0)
+
+    def publish_stations_snapshot(self, full: bool = False) -> typing.Optional[int]:
+        """
+            Update the stations snapshot with the stations that have changed since it
+            was published last time, and increment its version. With `full`, or if there
+            is no snapshot yet, it is built from scratch out of every station info hash.
+
+            Only one loader publishes at a time. If another one holds the lock, nothing
+            is done, and the changed stations are left for the next publish.
+
+        :param full:
+        :return: Version of the published snapshot, or None if it was not published,
+            including when there are no stations
+        """
+        token = uuid.uuid4().hex
+        if not self.rc.set(RedisKeys.STATIONS_SNAPSHOT_LOCK, token, nx=True, px=120 * 1000):
+            self.logger.info(f"Stations snapshot is being published by another loader")
+            return None
+
+        t_ = perf_counter()
+        try:
+            df_old = None if full else self.get_stations_snapshot()[1]
+
+            # Take the changed stations and reset the set atomically
+            pipe = self.rc.pipeline(transaction=True)
+            pipe.smembers(RedisKeys.STATIONS_SNAPSHOT_DIRTY)
+            pipe.delete(RedisKeys.STATIONS_SNAPSHOT_DIRTY)
+            dirty = list(pipe.execute()[0])
+
+            if df_old is not None and len(dirty) == 0:
+                self.logger.info(f"Stations snapshot is up to date")
+                return self.get_stations_snapshot_version()
+
+            try:
+                if df_old is None:
+                    df = self._scan_observation_stations_info()
+                else:
+                    df_new = self._scan_observation_stations_info(station_ids=dirty)
+                    df = pd.concat([df_old[~df_old['station_id'].isin(dirty)], df_new], ignore_index=True)
+
+                if len(df) == 0:
+                    # Stations are not loaded yet
+                    self.logger.info(f"No stations to publish a snapshot of")
+                    return None
+
+                # Stations keep their order from one snapshot to another, unless stations are added or removed
+                df = df.sort_values('station_id', ignore_index=True)
+                blob = self._write_snapshot(df)
+
+                pipe = self.rc_bin.pipeline(transaction=True)
+                pipe.set(RedisKeys.STATIONS_SNAPSHOT, blob)
+                pipe.incr(RedisKeys.STATIONS_SNAPSHOT_VERSION)
+                version = pipe.execute()[-1]
+            except Exception:
+                # Keep the changes for the next publish
+                if len(dirty) > 0:
+                    self.rc.sadd(RedisKeys.STATIONS_SNAPSHOT_DIRTY, *dirty)
+                raise
+        finally:
+            self.release_lock_script(keys=[RedisKeys.STATIONS_SNAPSHOT_LOCK], args=[token])
+
+        self.logger.info(f"Stations snapshot version {version} published: {len(df)} stations, "
+                         f"{len(dirty)} changed, {len(blob) / 1e6:.2f} MB, took {perf_counter() - t_:.2f} seconds")
+        return version
+
+    def get_map_figure(self, coloring_parameter, colorscale: str, snapshot_version: int) -> typing.Optional[str]:
+        """
+            Get the cached map figure JSON built from the given stations snapshot
+            version, and count the cache hit or miss.
+        """
+        figure_json = self.rc.get(RedisKeys.get_map_figure_key(coloring_parameter, colorscale, snapshot_version))
+        self.rc.hincrby(RedisKeys.MAP_FIGURE_CACHE_STATS, "misses" if figure_json is None else "hits", 1)
+        return figure_json
+
+    def set_map_figure(self,
+                       coloring_parameter,
+                       colorscale: str,
+                       snapshot_version: int,
+                       figure_json: str,
+                       ttl: int = MAP_FIGURE_CACHE_TTL_SECONDS):
+        self.rc.set(RedisKeys.get_map_figure_key(coloring_parameter, colorscale, snapshot_version),
+                    figure_json, ex=ttl)
+
+    def get_map_figure_cache_stats(self) -> dict:
+        stats = {key: int(value) for key, value in self.rc.hgetall(RedisKeys.MAP_FIGURE_CACHE_STATS).items()}
+        stats.setdefault("hits", 0)
+        stats.setdefault("misses", 0)
+        return stats
+
+    @staticmethod
+    def _write_snapshot(df: pd.DataFrame) -> bytes:
+        sink = pa.BufferOutputStream()
+        feather.write_feather(df, sink, compression="zstd")
+        return sink.getvalue().to_pybytes()
+
+    @staticmethod
+    def _read_snapshot(blob: bytes) -> pd.DataFrame:
+        return feather.read_table(pa.BufferReader(blob)).to_pandas()
+
+    def _scan_observation_stations_info(self, station_ids: list = None) -> pd.DataFrame:
+        """
+            Collect info of the stations (all of them by default) from their hashes
+        """
+        if station_ids is None:
+            station_ids = self.get_all_station_ids()
+
+        pipeline = self.rc.pipeline(transaction=False)
 
-        # Add the most recent data to the plot?
-        #
-        # TODO Remove this part as the most recent temperature value is going to be part
-        #   of the station info hash
         for station_id in station_ids:
-            pipeline.ts().get(RedisKeys.get_rt_data_key(station_id, "temperature"))
-        ts_data = pipeline.execute(raise_on_error=False)
-
-        ts_data_updated = list()
-
-        for value, station_id in zip(ts_data, station_ids):
-            if isinstance(value, tuple):
-                ts_data_updated.append(
-                    {
-                        'station_id': station_id,
-                        'ts': value[0],
-                        'temperature': value[1] if value[1] > -99911990 else np.nan
-                    }
-                )
-            elif isinstance(value, redis.exceptions.ResponseError):
-                ts_data_updated.append(
-                    {
-                        'station_id': station_id,
-                        'ts': int(time() * 1000),
-                        'temperature': np.nan
-                    }
-                )
-            else:
-                ts_data_updated.append(
-                    {
-                        'station_id': station_id,
-                        'ts': int(time() * 1000),
-                        'temperature': np.nan
-                    }
-                )
-
-        df_ts = pd.DataFrame(ts_data_updated)
-        df = pd.DataFrame(data)
-        df = pd.merge(df, df_ts, on='station_id')
-        # return pd.DataFrame(data)
+            pipeline.hgetall(RedisKeys.get_station_info_hash_key(station_id=station_id))
+
+        # Hashes of removed stations are empty
+        df = pd.DataFrame([station for station in pipeline.execute() if 'station_id' in station])
 
         for col in df.columns:
             if col.endswith("_val") or col.endswith("_ts"):
                 df[col] = df[col].astype(float)
 
+        # Coordinates are strings, empty if unknown
+        for col in ['latitude', 'longitude']:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+
+        # Old data may still have MISSING_VALUE sentinels instead of missing values
+        value_columns = [col for col in df.columns if col.endswith("_val")]
+        df[value_columns] = df[value_columns].mask(df[value_columns] < MIN_VALID_VALUE)
+
+        # The most recent temperature. Stations without it get the current time and NaN
+        temperature_ts, temperature_val = f"{Metrics.Temperature}_ts", f"{Metrics.Temperature}_val"
+        df['ts'] = df[temperature_ts] if temperature_ts in df.columns else np.nan
+        df['ts'] = df['ts'].fillna(time() * 1000).astype(np.int64)
+        df['temperature'] = df[temperature_val] if temperature_val in df.columns else np.nan
+
         return df
 
+    @staticmethod
+    def select_resolution(ts_from, ts_to) -> typing.Optional[int]:
+        """
+            Choose the timeseries to read for the time range: None for raw samples, or the
+            bucket size of the finest compaction series that keeps the number of points
+            under TS_MAX_POINTS_PER_QUERY.
+        """
+        if not isinstance(ts_from, int) or not isinstance(ts_to, int):
+            # Open ranges like "-" and "+" are read from raw samples
+            return None
+
+        span = ts_to - ts_from
+        if span <= TS_RAW_MAX_SPAN_MS:
+            return None
+
+        buckets = sorted(TS_COMPACTIONS.keys())
+        for bucket_ms in buckets:
+            if span // bucket_ms <= TS_MAX_POINTS_PER_QUERY:
+                return bucket_ms
+        return buckets[-1]
+
     def get_timeseries_data(self,
                             station_id: str,
                             data_keyword: str,
                             ts_from: int,
-                            ts_to: int) -> (list, list):
-        data: list
+                            ts_to: int,
+                            resolution: typing.Union[str, int] = "auto",
+                            aggregation: str = "avg") -> (np.ndarray, np.ndarray):
+        """
+            Read station metric samples in the time range.
+
+        :param station_id:
+        :param data_keyword:
+        :param ts_from:
+        :param ts_to:
+        :param resolution: "raw" for raw samples, bucket size in milliseconds of one of
+            TS_COMPACTIONS, or "auto" to choose based on the length of the time range
+        :param aggregation: Aggregation of the compaction series, one of TS_COMPACTION_AGGREGATIONS
+        :return: Timestamps in milliseconds (int64) and values (float64) as NumPy arrays
+        """
+        if resolution == "auto":
+            resolution = self.select_resolution(ts_from, ts_to)
+        elif resolution == "raw":
+            resolution = None
+
+        if resolution is None:
+            key = RedisKeys.get_rt_data_key(station_id, data_keyword)
+        else:
+            key = RedisKeys.get_compaction_key(station_id, data_keyword, aggregation, resolution)
+
         try:
-            data = self.rc.ts().range(
-                RedisKeys.get_rt_data_key(station_id, data_keyword),
-                ts_from,
-                ts_to)
+            # MISSING_VALUE sentinels of the old data are dropped by Redis
+            data = self.rc.ts().range(key, ts_from, ts_to,
+                                      filter_by_min_value=MIN_VALID_VALUE,
+                                      filter_by_max_value=MAX_VALID_VALUE)
         except redis.ResponseError:
-            return [], []
+            return self._to_arrays([])
 
-        n = 0
-        while n < len(data):
-            if data[n][1] < -99911990:
-                data.pop(n)
-                continue
-            n += 1
+        return self._to_arrays(data)
 
-        try:
-            x, y = zip(*data)
-        except ValueError:
-            return [], []
-        return x, y
+    @staticmethod
+    def _to_arrays(data: list) -> (np.ndarray, np.ndarray):
+        """
+            Convert a list of (timestamp, value) samples to int64 array of timestamps
+            and float64 array of values
+        """
+        if len(data) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        samples = np.array(data, dtype=np.float64)
+        return samples[:, 0].astype(np.int64), samples[:, 1]
 
     def get_timeseries_data_multi(self,
                                   station_id: str,
                                   data_keywords: typing.List[str],
                                   ts_from: int,
-                                  ts_to: int) -> typing.Dict[str, typing.Tuple[list, list]]:
+                                  ts_to: int,
+                                  resolution: typing.Union[str, int] = "auto",
+                                  aggregation: str = "avg"
+                                  ) -> typing.Dict[str, typing.Tuple[np.ndarray, np.ndarray]]:
         """
-            Note that this is better to rewrite with Redis pipeline logic. The only thing is that
-            it may cause the error if some station and keyword do not exist. Therefore, update
-            the logic of time series data creation before updating this method.
+            Read several metrics of a station in a single round trip. If a timeseries does
+            not exist, or reading it fails, that metric gets empty arrays, while the others
+            are returned as usual.
         :param station_id:
         :param data_keywords:
         :param ts_from:
         :param ts_to:
-        :return:
+        :param resolution: See get_timeseries_data()
+        :param aggregation: See get_timeseries_data()
+        :return: Metric -> (timestamps, values) NumPy arrays
         """
-        data = dict()
+        if resolution == "auto":
+            resolution = self.select_resolution(ts_from, ts_to)
+        elif resolution == "raw":
+            resolution = None
+
+        pipe = self.rc.pipeline(transaction=False)
+
         for data_keyword in data_keywords:
-            data[data_keyword] = self.get_timeseries_data(station_id=station_id,
-                                                          data_keyword=data_keyword,
-                                                          ts_from=ts_from,
-                                                          ts_to=ts_to)
+            if resolution is None:
+                key = RedisKeys.get_rt_data_key(station_id, data_keyword)
+            else:
+                key = RedisKeys.get_compaction_key(station_id, data_keyword, aggregation, resolution)
+
+            pipe.ts().range(key, ts_from, ts_to,
+                            filter_by_min_value=MIN_VALID_VALUE,
+                            filter_by_max_value=MAX_VALID_VALUE)
+
+        data = dict()
+        for data_keyword, reply in zip(data_keywords, pipe.execute(raise_on_error=False)):
+            if isinstance(reply, Exception):
+                self.logger.debug(f"Failed to get {data_keyword} data for station {station_id}: {reply}")
+                reply = []
+            data[data_keyword] = self._to_arrays(reply)
         return data
 
-    def ping(self) -> bool:
-        return self.rc.ping()
+    def get_response_validators(self, url: str) -> dict:
+        validators = self.rc.hget(RedisKeys.HTTP_RESPONSE_VALIDATORS, url)
 
-    def get_all_station_ids(self) -> list:
-        return list(self.rc.smembers("weather_station:weather.gov:station_ids"))
+        if validators is None:
+            return dict()
+        return json.loads(validators)
 
-    def get_weather_station_last_data_dump_ts(self, station_id: str, metric: Metrics) -> int:
-        ts = self.rc.hget(
-            name=RedisKeys.WEATHER_STATIONS_DATA_DUMP_TS,
-            key=f"{station_id}:{metric}"
-        )
-        if ts is None:
-            return 0
+    def set_response_validators(self, url: str, validators: dict):
+        self.rc.hset(RedisKeys.HTTP_RESPONSE_VALIDATORS, url, json.dumps(validators))
 
-        return int(ts)
+    def get_timeseries_data_bulk(self,
+                                 metric: Metrics,
+                                 station_ids: typing.List[str],
+                                 ts_from: int,
+                                 ts_to: int,
+                                 stations_per_query: int = DUMP_MRANGE_STATIONS_PER_QUERY
+                                 ) -> typing.Iterator[typing.Tuple[str, np.ndarray, np.ndarray]]:
+        """
+            Read raw samples of a metric of many stations with TS.MRANGE, selecting the
+            timeseries by their labels, `stations_per_query` stations at a time. Stations
+            that have no timeseries or no samples in the time range are not returned.
 
-    def get_weather_station_last_data_dump_ts_all(self) -> dict:
-        tss = self.rc.hgetall(name=RedisKeys.WEATHER_STATIONS_DATA_DUMP_TS)
+        :param metric:
+        :param station_ids:
+        :param ts_from:
+        :param ts_to:
+        :param stations_per_query: Number of stations in the station_id filter of a query
+        :return: Iterator over (station_id, timestamps, values) of every station
+        """
+        for i in range(0, len(station_ids), stations_per_query):
+            chunk = station_ids[i:i + stations_per_query]
 
-        for key, value in tss.items():
-            tss[key] = int(float(value) / 1000)
-        return tss
+            try:
+                replies = self.rc.ts().mrange(ts_from, ts_to,
+                                              filters=[f"metric={metric}",
+                                                       "resolution=raw",
+                                                       f"station_id=({','.join(chunk)})"],
+                                              filter_by_min_value=MIN_VALID_VALUE,
+                                              filter_by_max_value=MAX_VALID_VALUE)
+            except redis.ResponseError as e:
+                self.logger.error(f"Failed to get {metric} data for {len(chunk)} stations: {e}")
+                raise
+
+            for reply in replies:
+                for key, (_, data) in reply.items():
+                    if len(data) == 0:
+                        continue
+
+                    _, station_id, _ = RedisKeys.parse_rt_data_key(key)
+                    yield station_id, *self._to_arrays(data)
+
+    def ping(self) -> bool:
+        return self.rc.ping()
+
+    def get_all_station_ids(self) -> list:
+        return list(self.rc.smembers(RedisKeys.WEATHER_STATIONS_IDS))
+
+    def get_data_dump_manifest(self, month: str) -> typing.Dict[str, dict]:
+        """
+            Shards of the data dump of a month that are done
+        :param month: Month like "2024-07"
+        :return: "{metric}:{bucket}" -> shard info
+        """
+        manifest = self.rc.hgetall(RedisKeys.get_data_dump_manifest_key(month))
+        return {shard: json.loads(info) for shard, info in manifest.items()}
 
-    def set_weather_station_last_data_dump_ts(self, station_id: str, metric: Metrics, ts: int):
+    def set_data_dump_manifest_shard(self, month: str, metric: Metrics, bucket: int, info: dict):
         self.rc.hset(
-            name=RedisKeys.WEATHER_STATIONS_DATA_DUMP_TS,
-            key=f"{station_id}:{metric}",
-            value=str(ts)
+            name=RedisKeys.get_data_dump_manifest_key(month),
+            key=f"{metric}:{bucket}",
+            value=json.dumps(info)
         )
@@ -0,0 +1,170 @@
+import typing
+import numpy as np
+import pandas as pd
+
+
+EARTH_RADIUS_KM = 6371.0088
+# Length of a degree of latitude
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+        Great-circle distance in km between points given in degrees
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class GridIndex:
+    """
+        Spatial index of points on a regular latitude/longitude grid. Point indices are
+        sorted by the grid cell they fall into, so the points of a range of cells in a
+        grid row are a contiguous slice found with binary search.
+
+        Bounding boxes crossing the antimeridian are not supported, we only have
+        stations in the U.S.
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cell_deg: float = 1.0):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.cell_deg = cell_deg
+        self.n_cols = int(np.ceil(360 / cell_deg))
+
+        # Points without coordinates are not indexed
+        valid = np.flatnonzero(~np.isnan(self.lat) & ~np.isnan(self.lon))
+        cells = self._get_cells(self.lat[valid], self.lon[valid])
+
+        order = np.argsort(cells, kind="stable")
+        self.order = valid[order]
+        self.cells = cells[order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def _get_rows(self, lat) -> np.ndarray:
+        return np.floor((np.asarray(lat) + 90) / self.cell_deg).astype(np.int64)
+
+    def _get_cols(self, lon) -> np.ndarray:
+        return np.clip(np.floor((np.asarray(lon) + 180) / self.cell_deg).astype(np.int64), 0, self.n_cols - 1)
+
+    def _get_cells(self, lat, lon) -> np.ndarray:
+        return self._get_rows(lat) * self.n_cols + self._get_cols(lon)
+
+    def query_bbox(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        """
+        :return: Sorted indices of the points inside the bounding box
+        """
+        rows = np.arange(self._get_rows(south), self._get_rows(north) + 1)
+        col_from, col_to = self._get_cols(west), self._get_cols(east)
+
+        # Slice of the points of every grid row that fall into the columns of the box
+        starts = np.searchsorted(self.cells, rows * self.n_cols + col_from, side="left")
+        ends = np.searchsorted(self.cells, rows * self.n_cols + col_to, side="right")
+
+        candidates = np.concatenate([self.order[start:end] for start, end in zip(starts, ends)] +
+                                    [np.empty(0, dtype=self.order.dtype)])
+
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return np.sort(candidates[inside])
+
+    def nearest(self, lat: float, lon: float, n: int = 10) -> (np.ndarray, np.ndarray):
+        """
+            Find the `n` points nearest to the given one. The search box grows by a grid
+            cell in every direction until it holds `n` points and the circle through the
+            n-th of them.
+
+        :return: Indices of the points and distances to them in km, sorted by distance
+        """
+        n = min(n, len(self))
+        half_size = self.cell_deg
+
+        while True:
+            # Degrees of longitude get shorter towards the poles
+            lon_half_size = half_size / max(np.cos(np.radians(min(abs(lat) + half_size, 89.9))), 1e-6)
+            covers_all = half_size >= 180 and lon_half_size >= 360
+
+            if covers_all:
+                candidates = self.order
+            else:
+                candidates = self.query_bbox(lon - lon_half_size, lat - half_size, lon + lon_half_size, lat + half_size)
+
+            if len(candidates) >= n:
+                distances = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+                ind = np.argsort(distances, kind="stable")[:n]
+
+                # The box holds every point closer than its half size
+                if covers_all or n == 0 or distances[ind[-1]] <= half_size * KM_PER_DEGREE:
+                    return candidates[ind], distances[ind]
+
+            half_size *= 2
+
+
+def get_stations_grid_index(df: pd.DataFrame) -> GridIndex:
+    """
+        Grid index of the stations table by its latitude and longitude columns,
+        stations with invalid coordinates are not indexed
+    """
+    lat = pd.to_numeric(df['latitude'], errors='coerce').to_numpy(dtype=np.float64)
+    lon = pd.to_numeric(df['longitude'], errors='coerce').to_numpy(dtype=np.float64)
+    return GridIndex(lat, lon)
+
+
+def grid_clusters(lat: np.ndarray, lon: np.ndarray, cell_deg: float) -> (np.ndarray, np.ndarray):
+    """
+        Group points by the cells of a regular latitude/longitude grid.
+
+    :return: ID of every non-empty grid cell, and the position of the cell of every
+        point in that array
+    """
+    rows = np.floor((np.asarray(lat) + 90) / cell_deg).astype(np.int64)
+    cols = np.floor((np.asarray(lon) + 180) / cell_deg).astype(np.int64)
+
+    return np.unique(rows * int(np.ceil(360 / cell_deg)) + cols, return_inverse=True)
+
+
+def cluster_mean(inverse: np.ndarray, values: np.ndarray, n_clusters: int) -> np.ndarray:
+    """
+        Mean of the values of every cluster, NaN values are ignored. Clusters
+        without values get NaN.
+    """
+    ind_nan = np.isnan(values)
+
+    sums = np.bincount(inverse, weights=np.where(ind_nan, 0, values), minlength=n_clusters)
+    counts = np.bincount(inverse, weights=~ind_nan, minlength=n_clusters)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def zoom_to_cell_deg(zoom: float, cells_per_tile: int) -> float:
+    """
+        Size of a clustering grid cell in degrees, so a map tile of the zoom
+        level (360 / 2^zoom degrees wide) has `cells_per_tile` cells
+    """
+    return 360 / 2 ** int(np.floor(zoom)) / cells_per_tile
+
+
+def get_viewport(relayout_data: typing.Optional[dict]) -> typing.Optional[dict]:
+    """
+        Visible bounds and zoom of a mapbox figure from its relayoutData, or None if
+        the map view has not changed
+    """
+    if not relayout_data or "mapbox.zoom" not in relayout_data:
+        return None
+
+    try:
+        coordinates = np.asarray(relayout_data["mapbox._derived"]["coordinates"], dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    return {
+        "west": float(coordinates[:, 0].min()),
+        "east": float(coordinates[:, 0].max()),
+        "south": float(coordinates[:, 1].min()),
+        "north": float(coordinates[:, 1].max()),
+        "zoom": float(relayout_data["mapbox.zoom"]),
+    }
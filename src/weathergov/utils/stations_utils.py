@@ -1,14 +1,43 @@
 import os
+import typing
+import asyncio
 import requests
 import logging
+import numpy as np
 
 from time import time, sleep
-from weathergov.constants import APP_NAME, MISSING_VALUE
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from weathergov.constants import Metrics, MISSING_VALUE, HISTORICAL_LOADER_CONCURRENCY
+from weathergov.objects.observations import ObservationBatch
+from weathergov.utils.time_utils import iso_to_epoch_ms
+from weathergov.utils.http_utils import get_client, ResponseValidatorCache
 
 
 logger = logging.getLogger(__name__)
 
 
+# Metric and the name of the corresponding property in weather.gov observations
+OBSERVATION_PROPERTIES = (
+    (Metrics.Temperature, "temperature"),
+    (Metrics.DewPoint, "dewpoint"),
+    (Metrics.WindDirection, "windDirection"),
+    (Metrics.WindSpeed, "windSpeed"),
+    (Metrics.WindGust, "windGust"),
+    (Metrics.BarometricPressure, "barometricPressure"),
+    (Metrics.SeaLevelPressure, "seaLevelPressure"),
+    (Metrics.Visibility, "visibility"),
+    (Metrics.Precipitation3h, "precipitationLast3Hours"),
+    (Metrics.RelativeHumidity, "relativeHumidity"),
+    (Metrics.WindChill, "windChill"),
+    (Metrics.HeatIndex, "heatIndex"),
+)
+
+# Stands in for a measurement that is absent from the observation properties
+_NO_MEASUREMENT = dict()
+
+
 def get_all_stations() -> list:
     """
         This function reads all the stations from Weather.gov
@@ -22,12 +51,10 @@ def get_all_stations() -> list:
     weather_gov_api_url = os.environ.get('WEATHER_GOV_API_URL')
     url_station_link = f"{weather_gov_api_url}/stations"
 
-    headers = {
-        "User-Agent": APP_NAME
-    }
+    client = get_client()
 
     while True:
-        response = requests.get(url_station_link, headers=headers)
+        response = client.get(url_station_link)
 
         if response.status_code != 200:
             logger.warning(f"Got status code {response.status_code}")
@@ -69,6 +96,8 @@ def get_all_stations() -> list:
                     logger.warning(f"Key '{their_key}' not found in the feature properties")
                     station[my_key] = ""
 
+            station['station_state'] = get_state_from_county_url(station['station_county_url'])
+
             # Get the elevation
             try:
                 elevation = feature_properties['elevation']
@@ -109,89 +138,188 @@ def get_all_stations() -> list:
     return stations
 
 
-def get_station_data(station_id: str) -> dict:
+def get_state_from_county_url(county_url: str) -> str:
+    """
+        County zone IDs start with the state code, like
+        https://api.weather.gov/zones/county/WIC071 for a county in Wisconsin
+    :param county_url:
+    :return: Two letter state code or an empty string if it is unknown
     """
+    zone_id = county_url.rstrip("/").split("/")[-1] if county_url else ""
 
-    :param station_id:
+    if len(zone_id) < 3 or zone_id[2] != "C":
+        return ""
+    return zone_id[:2]
+
+
+def parse_observations(rj: dict) -> ObservationBatch:
+    """
+        Convert a response of /stations/{id}/observations endpoint into a columnar
+        batch. The columns are described by OBSERVATION_PROPERTIES table, so all the
+        metrics are extracted in a single pass over the features, and missing or null
+        values become NaN.
+    :param rj: Response in JSON format
     :return:
     """
+    try:
+        properties = [feature['properties'] for feature in rj['features']]
+    except KeyError:
+        logger.warning(f"Failed to find 'features' or 'properties' key in the response")
+        return ObservationBatch.empty()
 
-    t_ = time()
-    data = {
-        "timestamp": [],
-        "temperature": [],
-        "dew_point": [],
-        "wind_direction": [],
-        "wind_speed": [],
-        "wind_gust": [],
-        "barometric_pressure": [],
-        "sea_level_pressure": [],
-        "visibility": [],
-        "precipitation_last_3h": [],
-        "relative_humidity": [],
-        "wind_chill": [],
-        "heat_index": []
-    }
+    if len(properties) == 0:
+        return ObservationBatch.empty()
+
+    # Parse the whole timestamp column at once, it is shared by all the metrics
+    timestamps = iso_to_epoch_ms([p['timestamp'] for p in properties])
+
+    # One row per observation and one column per metric. None is converted to NaN
+    their_keys = [their_key for _, their_key in OBSERVATION_PROPERTIES]
+    rows = [[(p.get(their_key) or _NO_MEASUREMENT).get('value') for their_key in their_keys] for p in properties]
+    values = np.array(rows, dtype=np.float64).T
+
+    # weather.gov returns the most recent observations first
+    order = np.argsort(timestamps, kind="stable")
 
+    return ObservationBatch(
+        timestamps=timestamps[order],
+        values={metric: np.ascontiguousarray(values[i, order]) for i, (metric, _) in enumerate(OBSERVATION_PROPERTIES)}
+    )
+
+
+def get_station_data_request(station_id: str, start_ts: int = None) -> (str, typing.Optional[dict]):
+    """
+        URL and query parameters of the request for the observations of a station
+        made after `start_ts`, see get_station_data()
+    """
     weather_gov_api_url = os.environ.get('WEATHER_GOV_API_URL')
     url_station_link = f"{weather_gov_api_url}/stations/{station_id}/observations"
 
-    headers = {
-        "User-Agent": APP_NAME
-    }
+    params = None
+    if start_ts:
+        # The API treats start as inclusive, so ask for the next second after the
+        # newest observation we already have
+        start = datetime.fromtimestamp(start_ts // 1000 + 1, tz=timezone.utc)
+        params = {"start": start.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+    return url_station_link, params
+
+
+def get_station_data(station_id: str,
+                     start_ts: int = None,
+                     validator_cache: ResponseValidatorCache = None) -> typing.Optional[ObservationBatch]:
+    """
+
+    :param station_id:
+    :param start_ts: Unix timestamp in milliseconds. If set, only observations made
+        after that time are requested, otherwise we get whatever the API returns by
+        default (about 1 week of data).
+    :param validator_cache: If set, the request is conditional. Validators of a new
+        response are saved when the caller commits them for the request URL, see
+        get_station_data_request() and get_request_url()
+    :return: None if the observations have not changed since the previous request
+    """
+
+    t_ = time()
+
+    url_station_link, params = get_station_data_request(station_id, start_ts)
+
+    response = get_client().get(url_station_link, params=params, validator_cache=validator_cache)
 
-    response = requests.get(url_station_link, headers=headers)
+    if response.status_code == 304:
+        logger.debug(f"Observations for station {station_id} have not changed")
+        return None
 
     if response.status_code != 200:
         logger.warning(f"Got status code {response.status_code} for station {station_id}")
-        return data
+        return ObservationBatch.empty()
 
     # Get response in JSON format
-    rj = response.json()
-
-    if "features" not in rj.keys():
-        logger.warning(f"Failre to find 'features' key in a response for station {station_id}")
-
-    features: list
-    features = rj['features']
-
-    for feature in features:
-        properties = feature['properties']
-
-        data["timestamp"].append(properties["timestamp"])
-
-        for my_key, their_key in [("temperature", "temperature"),
-                                  ("dew_point", "dewpoint"),
-                                  ("wind_direction", "windDirection"),
-                                  ("wind_speed", "windSpeed"),
-                                  ("wind_gust", "windGust"),
-                                  ("barometric_pressure", "barometricPressure"),
-                                  ("sea_level_pressure", "seaLevelPressure"),
-                                  ("visibility", "visibility"),
-                                  ("precipitation_last_3h", "precipitationLast3Hours"),
-                                  ("relative_humidity", "relativeHumidity"),
-                                  ("wind_chill", "windChill"),
-                                  ("heat_index", "heatIndex")]:
-            try:
-                value = properties[their_key]['value']
-            except KeyError:
-                value = MISSING_VALUE
-
-            if value is None:
-                # We must replace missing value with some numerical value
-                # which is not going to be confused with the real observations
-                value = MISSING_VALUE
+    data = parse_observations(response.json())
 
-            data[my_key].append(value)
     logger.debug(f"get_station_data() run within {time() - t_:.1f} seconds")
     return data
 
 
-def get_station_data_rt(station_id: str) -> dict:
+async def fetch_station_data_concurrently(
+        station_ids: typing.Iterable[str],
+        concurrency: int = HISTORICAL_LOADER_CONCURRENCY,
+        watermarks: typing.Dict[str, int] = None,
+        validator_cache: ResponseValidatorCache = None
+) -> typing.AsyncIterator[typing.Tuple[str, typing.Optional[ObservationBatch]]]:
+    """
+        Fetch observations for many stations keeping up to `concurrency` requests
+        in flight. Station IDs are pulled lazily from `station_ids` (it may be a
+        generator that pops them from the Redis queue), and (station_id, data) pairs
+        are yielded in the order the requests finish, so the caller can write each
+        result to Redis while the other requests are still running.
+
+        The requests themselves are blocking, so they run in a thread pool sized
+        to the concurrency limit.
+    :param station_ids:
+    :param concurrency:
+    :param watermarks: Optional mapping of station ID to the newest timestamp (ms) we
+        already have for it. It is read right after a station ID is pulled from
+        `station_ids`, so the producer may fill it lazily. Only newer observations
+        are requested for these stations.
+    :param validator_cache: If set, the requests are conditional, and data is None for
+        the stations whose observations have not changed.
+    :return:
+    """
+    if concurrency < 1:
+        raise ValueError(f"Concurrency must be a positive integer, got {concurrency}")
+
+    loop = asyncio.get_running_loop()
+    station_ids = iter(station_ids)
+
+    # Maps a future of the running request to the station ID it was issued for
+    pending = dict()
+
+    def submit_next() -> bool:
+        try:
+            station_id = next(station_ids)
+        except StopIteration:
+            return False
+
+        start_ts = watermarks.get(station_id) if watermarks is not None else None
+        future = loop.run_in_executor(executor, get_station_data, station_id, start_ts, validator_cache)
+        pending[future] = station_id
+        return True
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="station-fetch") as executor:
+        # Fill the window first
+        while len(pending) < concurrency and submit_next():
+            pass
+
+        while pending:
+            done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+
+            for future in done:
+                station_id = pending.pop(future)
+
+                # Keep the window full before handing the result over
+                submit_next()
+
+                try:
+                    data = future.result()
+                except requests.RequestException as e:
+                    logger.warning(f"Failed to get data for station {station_id}: {e}")
+                    continue
+                except Exception as e:
+                    # A malformed response must not stop the other stations
+                    logger.exception(f"Failed to process data of station {station_id}: {e}")
+                    continue
+
+                yield station_id, data
+
+
+def get_station_data_rt(station_id: str, validator_cache: ResponseValidatorCache = None) -> typing.Optional[dict]:
     """
 
     :param station_id:
-    :return:
+    :param validator_cache: If set, the request is conditional. The caller commits the
+        validators of a new response once its data is saved
+    :return: None if the latest observation have not changed since the previous request
     """
 
     t_ = time()
@@ -212,13 +340,13 @@ def get_station_data_rt(station_id: str) -> dict:
     }
 
     weather_gov_api_url = os.environ.get('WEATHER_GOV_API_URL')
-    url_station_link = f"{weather_gov_api_url}/stations/{station_id}/observations"
+    url_station_link = f"{weather_gov_api_url}/stations/{station_id}/observations/latest"
 
-    headers = {
-        "User-Agent": APP_NAME
-    }
+    response = get_client().get(url_station_link, validator_cache=validator_cache)
 
-    response = requests.get(url_station_link, headers=headers)
+    if response.status_code == 304:
+        logger.debug(f"Latest observation for station {station_id} have not changed")
+        return None
 
     if response.status_code != 200:
         logger.warning(f"Got status code {response.status_code} for station {station_id}")
@@ -230,5 +358,22 @@ def get_station_data_rt(station_id: str) -> dict:
     if "properties" not in rj.keys():
         logger.warning(f"Failre to find 'properties' key in a response for station {station_id}")
 
+        return data
+
     properties: dict
     properties = rj['properties']
+
+    data["timestamp"] = properties["timestamp"]
+
+    for my_key, their_key in OBSERVATION_PROPERTIES:
+        try:
+            value = properties[their_key]['value']
+        except (KeyError, TypeError):
+            value = MISSING_VALUE
+
+        if value is None:
+            value = MISSING_VALUE
+
+        data[my_key] = value
+    logger.debug(f"get_station_data_rt() run within {time() - t_:.1f} seconds")
+    return data
@@ -0,0 +1,33 @@
+import typing
+import numpy as np
+import pandas as pd
+
+
+# weather.gov reports observation time in UTC without fractional seconds,
+# like "2024-07-10T12:51:00+00:00"
+_UTC_SUFFIX = "+00:00"
+_UTC_TIMESTAMP_LENGTH = len("2024-07-10T12:51:00+00:00")
+
+
+def iso_to_epoch_ms(timestamps: typing.Sequence[str]) -> np.ndarray:
+    """
+        Convert ISO-8601 strings like "2024-07-10T12:51:00+00:00" to an int64 array
+        of unix timestamps in milliseconds. The whole column is parsed at once instead
+        of calling datetime.strptime() for every string.
+
+        If all the timestamps are in the format weather.gov uses, NumPy parses them
+        directly, otherwise (other offsets, fractional seconds) pandas does.
+    :param timestamps:
+    :return:
+    """
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    ts = np.asarray(timestamps, dtype=str)
+
+    if (np.char.str_len(ts) == _UTC_TIMESTAMP_LENGTH).all() and np.char.endswith(ts, _UTC_SUFFIX).all():
+        # Cutting the strings to the fixed length drops the UTC offset
+        return ts.astype(f"U{_UTC_TIMESTAMP_LENGTH - len(_UTC_SUFFIX)}").astype("datetime64[ms]").astype(np.int64)
+
+    dt = pd.to_datetime(pd.Index(ts), utc=True, format="ISO8601")
+    return dt.as_unit("ms").asi8.astype(np.int64, copy=False)
@@ -0,0 +1,102 @@
+import os
+import typing
+import logging
+import numpy as np
+import pyarrow as pa
+
+from weathergov.utils.redis_utils import RedisClient
+from weathergov.utils.parquet_utils import DumpDatasetReader
+
+
+logger = logging.getLogger(__name__)
+
+
+# Observations come about every hour, so Redis data that starts this close to
+# the beginning of a time range is not looked for in the dumps
+MAX_SAMPLE_GAP_MS = 3600 * 1000
+
+
+def aggregate_buckets(x: np.ndarray,
+                      y: np.ndarray,
+                      bucket_ms: int,
+                      aggregation: str = "avg") -> (np.ndarray, np.ndarray):
+    """
+        Aggregate sorted samples into time buckets the same way Redis compaction
+        rules do, every bucket gets the timestamp of its start.
+
+    :param x: Sorted timestamps in milliseconds
+    :param y:
+    :param bucket_ms: Bucket size in milliseconds
+    :param aggregation: One of "avg", "min" and "max"
+    :return: Bucket timestamps and aggregated values
+    """
+    if len(x) == 0:
+        return x, y
+
+    buckets = x // bucket_ms * bucket_ms
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+
+    if aggregation == "min":
+        values = np.minimum.reduceat(y, starts)
+    elif aggregation == "max":
+        values = np.maximum.reduceat(y, starts)
+    else:
+        values = np.add.reduceat(y, starts) / np.diff(np.append(starts, len(y)))
+
+    return buckets[starts], values
+
+
+class TimeseriesStore:
+    """
+        Reads station timeseries from Redis, and the part of the time range that is
+        older than what Redis has, from the Parquet dumps. Redis is preferred where
+        both have data. Dumps have raw samples only, so for long time ranges they
+        are aggregated to the buckets of the compaction series read from Redis.
+    """
+
+    def __init__(self, rc: RedisClient, dump_dir: str = None):
+        self.rc = rc
+        self.reader = DumpDatasetReader(dump_dir or os.environ.get('DUMP_DATA_DIR', '.'))
+
+    def get_timeseries_data_multi(self,
+                                  station_id: str,
+                                  data_keywords: typing.List[str],
+                                  ts_from: int,
+                                  ts_to: int,
+                                  aggregation: str = "avg"
+                                  ) -> typing.Dict[str, typing.Tuple[np.ndarray, np.ndarray]]:
+        """
+            See RedisClient.get_timeseries_data_multi(), the resolution is chosen
+            based on the length of the time range.
+        """
+        resolution = self.rc.select_resolution(ts_from, ts_to)
+
+        data = self.rc.get_timeseries_data_multi(
+            station_id=station_id,
+            data_keywords=data_keywords,
+            ts_from=ts_from,
+            ts_to=ts_to,
+            resolution="raw" if resolution is None else resolution,
+            aggregation=aggregation
+        )
+
+        for data_keyword, (x, y) in data.items():
+            redis_from = int(x[0]) if len(x) > 0 else ts_to
+
+            if redis_from - ts_from <= max(resolution or 0, MAX_SAMPLE_GAP_MS):
+                continue
+
+            try:
+                x_dump, y_dump = self.reader.read(station_id, data_keyword, ts_from, redis_from)
+            except (OSError, pa.ArrowException) as e:
+                logger.warning(f"Failed to read dumped {data_keyword} data for station {station_id}: {e}")
+                continue
+
+            if len(x_dump) == 0:
+                continue
+
+            if resolution is not None:
+                x_dump, y_dump = aggregate_buckets(x_dump, y_dump, resolution, aggregation)
+
+            data[data_keyword] = np.concatenate([x_dump, x]), np.concatenate([y_dump, y])
+        return data
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+
+import pytest
+import redis
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "src"))
+# The weather.gov stub is shared with the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts", "python", "benchmarks"))
+
+from _fixtures import StubWeatherGovServer  # noqa: E402
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def local_tz(monkeypatch):
+    """
+        Local time zone of the process is America/Chicago, so a naive datetime is not UTC
+    """
+    monkeypatch.setenv("TZ", "America/Chicago")
+    time.tzset()
+    yield "America/Chicago"
+
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.fixture
+def rc(monkeypatch):
+    """
+        RedisClient backed by an in-memory fakeredis server
+    """
+    from weathergov.utils.redis_utils import RedisClient
+
+    monkeypatch.setenv("REDIS_HOST", "localhost")
+    monkeypatch.setenv("REDIS_PORT", "6379")
+    monkeypatch.setenv("REDIS_PASS", "")
+
+    server = fakeredis.FakeServer()
+
+    class FakeRedis(fakeredis.FakeRedis):
+        def __init__(self, decode_responses=False, **_):
+            super().__init__(server=server, decode_responses=decode_responses)
+
+    monkeypatch.setattr(redis, "Redis", FakeRedis)
+    return RedisClient()
+
+
+def make_observations(timestamps: list, temperature: float = 21.5) -> dict:
+    """
+        /stations/{id}/observations payload, the most recent observation first
+    """
+    return {
+        "features": [
+            {"properties": {"timestamp": ts, "temperature": {"value": temperature}}}
+            for ts in reversed(timestamps)
+        ]
+    }
+
+
+@pytest.fixture
+def weather_gov(monkeypatch):
+    payload = make_observations(["2024-07-01T00:00:00+00:00", "2024-07-01T01:00:00+00:00"])
+
+    with StubWeatherGovServer(payload=payload, etag='"v1"') as stub:
+        monkeypatch.setenv("WEATHER_GOV_API_URL", stub.url)
+        yield stub
@@ -0,0 +1,166 @@
+import os
+import numpy as np
+
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from weathergov.constants import Metrics, DUMP_STATION_BUCKETS
+from weathergov.objects.observations import ObservationBatch
+from weathergov.scripts import data_dumper
+from weathergov.scripts.data_dumper import (dump_shard,
+                                            data_cleaner,
+                                            get_station_bucket,
+                                            get_stations_hash,
+                                            get_month_time_range)
+from weathergov.utils.redis_utils import RedisKeys
+from weathergov.utils.parquet_utils import DumpDatasetReader, get_partition_dir
+
+
+HOUR_MS = 3600 * 1000
+TS_FROM = 1719792000000  # 2024-07-01
+TS_TO = TS_FROM + 31 * 24 * HOUR_MS
+MONTH = "2024-07"
+
+
+def add_samples(rc, station_ids: list, n: int = 3):
+    timestamps = TS_FROM + np.arange(n, dtype=np.int64) * HOUR_MS
+    rc.add_timeseries_data_bulk({
+        station_id: ObservationBatch(timestamps, {Metrics.Temperature: np.arange(n, dtype=np.float64) + i})
+        for i, station_id in enumerate(station_ids)
+    })
+
+
+def list_parts(dump_dir: str) -> list:
+    return sorted(os.listdir(get_partition_dir(dump_dir, Metrics.Temperature, MONTH)))
+
+
+def test_dumped_samples_are_read_back(rc, tmp_path):
+    add_samples(rc, ["A", "B"])
+
+    # Station E has no samples in the month
+    info = dump_shard(Metrics.Temperature, 3, ["A", "B", "E"], MONTH, TS_FROM, TS_TO, str(tmp_path))
+    assert info["n_bucket_stations"] == 3 and info["bucket_hash"] == get_stations_hash(["A", "B", "E"])
+    assert info["n_stations"] == 2 and info["stations_hash"] == get_stations_hash(["A", "B"])
+    assert info["n_samples"] == 6
+    assert rc.get_data_dump_manifest(MONTH)[f"{Metrics.Temperature}:3"] == info
+
+    x, y = DumpDatasetReader(str(tmp_path)).read("B", Metrics.Temperature, TS_FROM, TS_TO)
+    assert x.tolist() == [TS_FROM, TS_FROM + HOUR_MS, TS_FROM + 2 * HOUR_MS]
+    assert y.tolist() == [1, 2, 3]
+
+    # Time range is half-open
+    x, _ = DumpDatasetReader(str(tmp_path)).read("A", Metrics.Temperature, TS_FROM + HOUR_MS, TS_FROM + 2 * HOUR_MS)
+    assert x.tolist() == [TS_FROM + HOUR_MS]
+
+
+def test_shard_dumped_again_replaces_its_file(rc, tmp_path):
+    add_samples(rc, ["A", "B"])
+
+    # The first worker died before the shard was recorded in the manifest
+    dump_shard(Metrics.Temperature, 3, ["A", "B"], MONTH, TS_FROM, TS_TO, str(tmp_path))
+    info = dump_shard(Metrics.Temperature, 3, ["A", "B"], MONTH, TS_FROM, TS_TO, str(tmp_path))
+
+    assert list_parts(str(tmp_path)) == ["part-3.parquet"]
+    assert info["n_samples"] == 6
+
+
+def test_shard_without_samples_has_no_file(rc, tmp_path):
+    add_samples(rc, ["A"])
+    shard = dump_shard(Metrics.Temperature, 3, ["A"], MONTH, TS_FROM, TS_TO, str(tmp_path))
+
+    # The series of A is gone, so the file of the shard is gone too
+    rc.rc.delete(RedisKeys.get_rt_data_key("A", Metrics.Temperature))
+    info = dump_shard(Metrics.Temperature, 3, ["A", "E"], MONTH, TS_FROM, TS_TO, str(tmp_path), shard)
+
+    assert list_parts(str(tmp_path)) == []
+    assert info["n_bucket_stations"] == 2 and info["n_stations"] == 0
+    assert info["n_samples"] == 0 and info["paths"] == []
+
+
+def test_dump_is_done_once_per_bucket_stations(rc, tmp_path, monkeypatch, caplog):
+    # Worker processes would not see the in-memory Redis
+    monkeypatch.setattr(data_dumper, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setenv("DUMP_DATA_DIR", str(tmp_path))
+    freeze_time(monkeypatch, datetime(2024, 8, 5, tzinfo=timezone.utc))
+
+    # E has no samples in the month
+    add_samples(rc, ["A", "B"])
+    rc.rc.sadd(RedisKeys.WEATHER_STATIONS_IDS, "A", "B", "E")
+    data_dumper.data_dumper(max_workers=2)
+
+    # Every shard is recorded, including the ones of empty buckets
+    manifest = rc.get_data_dump_manifest(MONTH)
+    assert len(manifest) == len(Metrics) * DUMP_STATION_BUCKETS
+    assert sum(shard["n_bucket_stations"] for shard in manifest.values()) == 3 * len(Metrics)
+    assert sum(shard["n_stations"] for shard in manifest.values()) == 2
+    assert sum(shard["n_samples"] for shard in manifest.values()) == 6
+
+    with caplog.at_level("INFO"):
+        data_dumper.data_dumper(max_workers=2)
+    assert f"Data for {MONTH} has been dumped already" in caplog.text
+
+    # Only the shards of the bucket of a new station are dumped again
+    add_samples(rc, ["C"])
+    rc.rc.sadd(RedisKeys.WEATHER_STATIONS_IDS, "C")
+    caplog.clear()
+    with caplog.at_level("INFO"):
+        data_dumper.data_dumper(max_workers=2)
+    assert f"{len(Metrics)} shards are left" in caplog.text
+
+    reader = DumpDatasetReader(str(tmp_path))
+    for station_id in ["A", "B", "C"]:
+        assert len(reader.read(station_id, Metrics.Temperature, TS_FROM, TS_TO)[0]) == 3
+
+    bucket = get_station_bucket("C")
+    assert list_parts(str(tmp_path)).count(f"part-{bucket}.parquet") == 1
+
+
+def freeze_time(monkeypatch, now: datetime):
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now.astimezone(tz)
+
+    monkeypatch.setattr(data_dumper, "datetime", FrozenDatetime)
+
+
+def test_month_bounds_are_utc(local_tz, monkeypatch):
+    # It is still July 31 in Chicago
+    freeze_time(monkeypatch, datetime(2024, 8, 1, 3, 0, tzinfo=timezone.utc))
+
+    current_date, previous_date = data_dumper._get_dump_dates()
+    assert current_date == datetime(2024, 8, 1, tzinfo=timezone.utc)
+    assert previous_date.strftime('%Y-%m') == MONTH
+
+    assert get_month_time_range(previous_date) == (TS_FROM, TS_TO)
+    assert get_month_time_range(datetime(2024, 12, 31, 23, 0, tzinfo=timezone.utc)) == (1733011200000, 1735689600000)
+
+
+def test_nothing_is_dumped_on_the_first_utc_day(rc, local_tz, monkeypatch, caplog):
+    freeze_time(monkeypatch, datetime(2024, 8, 1, 3, 0, tzinfo=timezone.utc))
+
+    with caplog.at_level("INFO"):
+        data_dumper.data_dumper()
+    assert "Data should not be dumped on the first day of a month" in caplog.text
+
+
+def test_cleaner_reports_shards_left(rc, monkeypatch, caplog):
+    monkeypatch.setattr(type(rc), "get_used_memory", lambda self: 512 * 2 ** 20)
+    rc.set_data_dump_manifest_shard(MONTH, Metrics.Temperature, 3, {"n_samples": 6})
+    n_shards = len(Metrics) * DUMP_STATION_BUCKETS
+
+    # Samples of July are trimmed from September 1
+    freeze_time(monkeypatch, datetime(2024, 8, 5, tzinfo=timezone.utc))
+    with caplog.at_level("INFO"):
+        data_cleaner()
+
+    assert f"1 of {n_shards} shards of 2024-07 are dumped with 6 samples" in caplog.text
+    assert "trims the samples of 2024-07 from 2024-09-01, it uses 512.0 MB" in caplog.text
+    assert "are not dumped" not in caplog.text
+
+    freeze_time(monkeypatch, datetime(2024, 8, 29, tzinfo=timezone.utc))
+    caplog.clear()
+    with caplog.at_level("INFO"):
+        data_cleaner()
+
+    assert f"{n_shards - 1} shards of 2024-07 are not dumped, and Redis trims their samples in 3.0 days" in caplog.text
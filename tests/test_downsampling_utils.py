@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from weathergov.utils.downsampling_utils import lttb, minmax_decimate
+
+
+def make_line(n: int) -> (np.ndarray, np.ndarray):
+    x = 1719792000000 + np.arange(n, dtype=np.int64) * 60 * 1000
+    y = np.sin(np.arange(n) / 50)
+    # A single spike and a single dip, which must survive downsampling
+    y[1234] = 10
+    y[4321] = -10
+    return x, y
+
+
+@pytest.mark.parametrize("downsample", [lttb, minmax_decimate])
+def test_endpoints_are_kept(downsample):
+    x, y = make_line(10000)
+    x_out, y_out = downsample(x, y, 500)
+
+    assert x_out[0] == x[0] and y_out[0] == y[0]
+    assert x_out[-1] == x[-1] and y_out[-1] == y[-1]
+    assert (np.diff(x_out) > 0).all()
+    assert x_out.dtype == x.dtype
+
+
+@pytest.mark.parametrize("downsample", [lttb, minmax_decimate])
+def test_extremes_are_kept(downsample):
+    x, y = make_line(10000)
+    x_out, y_out = downsample(x, y, 500)
+
+    assert x[1234] in x_out and y_out.max() == 10
+    assert x[4321] in x_out and y_out.min() == -10
+
+
+def test_output_size():
+    x, y = make_line(10000)
+
+    assert len(lttb(x, y, 500)[0]) == 500
+    # Two points per bucket plus the first and the last
+    assert len(minmax_decimate(x, y, 500)[0]) <= 502
+    # A flat line has the same point for the min and the max of a bucket
+    assert len(minmax_decimate(x, np.zeros(10000), 500)[0]) <= 252
+
+
+@pytest.mark.parametrize("downsample", [lttb, minmax_decimate])
+def test_small_input_is_not_changed(downsample):
+    x, y = make_line(10000)
+
+    for n_out in [10000, 20000]:
+        x_out, y_out = downsample(x, y, n_out)
+        assert x_out is x and y_out is y
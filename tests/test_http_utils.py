@@ -0,0 +1,76 @@
+import socket
+
+import pytest
+import requests
+
+from weathergov.utils import http_utils
+from weathergov.utils.http_utils import WeatherGovClient
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """
+        Backoff delays the client waits for, without actually sleeping
+    """
+    delays = []
+    monkeypatch.setattr(http_utils, "sleep", delays.append)
+    return delays
+
+
+def test_failed_requests_are_retried(weather_gov, delays):
+    client = WeatherGovClient(max_retries=3, backoff_base=0.5, backoff_max=60)
+    weather_gov.fail_next(503, n=2)
+
+    response = client.get(f"{weather_gov.url}/stations/X/observations")
+
+    assert response.status_code == 200
+    assert len(weather_gov.requests) == 3
+    assert client.stats.retries == 2
+    assert client.stats.status_codes == {503: 2, 200: 1}
+
+    # Full jitter: a random delay up to the exponential cap of the attempt
+    assert 0 <= delays[0] <= 0.5 and 0 <= delays[1] <= 1.0
+
+
+def test_retry_after_is_respected(weather_gov, delays):
+    client = WeatherGovClient(max_retries=3, backoff_base=0.001, backoff_max=60)
+    weather_gov.fail_next(429, headers={"Retry-After": "7"})
+    weather_gov.fail_next(429, headers={"Retry-After": "120"})
+
+    assert client.get(f"{weather_gov.url}/stations/X/observations").status_code == 200
+
+    # The server asks for more than the backoff would wait, but never more than backoff_max
+    assert delays == [7.0, 60.0]
+
+
+def test_last_response_is_returned_when_retries_are_used(weather_gov, delays):
+    client = WeatherGovClient(max_retries=2, backoff_base=0.001)
+    weather_gov.fail_next(500, n=5)
+
+    assert client.get(f"{weather_gov.url}/stations/X/observations").status_code == 500
+    assert len(weather_gov.requests) == 3
+    assert len(delays) == 2
+
+
+def test_client_errors_are_not_retried(weather_gov, delays):
+    client = WeatherGovClient(max_retries=3)
+    weather_gov.fail_next(404)
+
+    assert client.get(f"{weather_gov.url}/stations/X/observations").status_code == 404
+    assert len(weather_gov.requests) == 1
+    assert delays == []
+
+
+def test_connection_errors_are_raised_once_retries_are_used(delays):
+    # Nothing listens on the port once the socket is closed
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    client = WeatherGovClient(max_retries=2, backoff_base=0.001)
+
+    with pytest.raises(requests.ConnectionError):
+        client.get(f"http://127.0.0.1:{port}/stations/X/observations")
+
+    assert client.stats.errors == 3
+    assert client.stats.retries == 2
@@ -0,0 +1,46 @@
+import os
+import pytest
+import numpy as np
+import pyarrow.parquet as pq
+
+from weathergov.utils.parquet_utils import DatasetPartitionWriter, DUMP_SCHEMA
+
+
+TS_FROM = 1719792000000  # 2024-07-01
+
+
+def test_partition_writer_round_trip(tmp_path):
+    with DatasetPartitionWriter(str(tmp_path), row_group_size=4, name="part-0") as writer:
+        writer.write("A", TS_FROM + np.arange(3, dtype=np.int64), np.array([1.0, 2.0, 3.0]))
+        writer.write("B", np.empty(0, dtype=np.int64), np.empty(0))
+        writer.write("C", TS_FROM + np.arange(2, dtype=np.int64), np.array([4.0, 5.0]))
+
+    assert os.listdir(tmp_path) == ["part-0.parquet"]
+    assert writer.n_rows == 5 and writer.n_stations == 2
+
+    file = pq.ParquetFile(writer.path)
+    assert file.schema_arrow == DUMP_SCHEMA
+    assert file.num_row_groups == 2
+
+    table = file.read()
+    assert table.column("station_id").to_pylist() == ["A"] * 3 + ["C"] * 2
+    assert table.column("timestamp").cast("int64").to_pylist() == [TS_FROM, TS_FROM + 1, TS_FROM + 2,
+                                                                    TS_FROM, TS_FROM + 1]
+    assert table.column("value").to_pylist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_partition_writer_leaves_no_file_on_error(tmp_path):
+    with pytest.raises(RuntimeError):
+        with DatasetPartitionWriter(str(tmp_path), row_group_size=1) as writer:
+            writer.write("A", TS_FROM + np.arange(3, dtype=np.int64), np.array([1.0, 2.0, 3.0]))
+            raise RuntimeError()
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_partition_writer_without_data(tmp_path):
+    with DatasetPartitionWriter(str(tmp_path)) as writer:
+        writer.write("A", np.empty(0, dtype=np.int64), np.empty(0))
+
+    assert writer.n_rows == 0
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,197 @@
+import logging
+import numpy as np
+
+from weathergov.constants import (Metrics, TS_CHUNK_SIZE, TS_COMPACTIONS, TS_COMPACTION_AGGREGATIONS,
+                                  TS_COMPACTION_CHUNK_SIZE)
+from weathergov.objects.observations import ObservationBatch
+from weathergov.utils.redis_utils import RedisKeys
+
+
+HOUR_MS = 3600 * 1000
+TS_FROM = 1719792000000  # 2024-07-01
+
+
+def make_batch(n: int, ts_from: int = TS_FROM) -> ObservationBatch:
+    timestamps = ts_from + np.arange(n, dtype=np.int64) * HOUR_MS
+    values = {metric: np.full(n, np.nan) for metric in Metrics}
+    values[Metrics.Temperature] = np.arange(n, dtype=np.float64)
+    values[Metrics.WindSpeed] = np.arange(n, dtype=np.float64) + 10
+    return ObservationBatch(timestamps, values)
+
+
+def get_station_info(rc, station_id: str) -> dict:
+    return rc.rc.hgetall(RedisKeys.get_station_info_hash_key(station_id))
+
+
+def test_new_station_samples_are_stored(rc):
+    complete = rc.add_timeseries_data_bulk({"S1": make_batch(3)})
+
+    assert complete == {"S1"}
+    assert rc.get_station_watermark("S1") == TS_FROM + 2 * HOUR_MS
+
+    x, y = rc.get_timeseries_data("S1", Metrics.Temperature, 0, TS_FROM + 10 * HOUR_MS, resolution="raw")
+    assert x.tolist() == [TS_FROM, TS_FROM + HOUR_MS, TS_FROM + 2 * HOUR_MS]
+    assert y.tolist() == [0, 1, 2]
+
+    info = get_station_info(rc, "S1")
+    assert float(info["temperature_val"]) == 2
+    assert float(info["wind_speed_val"]) == 12
+    assert "S1" in rc.rc.smembers(RedisKeys.STATIONS_SNAPSHOT_DIRTY)
+
+
+def test_samples_of_missing_series_are_sent_again(rc):
+    rc.add_timeseries_data_bulk({"S1": make_batch(2)})
+    rc.rc.delete(RedisKeys.get_rt_data_key("S1", Metrics.Temperature))
+
+    watermark = rc.get_station_watermark("S1")
+    complete = rc.add_timeseries_data_bulk({"S1": make_batch(4)}, watermarks={"S1": watermark})
+
+    assert complete == {"S1"}
+    assert rc.get_station_watermark("S1") == TS_FROM + 3 * HOUR_MS
+
+    x, _ = rc.get_timeseries_data("S1", Metrics.Temperature, 0, TS_FROM + 10 * HOUR_MS, resolution="raw")
+    assert x.tolist() == [TS_FROM + 2 * HOUR_MS, TS_FROM + 3 * HOUR_MS]
+
+
+def test_watermark_stops_before_rejected_samples(rc, caplog, monkeypatch):
+    rc.add_timeseries_data_bulk({"S1": make_batch(2)})
+    watermark = rc.get_station_watermark("S1")
+
+    # The series is gone and cannot be created again, so its samples are rejected
+    key = RedisKeys.get_rt_data_key("S1", Metrics.Temperature)
+    rc.rc.delete(key)
+    monkeypatch.setattr(rc, "_get_timeseries_create_command", lambda key, labels, *args: ["TS.CREATE", key, "RETENTION", "x"])
+
+    with caplog.at_level(logging.WARNING):
+        complete = rc.add_timeseries_data_bulk({"S1": make_batch(4)}, watermarks={"S1": watermark})
+
+    assert complete == set()
+    assert f"2 samples of {key} were rejected, the oldest at {TS_FROM + 2 * HOUR_MS}" in caplog.text
+
+    # The rejected samples are requested again next time
+    assert rc.get_station_watermark("S1") == watermark
+
+    # Samples that were stored are visible anyway
+    info = get_station_info(rc, "S1")
+    assert float(info["wind_speed_val"]) == 13
+    assert float(info["temperature_val"]) == 1
+
+
+def test_watermark_is_kept_when_madd_fails(rc, caplog):
+    rc.add_timeseries_data_bulk({"S1": make_batch(2)})
+    watermark = rc.get_station_watermark("S1")
+
+    key = RedisKeys.get_rt_data_key("S1", Metrics.Temperature)
+    rc.rc.delete(key)
+    rc.rc.set(key, "not a timeseries")
+
+    with caplog.at_level(logging.ERROR):
+        assert rc.add_timeseries_data_bulk({"S1": make_batch(4)}, watermarks={"S1": watermark}) == set()
+
+    assert "Failed to add 4 samples" in caplog.text
+    assert rc.get_station_watermark("S1") == watermark
+
+
+def test_nothing_new(rc):
+    rc.add_timeseries_data_bulk({"S1": make_batch(2)})
+    watermark = rc.get_station_watermark("S1")
+
+    assert rc.add_timeseries_data_bulk({"S1": make_batch(2)}, watermarks={"S1": watermark}) == {"S1"}
+    assert rc.get_station_watermark("S1") == watermark
+
+
+def test_ingest_creates_compaction_series(rc):
+    rc.add_timeseries_data_bulk({"S1": make_batch(2)})
+
+    key = RedisKeys.get_rt_data_key("S1", Metrics.Temperature)
+    compaction_keys = [
+        RedisKeys.get_compaction_key("S1", Metrics.Temperature, aggregation, bucket_ms)
+        for bucket_ms in TS_COMPACTIONS for aggregation in TS_COMPACTION_AGGREGATIONS
+    ]
+    assert sorted(rule[0] for rule in rc.rc.ts().info(key).rules) == sorted(compaction_keys)
+
+    # Compaction series get few samples, so they use smaller chunks than the raw series
+    assert rc.rc.ts().info(key).chunk_size == TS_CHUNK_SIZE
+    assert all(rc.rc.ts().info(compaction_key).chunk_size == TS_COMPACTION_CHUNK_SIZE
+               for compaction_key in compaction_keys)
+
+    # A series created again when its samples are rejected gets the rules back
+    rc.rc.delete(key)
+    rc.add_timeseries_data_bulk({"S1": make_batch(4)}, watermarks={"S1": rc.get_station_watermark("S1")})
+    assert sorted(rule[0] for rule in rc.rc.ts().info(key).rules) == sorted(compaction_keys)
+
+
+def test_schema_sets_chunk_size_of_compaction_series(rc):
+    rc.create_timeseries_schema([{"station_id": "S1"}], chunk_size=1024, compaction_chunk_size=128)
+    compaction_key = RedisKeys.get_compaction_key("S1", Metrics.Temperature, "max", 24 * 3600 * 1000)
+
+    assert rc.rc.ts().info(RedisKeys.get_rt_data_key("S1", Metrics.Temperature)).chunk_size == 1024
+    assert rc.rc.ts().info(compaction_key).chunk_size == 128
+
+    # Existing series are altered to the new chunk size
+    rc.create_timeseries_schema([{"station_id": "S1"}], chunk_size=1024, compaction_chunk_size=256)
+    assert rc.rc.ts().info(compaction_key).chunk_size == 256
+
+
+def test_snapshot_lock_is_released_only_by_its_owner(rc, monkeypatch):
+    rc.rc.hset(RedisKeys.get_station_info_hash_key("S1"), mapping={"station_id": "S1"})
+    rc.rc.sadd(RedisKeys.WEATHER_STATIONS_IDS, "S1")
+
+    assert rc.publish_stations_snapshot(full=True) == 1
+    assert rc.rc.get(RedisKeys.STATIONS_SNAPSHOT_LOCK) is None
+
+    scan = rc._scan_observation_stations_info
+
+    def scan_slowly(*args, **kwargs):
+        # The lock expires while the snapshot is built, and another loader takes it
+        rc.rc.set(RedisKeys.STATIONS_SNAPSHOT_LOCK, "another loader")
+        return scan(*args, **kwargs)
+
+    monkeypatch.setattr(rc, "_scan_observation_stations_info", scan_slowly)
+    rc.publish_stations_snapshot(full=True)
+    assert rc.rc.get(RedisKeys.STATIONS_SNAPSHOT_LOCK) == "another loader"
+
+
+def test_no_snapshot_is_published_without_stations(rc):
+    assert rc.publish_stations_snapshot() is None
+    assert rc.publish_stations_snapshot(full=True) is None
+    assert rc.rc.get(RedisKeys.STATIONS_SNAPSHOT) is None
+    assert rc.rc.get(RedisKeys.STATIONS_SNAPSHOT_LOCK) is None
+
+    # The first station gets the first version
+    rc.rc.hset(RedisKeys.get_station_info_hash_key("S1"), mapping={"station_id": "S1"})
+    rc.rc.sadd(RedisKeys.WEATHER_STATIONS_IDS, "S1")
+    assert rc.publish_stations_snapshot() == 1
+
+
+def add_stations(rc, stations: dict):
+    for station_id, (lat, lon) in stations.items():
+        rc.rc.hset(RedisKeys.get_station_info_hash_key(station_id),
+                   mapping={"station_id": station_id, "latitude": lat, "longitude": lon})
+        rc.rc.sadd(RedisKeys.WEATHER_STATIONS_IDS, station_id)
+    rc.publish_stations_snapshot(full=True)
+
+
+def test_stations_index_is_built_once_per_snapshot(rc):
+    add_stations(rc, {"NYC": (40.71, -74.01), "BOS": (42.36, -71.06)})
+
+    version, df, index = rc.get_stations_index()
+    assert version == 1 and len(index) == 2
+    assert rc.get_stations_index()[2] is index
+
+    add_stations(rc, {"PHL": (39.95, -75.17)})
+    version, df, index_new = rc.get_stations_index()
+    assert version == 2 and len(index_new) == 3
+
+
+def test_stations_search_from_snapshot(rc):
+    add_stations(rc, {"NYC": (40.71, -74.01), "BOS": (42.36, -71.06), "PHL": (39.95, -75.17), "LAX": (33.94, -118.41)})
+
+    nearest = rc.get_nearest_stations_from_snapshot(lon=-73.9, lat=40.7, n=3, radius_km=400)
+    assert [station_id for station_id, _ in nearest] == ["NYC", "PHL", "BOS"]
+    assert nearest[0][1] < 10
+
+    assert [station_id for station_id, _ in rc.get_nearest_stations_from_snapshot(-73.9, 40.7, radius_km=200)] == \
+        ["NYC", "PHL"]
+
+    assert sorted(rc.get_stations_in_bbox_from_snapshot(-76, 39, -70, 43)) == ["BOS", "NYC", "PHL"]
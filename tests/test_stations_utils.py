@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import numpy as np
+
+from _fixtures import make_observations_payload
+from weathergov.constants import Metrics
+from weathergov.utils import stations_utils
+from weathergov.utils.http_utils import ResponseValidatorCache, get_request_url
+from weathergov.utils.stations_utils import (get_station_data, get_station_data_request, fetch_station_data_concurrently,
+                                             parse_observations)
+
+
+def test_get_station_data_with_validator_cache(rc, weather_gov):
+    validator_cache = ResponseValidatorCache(store=rc)
+    url = get_request_url(*get_station_data_request("X"))
+
+    data = get_station_data("X", None, validator_cache)
+    assert len(data) == 2
+    assert data.values[Metrics.Temperature].tolist() == [21.5, 21.5]
+
+    # The validators of the first response make the next request conditional once committed
+    validator_cache.commit(url)
+    assert rc.get_response_validators(url) == {"url": url, "etag": weather_gov.etag, "last_modified": None}
+
+    assert get_station_data("X", None, validator_cache) is None
+    assert weather_gov.requests[-1][1].get("If-None-Match") == weather_gov.etag
+    assert validator_cache.hits == 1
+
+
+def test_validators_are_not_saved_until_committed(rc, weather_gov):
+    validator_cache = ResponseValidatorCache(store=rc)
+    url = get_request_url(*get_station_data_request("X"))
+
+    get_station_data("X", None, validator_cache)
+    validator_cache.discard(url)
+    assert rc.get_response_validators(url) == dict()
+
+    # Data of the first response was not saved, so it is downloaded again
+    assert len(get_station_data("X", None, validator_cache)) == 2
+    assert "If-None-Match" not in weather_gov.requests[-1][1]
+
+
+def test_validators_are_keyed_by_start(rc, weather_gov):
+    validator_cache = ResponseValidatorCache(store=rc)
+
+    get_station_data("X", None, validator_cache)
+    validator_cache.commit(get_request_url(*get_station_data_request("X")))
+
+    # Another start is another representation of the resource
+    start_ts = 1719792000000
+    assert len(get_station_data("X", start_ts, validator_cache)) == 2
+    assert "If-None-Match" not in weather_gov.requests[-1][1]
+    assert "start=2024-07-01T00%3A00%3A01Z" in weather_gov.requests[-1][0]
+
+
+def test_failed_station_does_not_stop_the_others(weather_gov, monkeypatch, caplog):
+    def get_station_data_or_fail(station_id, *args):
+        if station_id == "BAD":
+            raise ValueError("malformed payload")
+        return get_station_data(station_id, *args)
+
+    monkeypatch.setattr(stations_utils, "get_station_data", get_station_data_or_fail)
+
+    async def fetch_all():
+        return {station_id: data async for station_id, data in
+                fetch_station_data_concurrently(["A", "BAD", "B", "C"], concurrency=2)}
+
+    with caplog.at_level(logging.ERROR):
+        results = asyncio.run(fetch_all())
+
+    assert sorted(results) == ["A", "B", "C"]
+    assert "Failed to process data of station BAD: malformed payload" in caplog.text
+
+
+def test_parse_observations():
+    payload = make_observations_payload("X", n_features=3, ts_to=1719795600, missing_ratio=0.0)
+    payload["features"][0]["properties"]["temperature"]["value"] = None
+    del payload["features"][1]["properties"]["windSpeed"]
+    payload["features"][2]["properties"]["dewpoint"] = None
+
+    batch = parse_observations(payload)
+
+    # The newest observation comes first in the response, and last in the batch
+    assert batch.timestamps.tolist() == [1719788400000, 1719792000000, 1719795600000]
+    assert np.isnan(batch.values[Metrics.Temperature][2])
+    assert np.isnan(batch.values[Metrics.WindSpeed][1])
+    assert np.isnan(batch.values[Metrics.DewPoint][0])
+    assert batch.values[Metrics.Visibility][2] == payload["features"][0]["properties"]["visibility"]["value"]
+    assert set(batch.values) == set(Metrics)
+
+
+def test_parse_observations_without_features():
+    assert len(parse_observations({"features": []})) == 0
+    assert len(parse_observations({"title": "Not Found"})) == 0
@@ -0,0 +1,24 @@
+import numpy as np
+
+from weathergov.utils.time_utils import iso_to_epoch_ms
+
+
+def test_weather_gov_timestamps():
+    ts = iso_to_epoch_ms(["2024-07-01T00:00:00+00:00", "2024-07-10T12:51:00+00:00"])
+
+    assert ts.dtype == np.int64
+    assert ts.tolist() == [1719792000000, 1720615860000]
+
+
+def test_other_offsets_and_fractional_seconds():
+    ts = iso_to_epoch_ms(["2024-07-01T00:00:00.250+00:00", "2024-06-30T19:00:00-05:00", "2024-07-01T00:00:00Z"])
+
+    assert ts.dtype == np.int64
+    assert ts.tolist() == [1719792000250, 1719792000000, 1719792000000]
+
+
+def test_no_timestamps():
+    ts = iso_to_epoch_ms([])
+
+    assert ts.dtype == np.int64
+    assert len(ts) == 0
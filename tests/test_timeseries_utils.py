@@ -0,0 +1,133 @@
+import numpy as np
+
+from weathergov.constants import Metrics
+from weathergov.objects.observations import ObservationBatch
+from weathergov.utils.parquet_utils import DatasetPartitionWriter, DumpDatasetReader, get_partition_dir, get_months
+from weathergov.utils.timeseries_utils import TimeseriesStore, aggregate_buckets
+
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+TS_FROM = 1719792000000  # 2024-07-01
+
+
+def dump(dump_dir: str, month: str, station_id: str, timestamps: np.ndarray, values: np.ndarray, name: str = None):
+    with DatasetPartitionWriter(get_partition_dir(dump_dir, Metrics.Temperature, month), name=name) as writer:
+        writer.write(station_id, timestamps, values)
+
+
+def test_aggregate_buckets():
+    x = TS_FROM + np.array([0, 10, 20, 60, 130], dtype=np.int64) * 60 * 1000
+    y = np.array([1.0, 2.0, 6.0, 5.0, 7.0])
+
+    buckets, values = aggregate_buckets(x, y, HOUR_MS)
+    assert buckets.tolist() == [TS_FROM, TS_FROM + HOUR_MS, TS_FROM + 2 * HOUR_MS]
+    assert values.tolist() == [3.0, 5.0, 7.0]
+
+    assert aggregate_buckets(x, y, HOUR_MS, "min")[1].tolist() == [1.0, 5.0, 7.0]
+    assert aggregate_buckets(x, y, HOUR_MS, "max")[1].tolist() == [6.0, 5.0, 7.0]
+
+    empty = np.empty(0, dtype=np.int64)
+    assert len(aggregate_buckets(empty, np.empty(0), HOUR_MS)[0]) == 0
+
+
+def test_dump_reader_reads_months_of_the_range(tmp_path):
+    # The last hour of June and the first hours of July
+    dump(str(tmp_path), "2024-06", "A", np.array([TS_FROM - HOUR_MS]), np.array([1.0]))
+    dump(str(tmp_path), "2024-07", "A", TS_FROM + np.arange(3) * HOUR_MS, np.array([2.0, 3.0, 4.0]))
+    dump(str(tmp_path), "2024-07", "B", TS_FROM + np.arange(3) * HOUR_MS, np.array([9.0, 9.0, 9.0]))
+
+    # The same samples dumped twice
+    dump(str(tmp_path), "2024-07", "A", TS_FROM + np.arange(2) * HOUR_MS, np.array([2.0, 3.0]))
+
+    reader = DumpDatasetReader(str(tmp_path))
+    x, y = reader.read("A", Metrics.Temperature, TS_FROM - 2 * HOUR_MS, TS_FROM + 2 * HOUR_MS)
+    assert x.tolist() == [TS_FROM - HOUR_MS, TS_FROM, TS_FROM + HOUR_MS]
+    assert y.tolist() == [1.0, 2.0, 3.0]
+
+    assert len(reader.read("A", Metrics.Temperature, TS_FROM - 40 * DAY_MS, TS_FROM - 35 * DAY_MS)[0]) == 0
+
+
+def test_dump_reader_month_boundary_in_local_tz(tmp_path, local_tz):
+    # Samples of the first UTC hours of July are still of June 30 in Chicago
+    dump(str(tmp_path), "2024-06", "A", np.array([TS_FROM - 2 * HOUR_MS]), np.array([1.0]))
+    dump(str(tmp_path), "2024-07", "A", TS_FROM + np.arange(3) * HOUR_MS, np.array([2.0, 3.0, 4.0]))
+
+    assert get_months(TS_FROM + HOUR_MS, TS_FROM + 3 * HOUR_MS) == ["2024-07"]
+    assert get_months(TS_FROM - 3 * HOUR_MS, TS_FROM + HOUR_MS) == ["2024-06", "2024-07"]
+
+    reader = DumpDatasetReader(str(tmp_path))
+    x, y = reader.read("A", Metrics.Temperature, TS_FROM + HOUR_MS, TS_FROM + 3 * HOUR_MS)
+    assert x.tolist() == [TS_FROM + HOUR_MS, TS_FROM + 2 * HOUR_MS]
+    assert y.tolist() == [3.0, 4.0]
+
+    x, y = reader.read("A", Metrics.Temperature, TS_FROM - 3 * HOUR_MS, TS_FROM + HOUR_MS)
+    assert x.tolist() == [TS_FROM - 2 * HOUR_MS, TS_FROM]
+    assert y.tolist() == [1.0, 2.0]
+
+
+def add_samples(rc, station_id: str, timestamps: np.ndarray, values: np.ndarray):
+    rc.add_timeseries_data_bulk({station_id: ObservationBatch(timestamps, {Metrics.Temperature: values})})
+
+
+def test_store_reads_older_samples_from_dump(rc, tmp_path):
+    # Redis has samples from the third day, the dump has the first four days
+    redis_x = TS_FROM + 2 * DAY_MS + np.arange(24, dtype=np.int64) * HOUR_MS
+    dump_x = TS_FROM + np.arange(4 * 24, dtype=np.int64) * HOUR_MS
+    add_samples(rc, "A", redis_x, np.full(len(redis_x), 1.0))
+    dump(str(tmp_path), "2024-07", "A", dump_x, np.full(len(dump_x), 2.0))
+
+    store = TimeseriesStore(rc, dump_dir=str(tmp_path))
+    x, y = store.get_timeseries_data_multi("A", [Metrics.Temperature], TS_FROM + DAY_MS, TS_FROM + 3 * DAY_MS)[
+        Metrics.Temperature]
+
+    # Redis samples are preferred where both have data
+    assert x.tolist() == (TS_FROM + DAY_MS + np.arange(48, dtype=np.int64) * HOUR_MS).tolist()
+    assert y.tolist() == [2.0] * 24 + [1.0] * 24
+
+
+def test_store_does_not_read_dump_when_redis_has_the_range(rc, tmp_path):
+    redis_x = TS_FROM + np.arange(24, dtype=np.int64) * HOUR_MS
+    add_samples(rc, "A", redis_x, np.full(len(redis_x), 1.0))
+    dump(str(tmp_path), "2024-07", "A", redis_x, np.full(len(redis_x), 2.0))
+
+    store = TimeseriesStore(rc, dump_dir=str(tmp_path))
+    _, y = store.get_timeseries_data_multi("A", [Metrics.Temperature], TS_FROM, TS_FROM + DAY_MS)[Metrics.Temperature]
+    assert y.tolist() == [1.0] * 24
+
+
+def test_store_aggregates_dumped_samples_for_long_ranges(rc, tmp_path):
+    # Redis has the hourly compaction of the last days of a 20 day range
+    redis_x = TS_FROM + 18 * DAY_MS + np.arange(0, 2 * DAY_MS, HOUR_MS, dtype=np.int64)
+    add_samples(rc, "A", redis_x, np.full(len(redis_x), 1.0))
+
+    # Samples every 30 minutes, 2 and 4 within every hour
+    dump_x = TS_FROM + np.arange(0, 18 * DAY_MS, HOUR_MS // 2, dtype=np.int64)
+    dump(str(tmp_path), "2024-07", "A", dump_x, np.tile([2.0, 4.0], len(dump_x) // 2))
+
+    store = TimeseriesStore(rc, dump_dir=str(tmp_path))
+    x, y = store.get_timeseries_data_multi("A", [Metrics.Temperature], TS_FROM, TS_FROM + 20 * DAY_MS)[
+        Metrics.Temperature]
+
+    assert np.all(np.diff(x) == HOUR_MS)
+    assert x[0] == TS_FROM
+    assert np.all(y[:18 * 24] == 3.0)
+    assert np.all(y[18 * 24:] == 1.0)
+
+
+def test_store_merges_across_month_boundary_in_local_tz(rc, tmp_path, local_tz):
+    # Redis has samples from July 1 06:00 UTC, the dumps have June 30 and the first hours of July
+    redis_x = TS_FROM + 6 * HOUR_MS + np.arange(12, dtype=np.int64) * HOUR_MS
+    june_x = TS_FROM - DAY_MS + np.arange(24, dtype=np.int64) * HOUR_MS
+    july_x = TS_FROM + np.arange(8, dtype=np.int64) * HOUR_MS
+    add_samples(rc, "A", redis_x, np.full(len(redis_x), 1.0))
+    dump(str(tmp_path), "2024-06", "A", june_x, np.full(len(june_x), 2.0))
+    dump(str(tmp_path), "2024-07", "A", july_x, np.full(len(july_x), 3.0))
+
+    store = TimeseriesStore(rc, dump_dir=str(tmp_path))
+    x, y = store.get_timeseries_data_multi("A", [Metrics.Temperature], TS_FROM - 12 * HOUR_MS,
+                                           TS_FROM + 12 * HOUR_MS)[Metrics.Temperature]
+
+    # Redis range includes its end
+    assert x.tolist() == (TS_FROM - 12 * HOUR_MS + np.arange(25, dtype=np.int64) * HOUR_MS).tolist()
+    assert y.tolist() == [2.0] * 12 + [3.0] * 6 + [1.0] * 7
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from weathergov.app.constants import NO_DATA_COLOR, DEFAULT_MAP_VIEWPORT, CHART_WIDTH_PX, CHART_POINTS_PER_PIXEL
+from weathergov.app.viz import (get_colorscale,
+                                get_map_view,
+                                get_stations_fingerprint,
+                                get_ts_figure,
+                                get_ts_figure_polar)
+
+
+def test_stations_without_value_get_no_data_color():
+    # Colors of viridis are shorter than NO_DATA_COLOR
+    df = pd.DataFrame({"temperature_val": [np.nan, 10.0, 30.0]})
+
+    colors, colorbar = get_colorscale(df, "viridis", "temperature")
+
+    assert colors[0] == NO_DATA_COLOR
+    assert colors[1] != NO_DATA_COLOR and colors[1].startswith("rgb(")
+
+
+def make_stations(coordinates: list) -> pd.DataFrame:
+    return pd.DataFrame({
+        "station_name": [f"Station {i}" for i in range(len(coordinates))],
+        "station_id": [f"S{i}" for i in range(len(coordinates))],
+        "elevation": 100.0,
+        "station_timezone": "America/Chicago",
+        "url": "",
+        "elevation_units": "wmoUnit:m",
+        "latitude": [lat for lat, _ in coordinates],
+        "longitude": [lon for _, lon in coordinates],
+        "temperature_val": 20.0,
+    })
+
+
+def test_fingerprint_changes_with_cluster_members():
+    # All four stations are in the same grid cell at the default zoom
+    df = make_stations([(40.1, -100.9), (40.2, -100.6), (40.3, -99.5), (40.4, -99.0)])
+
+    view_all = get_map_view(df)
+    view_east = get_map_view(df, {**DEFAULT_MAP_VIEWPORT, "west": -100.0})
+
+    # Half of the cluster is out of the view: the same cluster key, but another count and position
+    assert view_all['key'].tolist() == view_east['key'].tolist()
+    assert view_all['station_name'].tolist() == ["4 stations"]
+    assert view_east['station_name'].tolist() == ["2 stations"]
+    assert get_stations_fingerprint(view_all) != get_stations_fingerprint(view_east)
+
+    assert get_stations_fingerprint(view_all) == get_stations_fingerprint(get_map_view(df))
+
+
+def test_charts_are_downsampled_to_their_width():
+    x = 1719792000000 + np.arange(20000, dtype=np.int64) * 60 * 1000
+    y = np.random.default_rng(1).uniform(0, 360, len(x))
+
+    assert len(get_ts_figure(x, y).data[0].x) <= CHART_WIDTH_PX * CHART_POINTS_PER_PIXEL + 2
+    assert len(get_ts_figure(x, y, width_px=300).data[0].x) <= 300 * CHART_POINTS_PER_PIXEL + 2
+    assert len(get_ts_figure(x, y, width_px=1500).data[0].x) > CHART_WIDTH_PX * CHART_POINTS_PER_PIXEL + 2
+
+    # The wind direction chart gets the same budget
+    assert len(get_ts_figure_polar(x, y).data[0].r) == CHART_WIDTH_PX * CHART_POINTS_PER_PIXEL
+    fig = get_ts_figure_polar(x, y, width_px=300)
+    assert len(fig.data[0].r) == len(fig.data[0].theta) == 300 * CHART_POINTS_PER_PIXEL
+    assert fig.data[0].r[0] == 0 and fig.data[0].r[-1] == x[-1] - x[0]
+
+    # Short lines are shown as they are
+    assert len(get_ts_figure_polar(x[:100], y[:100], width_px=300).data[0].r) == 100